@@ -0,0 +1,76 @@
+# Per-signal memory overhead of the Signal object model, excluding sample data.
+#
+# Run from the repository root:  python -m benchmarks.signal_memory [signal_count]
+#
+# "before" is a replica of the previous object model (instance __dict__, full path and name strings per signal),
+# "after" is FloatTimeSeries as it is now (__slots__, interned path segments). All signals share one TimeBase and one
+# value array so that only the per-object cost is measured.
+
+import sys
+import tracemalloc
+
+import numpy as np
+
+from data_flow.signals import FloatTimeSeries
+from data_flow.time_base import TimeBase
+
+
+class DictSignal:
+
+    # Attribute layout of FloatTimeSeries before __slots__
+    def __init__(self, value_array, time_base, signal_path):
+        self._value_array = value_array
+        self._value_units = None
+        self._path = signal_path
+        self._name = signal_path.split('/')[-1]
+        self._statistics = None
+        self._time_base = time_base
+        self._time_units = 's'
+        self._interp_factor = 100.0
+        self._interpolation = None
+        self._evaluation_cache_size = 4
+        self._evaluation_cache = None
+        self._pyramid = None
+
+
+def relative_paths(signal_count, group_count=50):
+    # Built at run time, like names parsed from a file header, so they aren't shared constants
+    return ['group_{}/channel_{}'.format(index % group_count, index) for index in range(signal_count)]
+
+
+def measure(factory, signal_count):
+
+    time_base = TimeBase(np.arange(16.0))
+    value_array = np.zeros(16)
+    paths = relative_paths(signal_count)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    # As in DataSet.add_signal, each signal's full path is a new string
+    signals = [factory(value_array, time_base, 'run_1/' + path) for path in paths]
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+    # Subtract the list holding the signals
+    return (allocated - sys.getsizeof(signals)) / signal_count
+
+
+def main(signal_count=100000):
+
+    before = measure(lambda values, time_base, path: DictSignal(values, time_base, path), signal_count)
+    after = measure(
+        lambda values, time_base, path: FloatTimeSeries(time_array=time_base, value_array=values, signal_path=path),
+        signal_count)
+
+    print('Signals:             {}'.format(signal_count))
+    print('Before (__dict__):   {:.0f} bytes/signal'.format(before))
+    print('After (__slots__):   {:.0f} bytes/signal'.format(after))
+    print('Saved:               {:.0%}'.format(1.0 - after / before))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,223 @@
+import os
+import tempfile
+
+import numpy as np
+
+from data_flow.memory_mapping import ScratchDirectory
+from data_flow.signals import FloatTimeSeries, IntegerTimeSeries, \
+    SignalGenerator
+from data_flow.time_base import TimeBase
+
+__all__ = ['SignalAlignment', 'AlignedSignals']
+
+
+class AlignedSignals:
+
+    # Signals resampled onto one time grid: values[:, column] belongs to
+    # paths[column]. Large results are backed by a memory-mapped scratch file
+    # rather than held in memory.
+
+    def __init__(self, paths, time_base: TimeBase, values: np.array):
+        self._paths = list(paths)
+        self._columns = {path: column
+                         for column, path in enumerate(self._paths)}
+        self._time_base = time_base
+        self._values = values
+
+    def __len__(self):
+        return len(self._time_base)
+
+    @property
+    def paths(self):
+        return self._paths
+
+    @property
+    def time_base(self) -> TimeBase:
+        return self._time_base
+
+    @property
+    def time(self):
+        return self._time_base.array
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def nbytes(self):
+        return self._values.nbytes + self._time_base.nbytes
+
+    @property
+    def is_memory_mapped(self):
+        return isinstance(self._values, np.memmap)
+
+    def column(self, path):
+        return self._values[:, self._columns[path]]
+
+
+class SignalAlignment:
+
+    # Resamples many signals onto one shared time grid, a chunk of grid points
+    # at a time. Each chunk only reads the samples of each signal that fall
+    # inside it, so memory-mapped signals stay mapped.
+
+    LINEAR = 'linear'
+    PCHIP = 'pchip'
+
+    # Grid points evaluated per chunk
+    chunk_size = 2 ** 16
+
+    # Results larger than this many bytes go to a memory-mapped scratch file
+    memory_cap = 2 ** 28
+
+    def __init__(self, signals, method=LINEAR, chunk_size=None,
+                 memory_cap=None, scratch_directory=None, dtype=np.float64):
+
+        if method not in (SignalAlignment.LINEAR, SignalAlignment.PCHIP):
+            raise ValueError('Unknown interpolation method: ' + str(method))
+
+        self._signals = list(signals)
+        self._method = method
+        self._chunk_size = chunk_size or self.chunk_size
+        self._memory_cap = memory_cap or self.memory_cap
+        self._scratch_directory = scratch_directory or \
+            os.path.join(tempfile.gettempdir(), 'signal-alignment')
+        self._dtype = np.dtype(dtype)
+
+    @property
+    def signals(self):
+        return self._signals
+
+    @property
+    def paths(self):
+        return [signal.path for signal in self._signals]
+
+    def default_grid(self, t_start: float = None, t_end: float = None,
+                     sample_period: float = None):
+
+        # Spans all signals, at the rate of the fastest one unless told so
+        recorded = [signal for signal in self._signals if signal.length]
+        if not recorded:
+            raise ValueError('No samples to align')
+
+        t_start = np.float64(t_start) if t_start is not None else \
+            min(np.float64(signal.t_start) for signal in recorded)
+        t_end = np.float64(t_end) if t_end is not None else \
+            max(np.float64(signal.t_end) for signal in recorded)
+
+        if sample_period is None:
+            periods = [
+                (np.float64(signal.t_end) - np.float64(signal.t_start)) /
+                (signal.length - 1) for signal in recorded
+                if signal.length > 1 and signal.t_end > signal.t_start]
+            sample_period = min(periods) if periods else 1.0
+
+        if sample_period <= 0:
+            raise ValueError('Sample period must be positive')
+
+        length = 0
+        if t_end >= t_start:
+            steps = np.floor((t_end - t_start) / sample_period + 1e-9)
+            length = int(steps) + 1
+
+        return t_start, np.float64(sample_period), length
+
+    def evaluate(self, signal, time: np.array):
+
+        # Values of one signal at the given (sorted) times, NaN outside of its
+        # recording. Categorical signals hold their last sample; non-numeric
+        # ones are given as category codes.
+        values = np.full(len(time), np.nan, dtype=self._dtype)
+        if not signal.length or not len(time):
+            return values
+
+        inside = (time >= signal.t_start) & (time <= signal.t_end)
+        if not np.any(inside):
+            return values
+
+        time = time[inside]
+
+        if isinstance(signal, IntegerTimeSeries):
+            codes = signal.get_codes_at_times(time)
+            values[inside] = signal.categories[codes] \
+                if SignalGenerator.is_numeric(signal.categories) else codes
+
+            return values
+
+        margin = FloatTimeSeries.window_margin \
+            if self._method == SignalAlignment.PCHIP else 1
+        start_index, end_index = signal.window_indices(time[0], time[-1])
+        start_index = max(start_index - margin, 0)
+        end_index = min(end_index + margin, signal.length)
+
+        time_window = signal.time_base.window(start_index, end_index)
+        value_window = signal.stored_values(start_index, end_index)
+
+        if len(time_window) < 2:
+            values[inside] = value_window[0]
+
+        elif self._method == SignalAlignment.PCHIP:
+            values[inside] = FloatTimeSeries.interpolate_samples(
+                time_window, value_window)(time)
+
+        else:
+            values[inside] = np.interp(time, time_window, value_window)
+
+        return values
+
+    def rows_per_chunk(self):
+        # Keeps the working set of one chunk (grid, one column per signal and
+        # interpolation temporaries) in the cap
+        row_nbytes = 8 + 4 * self._dtype.itemsize * max(len(self._signals), 1)
+        rows = min(self._chunk_size, self._memory_cap // row_nbytes)
+        return int(max(1, rows))
+
+    def iterate_chunks(self, time_base: TimeBase):
+
+        # Yields (first row, time, values) per chunk of the grid, the columns
+        # of values following the order of the signals. For exporters that
+        # stream the aligned rows instead of keeping them.
+        rows = self.rows_per_chunk()
+        for start in range(0, len(time_base), rows):
+            time = np.asarray(time_base.window(start, start + rows),
+                              dtype=np.float64)
+
+            values = np.empty((len(time), len(self._signals)),
+                              dtype=self._dtype)
+            for column, signal in enumerate(self._signals):
+                values[:, column] = self.evaluate(signal, time)
+
+            yield start, time, values
+
+    def align(self, t_start: float = None, t_end: float = None,
+              sample_period: float = None,
+              time_array: np.array = None) -> AlignedSignals:
+
+        # Either onto the given sorted time_array or onto an evenly spaced grid
+        # (see default_grid)
+        if time_array is not None:
+            time_base = TimeBase(time_array)
+
+        else:
+            grid_start, sample_period, length = self.default_grid(
+                t_start, t_end, sample_period)
+            time_base = TimeBase.uniform(grid_start, sample_period, length)
+
+        shape = (len(time_base), len(self._signals))
+        file_path = None
+
+        if shape[0] * shape[1] * self._dtype.itemsize > self._memory_cap:
+            scratch_directory = ScratchDirectory(self._scratch_directory)
+            file_path, values = scratch_directory.create(
+                'aligned', shape, self._dtype)
+
+        else:
+            values = np.empty(shape, dtype=self._dtype)
+
+        for start, _, chunk in self.iterate_chunks(time_base):
+            values[start:start + len(chunk)] = chunk
+
+        if file_path is not None:
+            values = ScratchDirectory.map_read_only(file_path, values)
+
+        return AlignedSignals(self.paths, time_base, values)
@@ -0,0 +1,51 @@
+import hashlib
+
+import numpy as np
+
+from data_flow.chunked_array import ChunkedArray
+
+__all__ = ['ArrayChecksum']
+
+
+class ArrayChecksum:
+
+    # Content digests of sample arrays, to tell which columns of a reloaded file changed. Arrays are hashed with
+    # BLAKE2b straight from their buffers, a block at a time (a chunk at a time for chunked arrays), together with
+    # their type and length, so arrays with the same bytes but a different type don't match.
+
+    digest_size = 16
+
+    # Samples hashed per block, so memory-mapped arrays are not read into memory all at once
+    block_size = 2 ** 20
+
+    @staticmethod
+    def iterate_blocks(array):
+        for start in range(0, len(array), ArrayChecksum.block_size):
+            yield array[start:start + ArrayChecksum.block_size]
+
+    @staticmethod
+    def update(hasher, array):
+
+        if array is None:
+            hasher.update(b'None;')
+            return
+
+        if not isinstance(array, ChunkedArray):
+            array = np.asarray(array).reshape(-1)
+
+        hasher.update((str(array.dtype) + ':' + str(len(array)) + ';').encode('utf8'))
+
+        for block in array.iterate_chunks() if isinstance(array, ChunkedArray) else ArrayChecksum.iterate_blocks(array):
+            if block.dtype.kind == 'O':
+                hasher.update(repr(block.tolist()).encode('utf8'))
+
+            else:
+                hasher.update(np.ascontiguousarray(block).view(np.uint8))
+
+    @staticmethod
+    def digest(*arrays):
+        hasher = hashlib.blake2b(digest_size=ArrayChecksum.digest_size)
+        for array in arrays:
+            ArrayChecksum.update(hasher, array)
+
+        return hasher.digest()
@@ -0,0 +1,274 @@
+import threading
+import zlib
+
+import numpy as np
+
+from data_flow.memory_mapping import ScratchDirectory
+from utilities.lru_cache import LRUCache
+
+__all__ = ['ChunkedArray']
+
+
+class ChunkedArray:
+
+    # One-dimensional numeric array kept as a list of fixed-size chunks, so that samples never have to be in memory
+    # all at once. Chunks are held as arrays, zlib-compressed bytes, or memory-mapped scratch files. Slicing returns
+    # an ndarray built from the chunks the slice touches only; iterate_chunks walks the whole array a chunk at a time.
+
+    MEMORY = 'memory'
+    COMPRESSED = 'compressed'
+    DISK = 'disk'
+
+    # Samples per chunk
+    chunk_size = 2 ** 20
+
+    # Decompressed chunks kept for repeated reads
+    cache_size = 4
+
+    def __init__(self, dtype=None, chunk_size=None, storage=MEMORY, directory=None, compression_level=1):
+
+        if storage == ChunkedArray.DISK and not directory:
+            raise ValueError('Chunks stored on disk need a directory')
+
+        self._dtype = np.dtype(dtype) if dtype is not None else None
+        self._chunk_size = chunk_size or self.chunk_size
+        self._storage = storage
+        self._scratch = ScratchDirectory(directory) if directory else None
+        self._compression_level = compression_level
+
+        self._chunks = []  # Full chunks, as stored
+        self._tail = None  # Last, partly filled chunk, always in memory
+        self._length = 0
+        self._min_value = None
+        self._max_value = None
+
+        self._cache = LRUCache(self.cache_size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def shape(self):
+        return self._length,
+
+    @property
+    def ndim(self):
+        return 1
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def storage(self):
+        return self._storage
+
+    @property
+    def nbytes(self):
+        # Size of the samples, not of their storage
+        return self._length * self._dtype.itemsize if self._dtype is not None else 0
+
+    @property
+    def stored_nbytes(self):
+        # Process memory taken by the chunks (memory-mapped chunks take none)
+        stored = len(self._tail) * self._dtype.itemsize if self._tail is not None else 0
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                stored += len(chunk)
+
+            elif not isinstance(chunk, np.memmap):
+                stored += chunk.nbytes
+
+        return stored
+
+    @property
+    def chunk_length(self):
+        return self._chunk_size
+
+    @property
+    def chunk_count(self):
+        return len(self._chunks) + (1 if self._tail is not None and len(self._tail) else 0)
+
+    @property
+    def min_value(self):
+        return self._min_value
+
+    @property
+    def max_value(self):
+        return self._max_value
+
+    @staticmethod
+    def from_array(array, chunk_size=None, storage=MEMORY, directory=None):
+        chunked = ChunkedArray(np.asarray(array[:0]).dtype, chunk_size, storage, directory)
+        chunk_size = chunked.chunk_length
+        for start in range(0, len(array), chunk_size):
+            chunked.append(array[start:start + chunk_size])
+
+        return chunked
+
+    def append(self, values):
+
+        values = np.asarray(values)
+        if values.dtype.kind not in 'buif':
+            raise TypeError('Only numeric samples can be chunked, not ' + str(values.dtype))
+
+        if not len(values):
+            return
+
+        # Columns parsed in pieces can widen their type (integers followed by a NaN, say); earlier chunks follow
+        if self._dtype is None:
+            self._dtype = values.dtype
+
+        elif np.result_type(self._dtype, values.dtype) != self._dtype:
+            self.convert(np.result_type(self._dtype, values.dtype))
+
+        values = values.astype(self._dtype, copy=False)
+        self.update_range(values)
+        self._length += len(values)
+
+        if self._tail is not None and len(self._tail):
+            values = np.concatenate((self._tail, values))
+
+        full = len(values) // self._chunk_size * self._chunk_size
+        for start in range(0, full, self._chunk_size):
+            self._chunks.append(self.store(values[start:start + self._chunk_size]))
+
+        self._tail = values[full:].copy()
+        self._tail.flags.writeable = False
+
+    def update_range(self, values):
+
+        if values.dtype.kind == 'f':
+            if np.all(np.isnan(values)):
+                return
+
+            low, high = np.nanmin(values), np.nanmax(values)
+
+        else:
+            low, high = np.min(values), np.max(values)
+
+        self._min_value = low if self._min_value is None else min(self._min_value, low)
+        self._max_value = high if self._max_value is None else max(self._max_value, high)
+
+    def store(self, chunk):
+
+        if self._storage == ChunkedArray.COMPRESSED:
+            return zlib.compress(np.ascontiguousarray(chunk).tobytes(), self._compression_level)
+
+        elif self._storage == ChunkedArray.DISK:
+            return self._scratch.spill(chunk, 'chunk')
+
+        chunk = np.array(chunk)
+        chunk.flags.writeable = False
+
+        return chunk
+
+    def read_chunk(self, index: int):
+
+        if index == len(self._chunks):
+            return self._tail
+
+        chunk = self._chunks[index]
+        if not isinstance(chunk, bytes):
+            return chunk
+
+        with self._lock:
+            values = self._cache.get(index)
+
+        if values is None:
+            values = np.frombuffer(zlib.decompress(chunk), dtype=self._dtype)
+
+            with self._lock:
+                self._cache.put(index, values)
+
+        return values
+
+    def iterate_chunks(self):
+        for index in range(self.chunk_count):
+            yield self.read_chunk(index)
+
+    def convert(self, dtype):
+
+        # Re-stores every chunk as dtype
+        dtype = np.dtype(dtype)
+        chunks = [self.read_chunk(index).astype(dtype) for index in range(len(self._chunks))]
+
+        self._dtype = dtype
+        self._chunks = [self.store(chunk) for chunk in chunks]
+        self._tail = self._tail.astype(dtype) if self._tail is not None else None
+
+        with self._lock:
+            self._cache.clear()
+
+    def empty_like(self, dtype):
+        # Empty array of dtype with this one's chunk size and storage
+        return ChunkedArray(dtype, self._chunk_size, self._storage, self._scratch and self._scratch.directory)
+
+    def astype(self, dtype):
+        converted = self.empty_like(dtype)
+        for chunk in self.iterate_chunks():
+            # Cast first: append would otherwise widen the converted array back to this one's type
+            converted.append(chunk.astype(dtype, copy=False))
+
+        return converted
+
+    def read(self, start: int, stop: int):
+
+        # Samples [start, stop) as one array, from the chunks that hold them
+        start = max(start, 0)
+        stop = min(stop, self._length)
+        if stop <= start:
+            return np.empty(0, dtype=self._dtype)
+
+        first, last = start // self._chunk_size, (stop - 1) // self._chunk_size
+        pieces = []
+        for index in range(first, last + 1):
+            offset = index * self._chunk_size
+            pieces.append(self.read_chunk(index)[max(start - offset, 0):stop - offset])
+
+        # Within one chunk this is a read-only view of it
+        return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+
+    def __getitem__(self, key):
+
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step == 1:
+                return self.read(start, stop)
+
+            if step > 0:
+                return self.read(start, stop)[::step]
+
+            indices = np.arange(start, stop, step)
+
+        elif np.ndim(key) == 0:
+            index = int(key)
+            if index < 0:
+                index += self._length
+
+            if not 0 <= index < self._length:
+                raise IndexError('Index ' + str(key) + ' is out of bounds for length ' + str(self._length))
+
+            return self.read_chunk(index // self._chunk_size)[index % self._chunk_size]
+
+        else:
+            indices = np.asarray(key)
+            if indices.dtype.kind == 'b':
+                indices = np.flatnonzero(indices)
+
+            indices = np.where(indices < 0, indices + self._length, indices)
+
+        # Gathered chunk by chunk
+        result = np.empty(indices.shape, dtype=self._dtype)
+        chunk_indices = indices // self._chunk_size
+        for index in np.unique(chunk_indices):
+            selected = chunk_indices == index
+            result[selected] = self.read_chunk(int(index))[indices[selected] - index * self._chunk_size]
+
+        return result
+
+    def __array__(self, dtype=None, copy=None):
+        # Loads every chunk; only for callers that really need the whole array
+        array = self.read(0, self._length)
+        return array.astype(dtype, copy=False) if dtype is not None else array
@@ -0,0 +1,205 @@
+import numpy as np
+from scipy import interpolate
+
+from data_flow.signals import (
+    AbstractInterpolatedSignal, FloatTimeSeries, IntegerTimeSeries)
+
+__all__ = ['SignalCursor']
+
+
+class CursorGroup:
+
+    # Signals sharing one TimeBase, and the sample index the cursor last
+    # stopped at on it. Float and categorical signals are kept apart so that
+    # each kind is read for the whole group at once.
+
+    __slots__ = ('time_base', 'float_signals', 'integer_signals', 'time',
+                 'index', '_categories', '_offsets', '_revisions')
+
+    def __init__(self, time_base):
+        self.time_base = time_base
+        self.float_signals = []
+        self.integer_signals = []
+        self.time = None
+        self.index = 0
+
+        self._categories = None
+        self._offsets = None
+        self._revisions = None
+
+    def add(self, signal):
+        if isinstance(signal, IntegerTimeSeries):
+            self.integer_signals.append(signal)
+
+        else:
+            self.float_signals.append(signal)
+
+    def category_table(self):
+
+        # Category tables of all categorical signals end to end (as objects, so
+        # numbers and strings don't mix), and where each one starts. Built
+        # again only when one of the signals changed.
+        revisions = [signal.revision for signal in self.integer_signals]
+        if revisions != self._revisions:
+            tables = [signal.categories.astype(object)
+                      for signal in self.integer_signals]
+            self._categories = np.concatenate(tables)
+            self._offsets = np.cumsum(
+                [0] + [len(table) for table in tables[:-1]])
+            self._revisions = revisions
+
+        return self._categories, self._offsets
+
+    def float_values(self, index: int, time_s: float, between: bool):
+
+        # One local PCHIP over the neighbouring samples of every float signal,
+        # evaluated once for the whole group. PCHIP slopes depend on the
+        # neighbouring samples only, so within this margin it matches each
+        # signal's own interpolant (see FloatTimeSeries.window_margin).
+        if not between:
+            return [signal.stored_values(index, index + 1)[0]
+                    for signal in self.float_signals]
+
+        margin = FloatTimeSeries.window_margin
+        start = max(index - margin, 0)
+        end = min(index + margin + 2, self.time_base.length)
+
+        samples = np.vstack([
+            np.asarray(signal.stored_values(start, end), dtype=np.float64)
+            for signal in self.float_signals])
+        interpolant = interpolate.PchipInterpolator(
+            self.time_base.window(start, end), samples, axis=1)
+
+        return interpolant(time_s)
+
+    def integer_values(self, index: int):
+
+        # Zero-order hold: the codes of the sample at index, decoded through
+        # the shared table in one look-up
+        categories, offsets = self.category_table()
+        codes = np.array([signal.stored_values(index, index + 1)[0]
+                          for signal in self.integer_signals], dtype=np.intp)
+
+        return categories[codes + offsets]
+
+
+class SignalCursor:
+
+    # Values of many signals at one playback time. The time-to-index search is
+    # done once per shared time base rather than once per signal, and while
+    # playback moves forward the index is advanced from where it last stopped
+    # instead of being searched for again.
+
+    # Forward steps taken sample by sample before falling back to a binary
+    # search
+    step_limit = 64
+
+    def __init__(self, signals=()):
+        self._signals = {}  # {path (str): signal (AbstractInterpolatedSignal)}
+        self._groups = []
+
+        self._time = None
+        self._values = {}
+
+        self.set_signals(signals)
+
+    @property
+    def signals(self):
+        return self._signals
+
+    @property
+    def group_count(self):
+        return len(self._groups)
+
+    def set_signals(self, signals):
+
+        signals = {signal.path: signal for signal in signals
+                   if isinstance(signal, AbstractInterpolatedSignal)}
+
+        # Keep the groups (and so their playback positions) while the set of
+        # signals is the same
+        if signals.keys() == self._signals.keys() and all(
+                signal is self._signals[path]
+                for path, signal in signals.items()):
+            return
+
+        groups = {}
+        for signal in signals.values():
+            key = id(signal.time_base)
+            if key not in groups:
+                groups[key] = CursorGroup(signal.time_base)
+
+            groups[key].add(signal)
+
+        self._signals = signals
+        self._groups = list(groups.values())
+
+        self._time = None
+        self._values = {}
+
+    def index_at(self, group: CursorGroup, time_s: float):
+
+        # Last sample recorded at or before time_s, clipped to the recording
+        time_base = group.time_base
+        last_index = time_base.length - 1
+
+        if group.time is not None and time_s >= group.time and \
+                time_base.is_monotonic and not time_base.is_compact:
+            index = group.index
+            for _ in range(self.step_limit):
+                if index >= last_index or \
+                        time_base.times_at(index + 1) > time_s:
+                    break
+
+                index += 1
+
+            else:
+                index = time_base.index_after_time(time_s, side='right') - 1
+
+        else:
+            index = time_base.index_after_time(time_s, side='right') - 1
+
+        index = int(min(max(index, 0), last_index))
+
+        group.time = time_s
+        group.index = index
+
+        return index
+
+    def values_at(self, time_s: float):
+
+        # {path: value} at time_s. Between two samples, float signals are
+        # evaluated with PCHIP like their own interpolant (see
+        # FloatTimeSeries.interpolate), so the cursor reads what the plot
+        # shows; categorical signals hold the last sample (zero-order hold).
+        # Outside a signal's recording its first or last sample is held.
+        # Repeated calls for the same time are answered from the last result.
+        if time_s == self._time:
+            return self._values
+
+        values = {}
+        for group in self._groups:
+            if not group.time_base.length:
+                continue
+
+            index = self.index_at(group, time_s)
+
+            # On a sample, or before the first one, the stored sample is read
+            # as it is
+            between = index + 1 < group.time_base.length and \
+                group.time_base.times_at(index) < time_s
+
+            if group.float_signals:
+                values.update(zip(
+                    [signal.path for signal in group.float_signals],
+                    group.float_values(index, time_s, between)))
+
+            if group.integer_signals:
+                values.update(zip(
+                    [signal.path for signal in group.integer_signals],
+                    group.integer_values(index)))
+
+        self._time = time_s
+        self._values = values
+
+        return values
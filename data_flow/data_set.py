@@ -1,7 +1,17 @@
+import functools
+import os
 import re
-import hashlib
+import sys
 
-from data_flow.signals import SignalGenerator, Signal
+import numpy as np
+
+from data_flow.file_fingerprint import FileFingerprint
+from data_flow.filters import FilteredSignal, RollingFilter
+from data_flow.dtype_policy import DtypePolicy
+from data_flow.pyramid import SignalPyramid
+from data_flow.signals import SignalGenerator, AbstractInterpolatedSignal, \
+    IntegerTimeSeries, NonNumericTimeSeries, PathPrefix, UnloadedSignal
+from data_flow.time_base import TimeBase
 
 
 class DataSet:
@@ -9,13 +19,32 @@ class DataSet:
     def __init__(self, import_method_type, path_data, path_format=None, name=''):
 
         self._name = name
+        # Shared by the signals, so that renaming the data set renames them
+        self._prefix = PathPrefix(name)
         # TODO file_type can probably moved to an entirely static class ("struct")
         self._import_method = import_method_type()
         self._path_data = path_data
         self._path_format = path_format
         self._time_key = None
-        self._md5 = self.md5_for_file(path_data)
+        self._load_options = {}  # Keyword arguments of the loader
+        # Hashed in the background while the loader parses the file
+        self._fingerprint = FileFingerprint(path_data)
+        # Length of the file the signals hold, if appended rows can be read on
+        # their own
+        self._parsed_bytes = None
+        # ParseCache the loader used, passed again on refresh but never saved
+        self._parse_cache = None
         self._signal_dict = {}  # Dict of signals navigable by [group _name][_signal _name]
+        # Same signals, flat: {'group/signal' (str): signal (Signal)}
+        self._signal_index = {}
+        self._time_bases = []  # Time axes shared by the signals
+        # {relative path: (column name, load_values, time base index)}, see
+        # add_column
+        self._unloaded = {}
+        # [{'path': str, 'operation': str, 'window': int}] reapplied on refresh
+        self._filters = []
+        # Set by build_pyramids, for columns loaded later
+        self._pyramid_block_size = None
 
     @property
     def name(self):
@@ -24,24 +53,205 @@ class DataSet:
     @name.setter
     def name(self, value):
         self._name = value
-        self.change_data_set_name(self._signal_dict, value)
+        self._prefix.name = sys.intern(value)
 
-    @staticmethod
-    def change_data_set_name(signal_dict, name):
-        for _, signal in signal_dict.items():
+    @property
+    def signal_dict(self):
+        return self._signal_dict
 
-            if isinstance(signal, dict):
-                DataSet.change_data_set_name(signal, name)
+    @property
+    def signal_index(self):
+        return self._signal_index
 
-            else:
-                assert isinstance(signal, Signal)
-                signal.change_data_set_name(name)
+    @property
+    def time_bases(self):
+        return self._time_bases
 
     @property
-    def signal_dict(self):
-        return self._signal_dict
+    def path_data(self):
+        return self._path_data
+
+    @property
+    def time_key(self):
+        return self._time_key
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
+
+    @property
+    def parsed_bytes(self):
+        return self._parsed_bytes
+
+    @parsed_bytes.setter
+    def parsed_bytes(self, value):
+        self._parsed_bytes = value
+
+    @property
+    def parse_cache(self):
+        return self._parse_cache
+
+    @parse_cache.setter
+    def parse_cache(self, value):
+        self._parse_cache = value
+
+    def get_time_base(self, time_array):
+
+        # Signals recorded against the same time column share one TimeBase
+        if time_array is None:
+            return None
+
+        for time_base in self._time_bases:
+            if time_base is time_array or time_base.is_built_from(time_array):
+                return time_base
+
+        # Loaded axes that are evenly spaced are generated rather than held;
+        # memory-mapped ones cost no memory and are left as they are
+        if isinstance(time_array, TimeBase):
+            time_base = time_array
+
+        else:
+            time_base = TimeBase(
+                time_array, compact=not isinstance(time_array, np.memmap))
+
+        self._time_bases.append(time_base)
+
+        return time_base
+
+    @property
+    def load_options(self):
+        return self._load_options
+
+    @load_options.setter
+    def load_options(self, value):
+        self._load_options = value or {}
+
+    @property
+    def signals(self):
+        return list(self._signal_index.values())
+
+    @property
+    def pyramid_path(self):
+        return self._path_data + '.pyramid.npz'
+
+    @property
+    def pyramid_nbytes(self):
+        return sum(signal.pyramid_nbytes for signal in self.signals
+                   if isinstance(signal, AbstractInterpolatedSignal))
+
+    def build_pyramids(self, block_size=16, persist=True):
+
+        # Meant to run in a Worker once the data set is loaded. Pyramids saved
+        # next to the data file by an earlier session are reused as long as the
+        # file hasn't changed since.
+        self._pyramid_block_size = block_size
+        if self.load_pyramids():
+            return self
 
-    def add_signal(self, name, value_array, units=None, time_array=None, time_units=None, relative_path=None):
+        # Signals taken over from the data set a refresh replaced have theirs
+        # already, and so do signals that rows were appended to since an
+        # earlier build
+        for signal in self.signals:
+            if isinstance(signal, AbstractInterpolatedSignal) and \
+                    signal.pyramid is None:
+                signal.build_pyramid(block_size)
+
+        print(self._name + ' pyramids built: ' +
+              str(self.pyramid_nbytes // 1024) + ' kB')
+
+        if persist:
+            self.save_pyramids()
+
+        return self
+
+    def save_pyramids(self):
+
+        # 'signals' lists the signals the file covers, including those too
+        # short for a pyramid, so that load_pyramids can tell what is missing
+        signals = [signal for signal in self.signals
+                   if isinstance(signal, AbstractInterpolatedSignal)]
+        arrays = {
+            'digest': np.frombuffer(self._fingerprint.digest, dtype=np.uint8),
+            'signals': np.array([DataSet.relative_signal_path(signal.path)
+                                 for signal in signals], dtype=str),
+        }
+
+        for signal in signals:
+            if signal.pyramid is not None:
+                arrays.update(signal.pyramid.to_arrays(
+                    DataSet.relative_signal_path(signal.path) + '|'))
+
+        try:
+            with open(self.pyramid_path, 'wb') as fd:
+                np.savez(fd, **arrays)
+
+        except OSError as e:
+            print(e)
+
+    def load_pyramids(self):
+
+        if not os.path.exists(self.pyramid_path):
+            return False
+
+        try:
+            with np.load(self.pyramid_path) as arrays:
+                if arrays['digest'].tobytes() != self._fingerprint.digest:
+                    return False
+
+                arrays = {key: arrays[key] for key in arrays.files}
+
+        except (OSError, ValueError, KeyError) as e:
+            print(e)
+            return False
+
+        # Loaded only if every loaded signal is covered; columns loaded since
+        # the file was saved are built by build_pyramids
+        covered = set(arrays.get('signals', ()))
+        complete = True
+
+        for signal in self.signals:
+            if not isinstance(signal, AbstractInterpolatedSignal):
+                continue
+
+            relative_path = DataSet.relative_signal_path(signal.path)
+            complete = complete and relative_path in covered
+            if relative_path + '|shape' in arrays:
+                signal.pyramid = SignalPyramid.from_arrays(
+                    arrays, relative_path + '|')
+
+        print(self._name + ' pyramids loaded: ' +
+              str(self.pyramid_nbytes // 1024) + ' kB')
+
+        return complete
+
+    def saved_pyramid(self, relative_path):
+
+        # Pyramid of one signal from the file save_pyramids wrote, if that
+        # matches the data file and has one for it; only its arrays are read
+        if not os.path.exists(self.pyramid_path):
+            return None
+
+        try:
+            with np.load(self.pyramid_path) as arrays:
+                digest = arrays['digest'].tobytes()
+                if digest != self._fingerprint.digest or \
+                        relative_path + '|shape' not in arrays.files:
+                    return None
+
+                return SignalPyramid.from_arrays(arrays, relative_path + '|')
+
+        except (OSError, ValueError, KeyError) as e:
+            print(e)
+            return None
+
+    @staticmethod
+    def relative_signal_path(signal_path):
+        # Signal path without the data set name, which changes when data sets
+        # are renamed
+        return signal_path.split('/', 1)[-1]
+
+    def add_signal(self, name, value_array, units=None, time_array=None,
+                   time_units=None, relative_path=None, dtype_policy=None):
 
         relative_path = '/'.join([relative_path, name]) if relative_path else name
 
@@ -51,26 +261,197 @@ class DataSet:
             name, units = DataSet.split_units_from_string(name)
 
         signal = SignalGenerator.generate_signal(
-            time_array=time_array,
+            time_array=self.get_time_base(time_array),
             time_units=time_units,
             value_array=value_array,
             value_units=units,
             signal_path=signal_path,
+            dtype_policy=dtype_policy,
         )
 
-        # Construct a dictionary tree of the form {token0: {token1: {token2: signal} } }
         # Remove the name from the end of the token list
+        self.insert_signal(relative_path.split('/')[:-1], name, signal)
+
+    def add_column(self, name, load_values, units=None, time_array=None,
+                   relative_path=None):
+
+        # Registers a column by name, like add_signal, without its samples (see
+        # UnloadedSignal). They are read when the signal is first used, by
+        # load_values([column name, ...]) -> {column name: values}; columns
+        # that share one load_values are read together where they are loaded
+        # together (see load_columns).
+        column_name = name
+        relative_path = '/'.join([relative_path, name]) \
+            if relative_path else name
+
+        signal_path = self._name + '/' + relative_path
+
+        if units is None or units == '':
+            name, units = DataSet.split_units_from_string(name)
+
+        # The time base is looked up by position when the column is loaded, as
+        # a refresh can replace it with an equal one (see take_over_unchanged)
+        time_base = self.get_time_base(time_array)
+        time_base_index = self._time_bases.index(time_base) \
+            if time_base is not None else None
+
+        tokens = relative_path.split('/')[:-1]
+        key = '/'.join(tokens + [name])
+        self._unloaded[key] = (column_name, load_values, time_base_index)
+
+        load = functools.partial(self.load_column, key)
+        self.insert_signal(tokens, name,
+                           UnloadedSignal(load, units, signal_path))
+
+    def load_column(self, relative_path):
+        # Signal at relative_path, loading it if it isn't yet
+        self.load_columns([relative_path])
+        return self._signal_index.get(relative_path)
+
+    def load_columns(self, relative_paths=None):
+
+        # Replaces the unloaded signals at relative_paths (all of them by
+        # default) with signals holding the samples, reading the columns of
+        # each loader in one pass. Loader errors (a file that changed since it
+        # was loaded, say) are raised before any signal is replaced.
+        if relative_paths is None:
+            relative_paths = list(self._unloaded)
+
+        groups = {}  # {load_values: [relative path]}
+        for relative_path in relative_paths:
+            if relative_path in self._unloaded:
+                load_values = self._unloaded[relative_path][1]
+                groups.setdefault(load_values, []).append(relative_path)
+
+        loaded = {
+            load_values: load_values(
+                [self._unloaded[path][0] for path in paths])
+            for load_values, paths in groups.items()}
+
+        for load_values, paths in groups.items():
+            for relative_path in paths:
+                self.insert_loaded(relative_path, loaded[load_values])
+
+    def insert_loaded(self, relative_path, columns):
+
+        column_name, _, time_base_index = self._unloaded.pop(relative_path)
+        placeholder = self._signal_index[relative_path]
+
+        signal = SignalGenerator.generate_signal(
+            time_array=self._time_bases[time_base_index]
+            if time_base_index is not None else None,
+            time_units=None,
+            value_array=columns[column_name],
+            value_units=placeholder.units,
+            signal_path=placeholder.path,
+        )
+
         tokens = relative_path.split('/')
-        tokens = tokens[:-1]
+        self.insert_signal(tokens[:-1], tokens[-1], signal)
 
+        if self._pyramid_block_size is not None:
+            self.add_pyramid(relative_path, signal)
+
+    def add_pyramid(self, relative_path, signal):
+
+        # Columns loaded after build_pyramids ran take theirs from the saved
+        # file, or have it built now
+        if not isinstance(signal, AbstractInterpolatedSignal):
+            return
+
+        pyramid = self.saved_pyramid(relative_path)
+        if pyramid is not None and pyramid.length == signal.length:
+            signal.pyramid = pyramid
+
+        else:
+            signal.build_pyramid(self._pyramid_block_size)
+
+    def insert_signal(self, tokens, name, signal):
+
+        # Construct a dictionary tree of the form
+        # {token0: {token1: {token2: signal} } }
         signal_dict = self._signal_dict
         for token in tokens:
+            token = sys.intern(token)
             if token not in signal_dict:
                 signal_dict[token] = {}
 
             signal_dict = signal_dict[token]
 
-        signal_dict[name] = signal
+        signal_dict[sys.intern(name)] = signal
+        self._signal_index['/'.join(list(tokens) + [name])] = signal
+        signal.set_prefix(self._prefix)
+
+    def get_signal(self, relative_path):
+        # Signal at a path of signal_dict keys below the data set, or None.
+        # Unloaded columns are loaded.
+        signal = self._signal_index.get(relative_path)
+        if signal is not None and not signal.is_loaded:
+            return signal.load()
+
+        return signal
+
+    def get_item(self, relative_path):
+
+        # Signal or group (dict) at a path of signal_dict keys below the data
+        # set, or None. Only groups need the walk through the nested dicts.
+        signal = self._signal_index.get(relative_path)
+        if signal is not None:
+            return signal if signal.is_loaded else signal.load()
+
+        item = self._signal_dict
+        for token in relative_path.split('/'):
+            if not isinstance(item, dict):
+                return None
+
+            item = item.get(token)
+
+        return item
+
+    @property
+    def filters(self):
+        return self._filters
+
+    def add_filter(self, relative_path, operation, window=None):
+
+        # Registers a rolling filter (see RollingFilter) of the signal at
+        # relative_path next to it, named e.g. speed_mean100. It is computed
+        # when first used.
+        source = self.get_signal(relative_path)
+        if not isinstance(source, AbstractInterpolatedSignal):
+            raise KeyError('No time series at ' + relative_path)
+
+        tokens = relative_path.split('/')
+        name = RollingFilter.signal_name(tokens[-1], operation, window)
+
+        # A filter taken over with its unchanged source on refresh is kept,
+        # along with what it computed
+        signal = self._signal_index.get('/'.join(tokens[:-1] + [name]))
+        window_length = window \
+            if operation in RollingFilter.windowed else None
+        if not isinstance(signal, FilteredSignal) or \
+                signal.source is not source or \
+                signal.operation != operation or \
+                signal.window_length != window_length:
+            signal_path = '/'.join([self._name] + tokens[:-1] + [name])
+            signal = FilteredSignal(source, operation, window, signal_path)
+            self.insert_signal(tokens[:-1], name, signal)
+
+        entry = {'path': relative_path, 'operation': operation,
+                 'window': window}
+        if entry not in self._filters:
+            self._filters.append(entry)
+
+        return signal
+
+    def apply_filters(self, filters):
+        for entry in filters or []:
+            try:
+                self.add_filter(entry['path'], entry['operation'],
+                                entry.get('window'))
+
+            except (KeyError, ValueError) as e:
+                print(self._name + ': ' + str(e))
 
     def generate_json_dict(self):
 
@@ -79,24 +460,240 @@ class DataSet:
             'path_data': self._path_data,
             'path_format': self._path_format,
             'time_key': self._time_key,
+            'load_options': self._load_options,
+            'filters': self._filters,
         }
 
-    def refresh(self):
+    def refresh(self, take_over=False):
 
-        if self._md5 == self.md5_for_file(self._path_data):
+        # With take_over (when the new data set replaces this one), signals
+        # that didn't change are moved to it
+        if not self._fingerprint.has_changed():
             print(self._name + ' has not changed')
             return self
 
         print(self._name + ' has changed. Refreshing...')
 
+        load_options = dict(self._load_options)
+        if self._parse_cache is not None:
+            load_options['parse_cache'] = self._parse_cache
+
         if self._time_key:
-            new_data_set = self._import_method.load(self._path_data, self._time_key)
+            new_data_set = self._import_method.load(
+                self._path_data, self._time_key, **load_options)
 
         else:
-            new_data_set = self._import_method.load(self._path_data)
+            new_data_set = self._import_method.load(
+                self._path_data, **load_options)
+
+        # The new data set hashed the file while parsing it
+        if self._fingerprint.matches(new_data_set.fingerprint):
+            print(self._name + ' was touched but has not changed')
+            return self
+
+        if take_over:
+            new_data_set.take_over_unchanged(self)
+
+        new_data_set.apply_filters(self._filters)
 
         return new_data_set
 
+    def take_over_unchanged(self, previous):
+
+        # Diffs this freshly loaded data set against the one it replaces,
+        # column by column, and keeps the signals of previous whose type,
+        # units, time stamps and sample checksums are unchanged, with
+        # everything they cached (statistics, interpolants, pyramids). Holders
+        # of those signals keep valid references. Only columns loaded in
+        # previous are compared; their unloaded counterparts here are loaded
+        # for that.
+        self.take_over_time_bases(previous)
+
+        # Unloaded counterparts of loaded columns are read in one pass
+        self.load_columns([path for path, old in previous.signal_index.items()
+                           if old.is_loaded])
+
+        kept = set()
+        for relative_path, signal in list(self._signal_index.items()):
+            old = previous.signal_index.get(relative_path)
+            if DataSet.can_take_over(old, signal):
+                tokens = relative_path.split('/')
+                self.insert_signal(tokens[:-1], tokens[-1], old)
+                kept.add(id(old))
+
+        # Filters of kept signals are kept too; apply_filters then finds them
+        # in place
+        for relative_path, old in previous.signal_index.items():
+            if isinstance(old, FilteredSignal) and id(old.source) in kept:
+                tokens = relative_path.split('/')
+                self.insert_signal(tokens[:-1], tokens[-1], old)
+
+        print(self._name + ': ' + str(len(kept)) + ' unchanged signals kept')
+
+    def take_over_time_bases(self, previous):
+
+        # Time bases equal to one of previous are replaced by it, so that kept
+        # signals and new ones share it
+        for index, time_base in enumerate(self._time_bases):
+            checksum = time_base.checksum
+            old_time_base = next(
+                (old for old in previous.time_bases
+                 if old.length == time_base.length and
+                 old.checksum == checksum), None)
+            if old_time_base is None:
+                continue
+
+            self._time_bases[index] = old_time_base
+            for signal in self._signal_index.values():
+                if isinstance(signal, AbstractInterpolatedSignal) and \
+                        signal.time_base is time_base:
+                    signal.share_time_base(old_time_base)
+
+    @staticmethod
+    def can_take_over(old, signal):
+
+        # Filters are compared through their sources, see take_over_unchanged
+        if old is None or not old.is_loaded or \
+                isinstance(old, FilteredSignal) or not signal.is_loaded:
+            return False
+
+        return DataSet.is_unchanged(old, signal)
+
+    @staticmethod
+    def is_unchanged(old, signal):
+
+        if type(old) is not type(signal) or old.units != signal.units:
+            return False
+
+        # Time bases were swapped for the old ones where equal
+        if isinstance(old, AbstractInterpolatedSignal) and \
+                old.time_base is not signal.time_base:
+            return False
+
+        return old.length == signal.length and \
+            old.checksum == signal.checksum
+
+    def changed_signals(self, previous):
+
+        # Signals of this data set that are not those of previous (see
+        # take_over_unchanged): changed and new ones. Columns unloaded in both
+        # are left out, as nothing uses them yet.
+        changed = []
+        for relative_path, signal in self._signal_index.items():
+            old = previous.signal_index.get(relative_path)
+            if signal is not old and (signal.is_loaded or old is None):
+                changed.append(signal)
+
+        return changed
+
+    def append_rows(self):
+
+        # Reads only the rows appended to the file since it was parsed and
+        # appends them to the signals in place, so the cost depends on the new
+        # rows only. Returns how many rows were appended, or None when the file
+        # has to be loaded again instead: it was changed other than by
+        # appending, its samples were moved to scratch files, or the new rows
+        # don't fit the signals (a column turning from integers to floats,
+        # say).
+        appended = self._fingerprint.appended_bytes()
+        if appended is None or \
+                self._parsed_bytes != self._fingerprint.hashed_bytes or \
+                len(self._time_bases) > 1 or \
+                self._load_options.get('scratch_directory'):
+            return None
+
+        if not appended:
+            return 0
+
+        try:
+            columns, end = self._import_method.read_rows(
+                self._path_data, self._parsed_bytes)
+
+        except NotImplementedError:
+            return None
+
+        time_array = columns.pop(self._time_key, None) \
+            if self._time_key else None
+        row_count = len(time_array) if time_array is not None else \
+            len(next(iter(columns.values()), ()))
+        if not row_count:
+            return 0
+
+        # Everything is checked before any signal is changed
+        appends = self.appended_samples(columns)
+        if appends is None or self._time_bases and (
+                time_array is None or
+                not SignalGenerator.is_numeric(time_array)):
+            return None
+
+        self.extend_time_bases(time_array)
+        self.extend_signals(appends)
+
+        self._parsed_bytes = end
+        self._fingerprint.extend(end)
+
+        print(self._name + ': ' + str(row_count) + ' rows appended')
+
+        return row_count
+
+    def appended_samples(self, columns):
+
+        # (signal, new samples) for each appended column, or None when one of
+        # them doesn't fit its signal
+        dtype_policy = DtypePolicy.from_value(
+            self._load_options.get('dtype_policy'))
+
+        appends = []
+        for name, values in columns.items():
+            relative_path = DataSet.split_units_from_string(name)[0]
+            signal = self._signal_index.get(relative_path)
+
+            # Unloaded columns are read later up to the length of the time
+            # base, appended rows included
+            if signal is not None and not signal.is_loaded:
+                continue
+
+            if signal is None or not DataSet.can_append(signal, values):
+                return None
+
+            if dtype_policy is not None:
+                values = dtype_policy.apply(values)
+
+            appends.append((signal, values))
+
+        return appends
+
+    def extend_time_bases(self, time_array):
+        # Must come before extend_signals, which appends samples to signals on
+        # these time bases
+        for time_base in self._time_bases:
+            time_base.extend(time_array)
+
+    def extend_signals(self, appends):
+
+        # Pyramids being built in the background meanwhile are discarded, see
+        # AbstractInterpolatedSignal.build_pyramid
+        for signal, values in appends:
+            signal.append_samples(values)
+
+        for signal in self.signals:
+            if isinstance(signal, FilteredSignal):
+                signal.source_changed()
+
+    @staticmethod
+    def can_append(signal, values):
+
+        # Whether loading the whole file again would give the same signal type
+        if isinstance(signal, NonNumericTimeSeries):
+            return True
+
+        if isinstance(signal, IntegerTimeSeries):
+            return SignalGenerator.is_numeric(values) and \
+                not SignalGenerator.is_float(values)
+
+        return SignalGenerator.is_numeric(values) == \
+            SignalGenerator.is_numeric(signal.samples)
+
     @staticmethod
     def split_units_from_string(string):
 
@@ -113,14 +710,3 @@ class DataSet:
             units = ''
 
         return name, units
-
-    @staticmethod
-    def md5_for_file(filename, block_size=2 ** 20):
-        md5 = hashlib.md5()
-        f = open(filename, 'r')
-        while True:
-            data = f.read(block_size)
-            if not data:
-                break
-            md5.update(data.encode('utf8'))
-        return md5.digest()
@@ -1,19 +1,35 @@
 import re
 from PyQt5 import QtCore, QtWidgets
 
+from data_flow.alignment import SignalAlignment
 from data_flow.data_set import DataSet
+from data_flow.derived_signals import SignalExpression, DerivedSignal
+from data_flow.signals import Signal
+from data_flow.spectral import SpectralAnalysis
+from utilities.worker import Worker
 
 
 class DataStore(QtWidgets.QWidget):
 
     data_store_changed = QtCore.pyqtSignal()
 
+    # Group that derived signals are listed under
+    derived_prefix = 'derived'
+
     def __init__(self, controller, last_session=None, *args, **kwargs):
         super(DataStore, self).__init__(*args, **kwargs)
 
         self._controller = controller
         self._data_sets = {}  #
         self._listeners = {}  # {listener (Animation): signal_patterns (List[str])}
+        # {path (str): signal (DerivedSignal)}, in order of creation
+        self._derived_signals = {}
+        self._revision = 0  # Incremented whenever loaded data changes
+        self._thread_pool = QtCore.QThreadPool()
+
+        # FFT, PSD and spectrogram results of loaded signals, computed in the
+        # thread pool
+        self.spectral_analysis = SpectralAnalysis(self._thread_pool)
 
         if last_session:
             self.load_from_json_dict(last_session)
@@ -22,6 +38,14 @@ class DataStore(QtWidgets.QWidget):
     def data_sets(self):
         return self._data_sets
 
+    @property
+    def derived_signals(self):
+        return self._derived_signals
+
+    @property
+    def revision(self):
+        return self._revision
+
     def generate_json_dict(self):
 
         data_skeleton = {}
@@ -29,6 +53,16 @@ class DataStore(QtWidgets.QWidget):
             assert isinstance(data_set, DataSet)
             data_skeleton[key] = data_set.generate_json_dict()
 
+        # Derived signals, in order of creation, under their prefix (data sets
+        # are renamed away from it)
+        if self._derived_signals:
+            data_skeleton[DataStore.derived_prefix] = [{
+                'name': signal.name,
+                'expression': signal.expression.expression,
+                'variables': signal.expression.variables,
+                'units': signal.units,
+            } for signal in self._derived_signals.values()]
+
         return data_skeleton
 
     def load_from_json_dict(self, json_dict):
@@ -37,6 +71,9 @@ class DataStore(QtWidgets.QWidget):
 
             self.clear_data_sets()
 
+            json_dict = dict(json_dict)
+            derived_signals = json_dict.pop(DataStore.derived_prefix, None)
+
             for _, value in json_dict.items():
 
                 file_type_key = value.get('import_method_type')
@@ -44,77 +81,204 @@ class DataStore(QtWidgets.QWidget):
                 path_data = value.get('path_data')
                 path_format = value.get('path_format')
                 time_key = value.get('time_key')
+                load_options = dict(value.get('load_options') or {})
+                if self._controller.parse_cache is not None:
+                    load_options['parse_cache'] = self._controller.parse_cache
 
                 if path_format:
-                    self.add_data_set(file_format.load(path_data, path_format), suspend_notification=True)
+                    data_set = file_format.load(
+                        path_data, path_format, **load_options)
 
                 else:
                     if time_key:
-                        self.add_data_set(file_format.load(path_data, time_key), suspend_notification=True)
+                        data_set = file_format.load(
+                            path_data, time_key, **load_options)
 
                     else:
-                        self.add_data_set(file_format.load(path_data), suspend_notification=True)
+                        data_set = file_format.load(path_data, **load_options)
+
+                data_set.apply_filters(value.get('filters'))
+                self.add_data_set(data_set, suspend_notification=True)
 
+            self.restore_derived_signals(derived_signals)
             self.data_sets_changed()
 
+    def restore_derived_signals(self, entries):
+
+        # Left out if their inputs are gone, as in rebind_derived_signals
+        self._derived_signals = {}
+        for entry in entries or []:
+            try:
+                self.create_derived_signal(
+                    entry['name'], entry['expression'],
+                    entry.get('variables'), entry.get('units'))
+
+            except (KeyError, ValueError) as e:
+                print(DataStore.derived_prefix + '/' + str(entry.get('name')) +
+                      ' not restored: ' + str(e))
+
     def clear_data_sets(self):
 
         # TODO Safety delete things
 
         self._data_sets = {}
 
-    def data_sets_changed(self, data_sets_that_changed=None):
+    def data_sets_changed(self, data_sets_that_changed=None,
+                          signals_that_changed=None):
+
+        # signals_that_changed narrows notifications down to those signals (and
+        # derived signals built on them)
+        self._revision += 1
+        invalidated = self.rebind_derived_signals()
 
-        self.notify_listeners(data_sets_that_changed)
+        if signals_that_changed is not None:
+            signals_that_changed = signals_that_changed + invalidated
+
+        self.notify_listeners(data_sets_that_changed, signals_that_changed)
         self.data_store_changed.emit()
 
     def refresh(self, overwrite_existing):
 
         new_data_sets = {}
         changed_data_sets = []
+        changed_signals = []
 
         data_sets_changed = False
         for key, data_set in self._data_sets.items():
-            new_set = data_set.refresh()
+
+            # Files that were only appended to are extended in place, by
+            # parsing just the new rows
+            if overwrite_existing and \
+                    self._controller.settings.incremental_refresh:
+                row_count = self.append_rows(data_set)
+                if row_count is not None:
+                    if row_count:
+                        data_sets_changed = True
+                        changed_data_sets.append(data_set)
+
+                    continue
+
+            # Replaced data sets take over the signals that didn't change, and
+            # only listeners of the others are told
+            new_set = data_set.refresh(take_over=overwrite_existing)
 
             if new_set == data_set:
-                print(key + ' ingored')
                 continue
 
             else:
                 data_sets_changed = True
-                changed_data_sets.append(new_set)
                 if overwrite_existing:
-                    print(key + ' overwritten')
                     self._data_sets[key] = new_set
+                    changed_signals.extend(new_set.changed_signals(data_set))
+
+                    if self._controller.settings.build_pyramids:
+                        self.build_pyramids(new_set)
 
                 else:
                     key = self.increment_name(key)
-                    print(key + ' created')
                     new_data_sets[key] = new_set
+                    changed_data_sets.append(new_set)
+
+                    if self._controller.settings.build_pyramids:
+                        self.build_pyramids(new_set)
 
         self._data_sets.update(new_data_sets)
 
         if data_sets_changed:
-            self.data_sets_changed(changed_data_sets)
+            self.data_sets_changed(changed_data_sets, changed_signals)
+
+    def append_rows(self, data_set: DataSet):
+
+        # Rebuilds the pyramids discarded by appending while they were being
+        # built. Pyramids saved next to the file no longer match it, so they
+        # aren't saved again at every append.
+        row_count = data_set.append_rows()
+        if row_count and self._controller.settings.build_pyramids:
+            self.build_pyramids(data_set, persist=False)
+
+        return row_count
 
     def add_data_set(self, data_set: DataSet, replace_existing=False, suspend_notification=False):
 
-        if not replace_existing:
-            if data_set.name in self._data_sets:
-                while data_set.name in self._data_sets:
-                    data_set.name = self.increment_name(data_set.name)
+        # Derived signals take the derived prefix, see add_derived_signal
+        if not replace_existing or data_set.name == DataStore.derived_prefix:
+            while data_set.name in self._data_sets or \
+                    data_set.name == DataStore.derived_prefix:
+                data_set.name = self.increment_name(data_set.name)
 
         self._data_sets[data_set.name] = data_set
 
+        if self._controller.settings.build_pyramids:
+            self.build_pyramids(data_set)
+
         if not suspend_notification:
             self.data_sets_changed([data_set])
 
-    def notify_listeners(self, data_sets_that_changed):
+    def is_signal_path(self, signal_path):
+        return isinstance(self.signal_from_path(signal_path), Signal)
+
+    def add_derived_signal(self, name, expression, variables=None, units=None):
 
-        # If no specific data_sets changed, just assume they all changed
-        data_sets_that_changed = data_sets_that_changed or self._data_sets
-        self.check_patterns(data_sets_that_changed)
+        # Signal computed from loaded signals on demand, e.g.
+        # add_derived_signal('diff', 'run_1/speed - run_2/speed'). Only
+        # listeners whose patterns match the new signal are told.
+        signal = self.create_derived_signal(name, expression, variables, units)
+
+        self.check_patterns([], signals=[signal])
+        self.data_store_changed.emit()
+
+        return signal
+
+    def create_derived_signal(self, name, expression, variables=None,
+                              units=None):
+
+        # A name that is taken is incremented, as data sets are in add_data_set
+        while DataStore.derived_prefix + '/' + name in self._derived_signals:
+            name = self.increment_name(name)
+
+        signal_path = DataStore.derived_prefix + '/' + name
+        signal = DerivedSignal(
+            SignalExpression(expression, self.is_signal_path, variables),
+            self.signal_from_path, signal_path, units)
+
+        self._derived_signals[signal_path] = signal
+
+        return signal
+
+    def remove_derived_signal(self, signal_path):
+        self._derived_signals.pop(signal_path, None)
+        self.data_store_changed.emit()
+
+    def rebind_derived_signals(self):
+
+        # Points derived signals at reloaded inputs, in order of creation so
+        # that a derived signal built on another one sees it already updated.
+        # Those whose inputs were invalidated drop their cached windows and
+        # statistics.
+        invalidated = []
+        for signal_path, signal in list(self._derived_signals.items()):
+            try:
+                if signal.rebind(self.signal_from_path):
+                    invalidated.append(signal)
+
+            except (KeyError, ValueError) as e:
+                print(signal_path + ' removed: ' + str(e))
+                self._derived_signals.pop(signal_path)
+
+        return invalidated
+
+    def build_pyramids(self, data_set: DataSet, persist=True):
+        self._thread_pool.start(
+            Worker(data_set.build_pyramids, persist=persist))
+
+    def notify_listeners(self, data_sets_that_changed,
+                         signals_that_changed=None):
+
+        # If no specific data_sets or signals changed, assume they all did
+        if signals_that_changed is None:
+            data_sets_that_changed = data_sets_that_changed or self._data_sets
+
+        self.check_patterns(data_sets_that_changed, signals_that_changed)
 
     def set_listener_signal_patterns(self, signal_patterns, listener):
         if signal_patterns is None:
@@ -123,14 +287,33 @@ class DataStore(QtWidgets.QWidget):
         else:
             self._listeners[listener] = signal_patterns
 
-    def check_patterns(self, data_sets):
+    def check_patterns(self, data_sets, signals=None):
         for listener, signal_patterns in self._listeners.items():
-            listener.patterns_matched(self.get_matching_signals(signal_patterns, data_sets))
+            matches = self.get_matching_signals(
+                signal_patterns, data_sets, signals)
+
+            # With a list of changed signals, listeners of none are left alone
+            if signals is None or any(matches.values()):
+                listener.patterns_matched(matches)
 
-    def get_matching_signals(self, signal_patterns, data_sets=None):
+    def get_matching_signals(self, signal_patterns, data_sets=None,
+                             signals=None):
+
+        # Matches in data_sets (all of them by default), or, with signals, in
+        # data_sets and those signals only
         matches = {}
         for pattern in signal_patterns:
-            matching_signals = self.pattern_match(pattern, data_sets)
+            matching_signals = []
+            if signals is None or data_sets:
+                matching_signals = self.pattern_match(pattern, data_sets)
+
+            if signals is not None:
+                matching = [
+                    self.loaded(signal) for signal in signals
+                    if self.listener_signal_applies(signal.path, pattern)]
+                matching_signals += [signal for signal in matching
+                                     if signal is not None]
+
             matches[pattern] = matching_signals
 
         return matches
@@ -142,30 +325,88 @@ class DataStore(QtWidgets.QWidget):
         if listen_for in data_sets:
             return [data_sets[listen_for]]
 
+        elif listen_for in self._derived_signals:
+            return [self._derived_signals[listen_for]]
+
         else:
+
+            # One pass over the flat signal lists of the data sets (a dict by
+            # name, or a list of those that changed). Unloaded columns that a
+            # listener asks for are loaded, those of a data set in one pass.
             matches = []
+            if isinstance(data_sets, dict):
+                data_sets = data_sets.values()
+
+            for data_set in data_sets:
+                index = data_set.signal_index
+                paths = self.relative_matches(data_set, listen_for)
 
-            # TODO Parse the listen string
-            # for data_set in data_sets,
-            #   if listener_signal_applies(data_set.signal_path, listen_for),
-            #       return data_set
+                self.load_columns(data_set, [
+                    path for path in paths if not index[path].is_loaded])
+                matches += [index[path] for path in paths
+                            if index[path].is_loaded]
 
             return matches
 
-    def signal_from_path(self, signal_path):
-        data = self.data_sets
-        if not data:
+    @staticmethod
+    def loaded(signal):
+
+        # The signal, or the one that replaced it once loaded. None if its
+        # column can't be read (see load_columns).
+        if signal.is_loaded:
+            return signal
+
+        try:
+            return signal.load()
+
+        except ValueError as e:
+            print(signal.path + ': ' + str(e))
             return None
 
-        path_tokens = signal_path.split('/')
-        for token in path_tokens:
-            if isinstance(data, DataSet):
-                data = data.signal_dict
+    @staticmethod
+    def load_columns(data_set: DataSet, relative_paths):
+
+        # Columns that can't be read (their file changed since it was loaded)
+        # stay unloaded until it is refreshed
+        try:
+            data_set.load_columns(relative_paths)
+
+        except ValueError as e:
+            print(data_set.name + ': ' + str(e))
+
+    def signal_from_path(self, signal_path):
+
+        # Two dict look-ups: data sets by name, then the flat index of the data
+        # set. Keyed by name, the data sets are the first level of a global
+        # index that a rename re-keys in one entry.
+        if signal_path in self._derived_signals:
+            return self._derived_signals[signal_path]
+
+        name, _, relative_path = signal_path.partition('/')
+        data_set = self._data_sets.get(name)
+        if data_set is None or not relative_path:
+            return data_set
+
+        return data_set.get_item(relative_path)
+
+    def align_signals(self, signal_paths, t_start=None, t_end=None,
+                      sample_period=None, method=SignalAlignment.LINEAR,
+                      **kwargs):
 
-            if isinstance(data, dict):
-                data = data.get(token)
+        # Resamples the signals at signal_paths onto one grid (SignalAlignment)
+        signals = []
+        for signal_path in signal_paths:
+            signal = self.signal_from_path(signal_path)
+            if signal is None or isinstance(signal, (dict, DataSet)):
+                raise KeyError('No signal at ' + signal_path)
 
-        return data
+            signals.append(signal)
+
+        kwargs.setdefault('scratch_directory',
+                          self._controller.settings.scratch_directory or None)
+
+        alignment = SignalAlignment(signals, method=method, **kwargs)
+        return alignment.align(t_start, t_end, sample_period)
 
     @staticmethod
     def listener_signal_applies(signal_path, listener_pattern):
@@ -186,6 +427,38 @@ class DataStore(QtWidgets.QWidget):
 
         return False
 
+    @staticmethod
+    def relative_matches(data_set: DataSet, listener_pattern):
+
+        # Paths in the index of the data set of the signals that
+        # listener_signal_applies to. The data set prefix is taken off the
+        # pattern once rather than joined onto the path of every signal.
+        prefix = data_set.name + '/'
+        index = data_set.signal_index
+        exact = listener_pattern[len(prefix):] \
+            if listener_pattern.startswith(prefix) else None
+
+        if listener_pattern.endswith('*'):
+            stem = listener_pattern[:-1]
+            if prefix.startswith(stem):
+                return list(index)
+
+            if not stem.startswith(prefix):
+                return []
+
+            stem = stem[len(prefix):]
+            return [path for path in index if path.startswith(stem)]
+
+        if listener_pattern.startswith('*'):
+            # A suffix longer than the path reaches into the prefix
+            suffix = listener_pattern[1:]
+            return [path for path in index if path == exact or
+                    path.endswith(suffix) or
+                    suffix.endswith(path) and
+                    prefix.endswith(suffix[:len(suffix) - len(path)])]
+
+        return [exact] if exact in index else []
+
     @staticmethod
     def increment_name(name):
 
@@ -0,0 +1,96 @@
+import numpy as np
+
+__all__ = ['Decimation']
+
+
+class Decimation:
+
+    # Level-of-detail reduction of a (time, values) series to a fixed number of output points, so that the cost of
+    # drawing depends on the number of pixels on screen instead of the number of samples in the log.
+
+    MIN_MAX = 'min_max'
+    LTTB = 'lttb'
+
+    methods = (MIN_MAX, LTTB)
+
+    @staticmethod
+    def decimate(time: np.array, values: np.array, pixel_count: int, method=MIN_MAX):
+
+        if method == Decimation.MIN_MAX:
+            return Decimation.min_max(time, values, pixel_count)
+
+        elif method == Decimation.LTTB:
+            # LTTB keeps one point per bucket, so give it the same point budget as the min/max envelope
+            return Decimation.lttb(time, values, 2 * pixel_count)
+
+        else:
+            raise ValueError('Unknown decimation method: ' + str(method))
+
+    @staticmethod
+    def min_max(time: np.array, values: np.array, bucket_count: int):
+
+        # Min/max envelope: for each bucket keep the smallest and the largest sample, in time order, so that spikes
+        # survive at any zoom level. Output size is at most 2 * bucket_count.
+
+        length = len(values)
+        if bucket_count < 1 or length <= 2 * bucket_count:
+            return time, values
+
+        # Pad to a whole number of equally sized buckets by repeating the last sample, which can't change any
+        # bucket's min or max, then reduce every bucket at once
+        bucket_size = -(-length // bucket_count)
+        bucket_count = -(-length // bucket_size)
+        padded = np.pad(values, (0, bucket_count * bucket_size - length), mode='edge').reshape(bucket_count, -1)
+
+        offsets = np.arange(bucket_count) * bucket_size
+        index_min = offsets + np.argmin(padded, axis=1)
+        index_max = offsets + np.argmax(padded, axis=1)
+
+        indices = np.empty(2 * bucket_count, dtype=np.intp)
+        indices[0::2] = np.minimum(index_min, index_max)
+        indices[1::2] = np.maximum(index_min, index_max)
+        indices = np.minimum(indices, length - 1)
+
+        return time[indices], values[indices]
+
+    @staticmethod
+    def lttb(time: np.array, values: np.array, threshold: int):
+
+        # Largest-Triangle-Three-Buckets (Steinarsson, 2013). The first and last samples are kept, the rest is split
+        # into threshold - 2 buckets and from each bucket the sample forming the largest triangle with the previously
+        # selected sample and the average of the next bucket is kept.
+
+        length = len(values)
+        if threshold < 3 or length <= threshold:
+            return time, values
+
+        time_64 = np.asarray(time, dtype=np.float64)
+        values_64 = np.asarray(values, dtype=np.float64)
+
+        edges = np.linspace(1, length - 1, threshold - 1).astype(np.intp)
+
+        indices = np.empty(threshold, dtype=np.intp)
+        indices[0] = 0
+        indices[-1] = length - 1
+
+        selected = 0
+        for bucket in range(threshold - 2):
+            start, stop = edges[bucket], edges[bucket + 1]
+
+            if bucket + 2 < len(edges):
+                next_start, next_stop = edges[bucket + 1], edges[bucket + 2]
+                next_time = time_64[next_start:next_stop].mean()
+                next_value = values_64[next_start:next_stop].mean()
+
+            else:
+                next_time = time_64[-1]
+                next_value = values_64[-1]
+
+            areas = np.abs(
+                (time_64[selected] - next_time) * (values_64[start:stop] - values_64[selected])
+                - (time_64[selected] - time_64[start:stop]) * (next_value - values_64[selected]))
+
+            selected = start + int(np.argmax(areas))
+            indices[bucket + 1] = selected
+
+        return time[indices], values[indices]
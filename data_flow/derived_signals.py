@@ -0,0 +1,323 @@
+import ast
+import re
+
+import numpy as np
+
+from data_flow.alignment import SignalAlignment
+from data_flow.signal_statistics import SignalStatistics
+from data_flow.signals import FloatTimeSeries, IntegerTimeSeries, SignalGenerator
+from utilities.lru_cache import LRUCache
+
+__all__ = ['SignalExpression', 'DerivedSignal']
+
+
+class SignalExpression:
+
+    # Arithmetic over signals, e.g. "run_1/speed - run_2/speed", "abs(x)" or "{run 1/speed [m/s]} * 3.6". Signals
+    # are referenced by path, by a path in braces when it holds characters other than letters, digits, '_' and '/', or
+    # by a variable name bound to a path. A bare a/b is read as a path when it names a signal and as a division
+    # otherwise.
+
+    functions = {
+        'abs': np.abs,
+        'sqrt': np.sqrt,
+        'exp': np.exp,
+        'log': np.log,
+        'log10': np.log10,
+        'sin': np.sin,
+        'cos': np.cos,
+        'tan': np.tan,
+        'arctan2': np.arctan2,
+        'minimum': np.minimum,
+        'maximum': np.maximum,
+        'clip': np.clip,
+        'where': np.where,
+    }
+
+    _binary_operators = {
+        ast.Add: np.add,
+        ast.Sub: np.subtract,
+        ast.Mult: np.multiply,
+        ast.Div: np.true_divide,
+        ast.FloorDiv: np.floor_divide,
+        ast.Mod: np.mod,
+        ast.Pow: np.power,
+    }
+
+    _unary_operators = {
+        ast.USub: np.negative,
+        ast.UAdd: np.positive,
+    }
+
+    _compare_operators = {
+        ast.Lt: np.less,
+        ast.LtE: np.less_equal,
+        ast.Gt: np.greater,
+        ast.GtE: np.greater_equal,
+        ast.Eq: np.equal,
+        ast.NotEq: np.not_equal,
+    }
+
+    _quoted_path = re.compile(r'{([^{}]+)}')
+    _bare_path = re.compile(r'(?<![\w.])([A-Za-z_]\w*(?:/[A-Za-z_]\w*)+)')
+
+    def __init__(self, expression: str, is_signal_path, variables: dict = None):
+
+        # is_signal_path(path) tells whether a signal exists at path. Every signal reference is replaced by a
+        # placeholder name before the expression is handed to the Python parser.
+        self._expression = expression
+        self._variables = dict(variables or {})
+        self._paths = []
+
+        def placeholder(path):
+            if path not in self._paths:
+                self._paths.append(path)
+
+            return '_signal_' + str(self._paths.index(path))
+
+        source = self._quoted_path.sub(lambda match: placeholder(match.group(1).strip()), expression)
+        source = self._bare_path.sub(
+            lambda match: placeholder(match.group(1)) if is_signal_path(match.group(1)) else match.group(1), source)
+
+        try:
+            self._tree = ast.parse(source.strip(), mode='eval').body
+
+        except SyntaxError as e:
+            raise ValueError('Invalid expression "' + expression + '": ' + str(e.msg))
+
+        # Variables are resolved to paths too, so that only placeholders are left
+        function_names = {id(node.func) for node in ast.walk(self._tree) if isinstance(node, ast.Call)}
+
+        self._names = {}
+        for node in ast.walk(self._tree):
+            if isinstance(node, ast.Name) and id(node) not in function_names and node.id in self._variables:
+                self._names[node.id] = placeholder(self._variables[node.id])
+
+        self.check(self._tree)
+
+    @property
+    def expression(self):
+        return self._expression
+
+    @property
+    def variables(self):
+        return self._variables
+
+    @property
+    def paths(self):
+        # Signals the expression reads, in order of appearance
+        return self._paths
+
+    def check(self, node):
+
+        # Only arithmetic, comparisons, numbers, signals and the listed functions are allowed
+        if isinstance(node, ast.BinOp) and type(node.op) in self._binary_operators:
+            self.check(node.left)
+            self.check(node.right)
+
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in self._unary_operators:
+            self.check(node.operand)
+
+        elif isinstance(node, ast.Compare) and all(type(op) in self._compare_operators for op in node.ops):
+            self.check(node.left)
+            for comparator in node.comparators:
+                self.check(comparator)
+
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in self.functions \
+                and not node.keywords:
+            for argument in node.args:
+                self.check(argument)
+
+        elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+                and not isinstance(node.value, bool):
+            pass
+
+        elif isinstance(node, ast.Name):
+            if not node.id.startswith('_signal_') and node.id not in self._variables:
+                raise ValueError('Unknown signal or variable "' + node.id + '" in "' + self._expression + '"')
+
+        else:
+            raise ValueError('Unsupported syntax "' + ast.dump(node) + '" in "' + self._expression + '"')
+
+    def evaluate(self, inputs: list):
+
+        # inputs[i] holds the values of paths[i] on a common time grid. Repeated sub-expressions are evaluated once.
+        return self.evaluate_node(self._tree, inputs, {})
+
+    def evaluate_node(self, node, inputs, memo):
+
+        key = ast.dump(node)
+        if key in memo:
+            return memo[key]
+
+        if isinstance(node, ast.BinOp):
+            result = self._binary_operators[type(node.op)](
+                self.evaluate_node(node.left, inputs, memo), self.evaluate_node(node.right, inputs, memo))
+
+        elif isinstance(node, ast.UnaryOp):
+            result = self._unary_operators[type(node.op)](self.evaluate_node(node.operand, inputs, memo))
+
+        elif isinstance(node, ast.Compare):
+            left = self.evaluate_node(node.left, inputs, memo)
+            result = True
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.evaluate_node(comparator, inputs, memo)
+                result = np.logical_and(result, self._compare_operators[type(op)](left, right))
+                left = right
+
+        elif isinstance(node, ast.Call):
+            result = self.functions[node.func.id](*[self.evaluate_node(arg, inputs, memo) for arg in node.args])
+
+        elif isinstance(node, ast.Constant):
+            result = node.value
+
+        else:
+            name = node.id if node.id.startswith('_signal_') else self._names[node.id]
+            result = inputs[int(name[len('_signal_'):])]
+
+        memo[key] = result
+
+        return result
+
+
+class DerivedSignal(FloatTimeSeries):
+
+    # Signal computed from other signals by a SignalExpression. Nothing is evaluated up front: samples are computed
+    # for the index window that is asked for and kept in a small per-window cache. The signal lives on the time base
+    # of the first signal in the expression; inputs recorded on another time base are interpolated onto it.
+
+    __slots__ = ('_expression', '_inputs', '_input_revisions', '_window_cache')
+
+    # Evaluated windows kept per signal
+    window_cache_size = 8
+
+    def __init__(self, expression: SignalExpression, resolve, signal_path='', value_units=None):
+
+        self._expression = expression
+        self._inputs = []
+        self._input_revisions = []
+        self._window_cache = LRUCache(self.window_cache_size)
+
+        self._time_base = self.resolve_inputs(resolve)
+
+        super(DerivedSignal, self).__init__(
+            time_array=self._time_base, value_array=np.empty(0), value_units=value_units, signal_path=signal_path)
+
+    @property
+    def expression(self) -> SignalExpression:
+        return self._expression
+
+    @property
+    def inputs(self):
+        return self._inputs
+
+    @property
+    def length(self):
+        return self._time_base.length
+
+    @property
+    def samples(self):
+        return self.stored_values(0, self.length)
+
+    def resolve_inputs(self, resolve):
+
+        inputs = []
+        for path in self._expression.paths:
+            signal = resolve(path)
+            if signal is None or not hasattr(signal, 'time_base'):
+                raise KeyError('No time series at ' + path)
+
+            if isinstance(signal, IntegerTimeSeries) and not SignalGenerator.is_numeric(signal.categories):
+                raise ValueError(path + ' is not numeric')
+
+            inputs.append(signal)
+
+        if not inputs:
+            raise ValueError('"' + self._expression.expression + '" does not use any signal')
+
+        self._inputs = inputs
+        self._input_revisions = [getattr(signal, 'revision', 0) for signal in inputs]
+
+        return inputs[0].time_base
+
+    def rebind(self, resolve):
+
+        # Called after inputs may have been reloaded. Returns True (and drops everything computed) if any input is a
+        # different object or was itself invalidated.
+        previous = list(zip(self._inputs, self._input_revisions))
+        time_base = self.resolve_inputs(resolve)
+
+        if all(signal is old and getattr(signal, 'revision', 0) == revision
+               for signal, (old, revision) in zip(self._inputs, previous)) and len(previous) == len(self._inputs):
+            return False
+
+        self._time_base = time_base
+        self.samples_changed()
+
+        return True
+
+    def samples_changed(self):
+        super(DerivedSignal, self).samples_changed()
+
+        self._window_cache.clear()
+
+    def evaluate(self, start_index: int, end_index: int):
+
+        # Expression over samples [start_index, end_index) of the time base, uncached
+        time = self._time_base.window(start_index, end_index)
+
+        values = []
+        alignment = None
+        for signal in self._inputs:
+            if signal.time_base is self._time_base:
+                values.append(signal.decode_samples(signal.stored_values(start_index, end_index)))
+
+            else:
+                alignment = alignment or SignalAlignment([])
+                values.append(alignment.evaluate(signal, np.asarray(time, dtype=np.float64)))
+
+        with np.errstate(all='ignore'):
+            result = np.asarray(self._expression.evaluate(values))
+
+        if result.ndim == 0:
+            result = np.full(end_index - start_index, result)
+
+        if result.dtype.kind in 'biu':
+            result = result.astype(np.float64)
+
+        return result
+
+    def stored_values(self, start_index: int, end_index: int):
+
+        start_index = max(start_index, 0)
+        end_index = max(min(end_index, self.length), start_index)
+
+        key = (start_index, end_index)
+        values = self._window_cache.get(key)
+        if values is None:
+            values = self.evaluate(start_index, end_index)
+
+            # Shared between callers
+            values.flags.writeable = False
+            self._window_cache.put(key, values)
+
+        return values
+
+    def compute_statistics(self):
+
+        # Evaluated a chunk at a time (and without filling the window cache) so the whole signal is never in memory
+        chunk_size = SignalStatistics.chunk_size
+        if self.length <= chunk_size:
+            return SignalStatistics.from_samples(self.evaluate(0, self.length))
+
+        return SignalStatistics.from_chunks(
+            lambda: (self.evaluate(start, min(start + chunk_size, self.length))
+                     for start in range(0, self.length, chunk_size)))
+
+    def interpolate(self):
+        return self.interpolate_window
+
+    def build_pyramid(self, block_size=16):
+        # Derived signals are only ever evaluated per window
+        self._pyramid = None
+        return None
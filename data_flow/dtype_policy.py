@@ -0,0 +1,80 @@
+import numpy as np
+
+from data_flow.chunked_array import ChunkedArray
+
+__all__ = ['DtypePolicy']
+
+
+class DtypePolicy:
+
+    # Storage types chosen for parsed columns. Integers always fit losslessly into the narrowest type that holds their
+    # range; storing floats as float32 is opt-in as it drops precision. Statistics are still accumulated in float64.
+
+    _SIGNED = (np.int8, np.int16, np.int32, np.int64)
+    _UNSIGNED = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+    def __init__(self, downcast_integers=True, float32=False):
+        self._downcast_integers = downcast_integers
+        self._float32 = float32
+
+    @property
+    def downcast_integers(self):
+        return self._downcast_integers
+
+    @property
+    def float32(self):
+        return self._float32
+
+    def generate_json_dict(self):
+        return {
+            'downcast_integers': self._downcast_integers,
+            'float32': self._float32,
+        }
+
+    @staticmethod
+    def from_value(value):
+        # Loader options store the policy as its json dict
+        if value is None or isinstance(value, DtypePolicy):
+            return value
+
+        return DtypePolicy(**value)
+
+    @staticmethod
+    def smallest_integer_type(min_value, max_value):
+        for dtype in DtypePolicy._UNSIGNED if min_value >= 0 else DtypePolicy._SIGNED:
+            info = np.iinfo(dtype)
+            if info.min <= min_value and max_value <= info.max:
+                return dtype
+
+        return None
+
+    def target_dtype(self, dtype, min_value, max_value):
+
+        # Storage type for samples of the given type and range, or None to keep them as they are
+        dtype = np.dtype(dtype)
+
+        if dtype.kind in 'iu' and self._downcast_integers and min_value is not None and dtype.itemsize > 1:
+            target = self.smallest_integer_type(min_value, max_value)
+            if target is not None and np.dtype(target).itemsize < dtype.itemsize:
+                return target
+
+        elif dtype.kind == 'f' and self._float32 and dtype.itemsize > 4:
+            return np.float32
+
+        return None
+
+    def apply(self, value_array):
+
+        # Chunked arrays track their range while they are filled, so they are converted chunk by chunk
+        if isinstance(value_array, ChunkedArray):
+            target = self.target_dtype(value_array.dtype, value_array.min_value, value_array.max_value)
+            return value_array.astype(target) if target is not None else value_array
+
+        array = np.asanyarray(value_array)
+        if not len(array):
+            return array
+
+        min_value, max_value = (np.min(array), np.max(array)) if array.dtype.kind in 'iu' else (None, None)
+        target = self.target_dtype(array.dtype, min_value, max_value)
+
+        return array.astype(target) if target is not None else array
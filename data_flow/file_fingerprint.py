@@ -0,0 +1,169 @@
+import os
+import hashlib
+import threading
+
+__all__ = ['FileFingerprint']
+
+
+class FileFingerprint:
+
+    # Identifies the contents of a data file for change detection. A file whose (size, mtime_ns, inode) is unchanged
+    # is taken as unchanged without reading it. Otherwise its bytes are hashed with BLAKE2b in large blocks. The hash
+    # is computed in a background thread, so a loader can parse the file while it is being hashed; hashlib releases
+    # the GIL on large updates. The hash state is kept, so bytes appended to the file later can be hashed on their own.
+
+    # Bytes read per block while hashing
+    buffer_size = 2 ** 24
+
+    digest_size = 16
+
+    # Last bytes of the hashed part that are kept to check that a grown file was only appended to
+    check_size = 2 ** 12
+
+    def __init__(self, path, background=True):
+
+        self._path = path
+        self._stat = self.stat_key(path)
+        self._digest = None
+        self._hasher = None
+        self._hashed_bytes = 0
+        self._tail = b''
+        self._error = None
+        self._thread = None
+
+        if background:
+            self._thread = threading.Thread(target=self.compute_digest, daemon=True)
+            self._thread.start()
+
+        else:
+            self.compute_digest()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def stat(self):
+        return self._stat
+
+    @property
+    def digest(self):
+        self.wait()
+        return self._digest
+
+    @property
+    def hashed_bytes(self):
+        # Length of the start of the file the digest covers
+        self.wait()
+        return self._hashed_bytes
+
+    def wait(self):
+
+        # Waits for the background hash if it hasn't finished yet
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._error is not None:
+            raise self._error
+
+    @staticmethod
+    def stat_key(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    @staticmethod
+    def hash_into(digest, path, offset=0, end=None, buffer_size=None):
+
+        # Feeds bytes [offset, end) of the file (to its end by default) into digest; returns how many were read
+        buffer = bytearray(buffer_size or FileFingerprint.buffer_size)
+        view = memoryview(buffer)
+        read = 0
+
+        with open(path, 'rb', buffering=0) as fd:
+            fd.seek(offset)
+            while end is None or offset + read < end:
+                size = fd.readinto(buffer if end is None else view[:min(len(buffer), end - offset - read)])
+                if not size:
+                    break
+
+                digest.update(view[:size])
+                read += size
+
+        return read
+
+    @staticmethod
+    def hash_file(path, buffer_size=None):
+        digest = hashlib.blake2b(digest_size=FileFingerprint.digest_size)
+        FileFingerprint.hash_into(digest, path, buffer_size=buffer_size)
+
+        return digest.digest()
+
+    @staticmethod
+    def read_bytes(path, offset, size):
+        with open(path, 'rb') as fd:
+            fd.seek(offset)
+            return fd.read(size)
+
+    def compute_digest(self):
+        try:
+            hasher = hashlib.blake2b(digest_size=self.digest_size)
+            self._hashed_bytes = self.hash_into(hasher, self._path)
+            self._hasher = hasher
+            self._digest = hasher.digest()
+            self._tail = self.read_bytes(
+                self._path, max(self._hashed_bytes - self.check_size, 0), min(self._hashed_bytes, self.check_size))
+
+        except OSError as e:
+            self._error = e
+
+    def has_changed(self):
+
+        # Stat only, the file isn't read here: a refresh reloads a file whose
+        # stat changed, which hashes it alongside the parse, and then checks
+        # with matches whether the bytes really changed (see DataSet.refresh)
+        return self.stat_key(self._path) != self._stat
+
+    def matches(self, other):
+
+        # Whether other, a later fingerprint of the same file, has the same
+        # bytes. A file that was only touched then takes over the new stat,
+        # so that the next has_changed is fast again.
+        if other.digest != self.digest:
+            return False
+
+        self._stat = other.stat
+
+        return True
+
+    def appended_bytes(self):
+
+        # Number of bytes added to the end of the file since it was hashed, or None if it was changed in any other
+        # way. Only the last check_size bytes hashed before are read again, so a rewrite that keeps the file's inode,
+        # grows it and leaves those bytes alone goes unnoticed.
+        self.wait()
+
+        stat = self.stat_key(self._path)
+        size, _, inode = stat
+        if inode != self._stat[2] or size < self._hashed_bytes:
+            return None
+
+        if stat == self._stat and size == self._hashed_bytes:
+            return 0
+
+        if self.read_bytes(self._path, self._hashed_bytes - len(self._tail), len(self._tail)) != self._tail:
+            return None
+
+        return size - self._hashed_bytes
+
+    def extend(self, end):
+
+        # Continues the hash over bytes appended to the file up to end, without reading the ones hashed before
+        self.wait()
+
+        stat = self.stat_key(self._path)
+        self._hashed_bytes += self.hash_into(self._hasher, self._path, self._hashed_bytes, end)
+        self._digest = self._hasher.digest()
+        self._tail = self.read_bytes(
+            self._path, max(self._hashed_bytes - self.check_size, 0), min(self._hashed_bytes, self.check_size))
+        self._stat = stat
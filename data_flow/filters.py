@@ -0,0 +1,291 @@
+import numpy as np
+
+from data_flow.chunked_array import ChunkedArray
+from data_flow.signals import FloatTimeSeries
+
+__all__ = ['RollingFilter', 'FilteredSignal']
+
+
+class RollingFilter:
+
+    # Trailing-window filters and running derivative/integral, each a fixed number of vectorized passes over the
+    # samples whatever the window length. Sample i of a rolling result covers samples [i - window + 1, i]; the first
+    # window - 1 samples use the shorter window that is available.
+
+    MEAN = 'mean'
+    RMS = 'rms'
+    MIN = 'min'
+    MAX = 'max'
+    DERIVATIVE = 'derivative'
+    INTEGRAL = 'integral'
+
+    windowed = (MEAN, RMS, MIN, MAX)
+    operations = windowed + (DERIVATIVE, INTEGRAL)
+
+    @staticmethod
+    def block_scans(values: np.array, window: int, function, fill):
+
+        # van Herk / Gil-Werman: split the samples, preceded by window - 1 fill values, into blocks of the window
+        # length and run function forward and backward within each block. The window ending at sample i then starts
+        # in the backward run at i and ends in the forward run at i + window - 1 (both in padded positions).
+        length = len(values)
+
+        block_count = -(-(length + window - 1) // window)
+        padded = np.full(block_count * window, fill, dtype=np.result_type(values, fill))
+        padded[window - 1:window - 1 + length] = values
+
+        blocks = padded.reshape(block_count, window)
+        forward = function.accumulate(blocks, axis=1).reshape(-1)
+        backward = function.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1)
+
+        return backward[:length], forward[window - 1:window - 1 + length]
+
+    @staticmethod
+    def rolling_sum(values: np.array, window: int):
+
+        # Running sums restart every window samples, so unlike a difference of two cumulative sums over the whole
+        # signal, rounding errors don't grow with the signal length. A window that starts on a block boundary lies
+        # entirely in the backward run.
+        values = np.asarray(values, dtype=np.float64)
+        window = max(min(window, len(values)), 1)
+
+        backward, forward = RollingFilter.block_scans(values, window, np.add, 0.0)
+        starts_block = np.arange(len(values)) % window == 0
+
+        return backward + np.where(starts_block, 0.0, forward)
+
+    @staticmethod
+    def window_counts(length: int, window: int):
+        return np.minimum(np.arange(1, length + 1), window)
+
+    @staticmethod
+    def mean(values: np.array, window: int):
+        return RollingFilter.rolling_sum(values, window) / RollingFilter.window_counts(len(values), window)
+
+    @staticmethod
+    def rms(values: np.array, window: int):
+        squares = np.square(np.asarray(values, dtype=np.float64))
+        return np.sqrt(np.maximum(RollingFilter.mean(squares, window), 0.0))
+
+    @staticmethod
+    def extreme(values: np.array, window: int, function):
+
+        # Any window spans at most two blocks of block_scans, so its extreme is the extreme of the two runs. Adapted
+        # from the monotonic deque, which needs a per-sample loop, to this form that numpy runs in a few passes.
+        values = np.asarray(values)
+        length = len(values)
+        if not length or window <= 1:
+            return values.copy()
+
+        window = min(window, length)
+
+        if values.dtype.kind == 'f':
+            fill = np.inf if function is np.minimum else -np.inf
+
+        elif values.dtype.kind == 'b':
+            fill = function is np.minimum
+
+        else:
+            info = np.iinfo(values.dtype)
+            fill = info.max if function is np.minimum else info.min
+
+        backward, forward = RollingFilter.block_scans(values, window, function, np.array(fill, dtype=values.dtype))
+
+        return function(backward, forward)
+
+    @staticmethod
+    def minimum(values: np.array, window: int):
+        return RollingFilter.extreme(values, window, np.minimum)
+
+    @staticmethod
+    def maximum(values: np.array, window: int):
+        return RollingFilter.extreme(values, window, np.maximum)
+
+    @staticmethod
+    def derivative(time: np.array, values: np.array):
+        # Second order central differences inside, one-sided at the ends; works for uneven sampling
+        if len(values) < 2:
+            return np.zeros(len(values))
+
+        return np.gradient(np.asarray(values, dtype=np.float64), np.asarray(time, dtype=np.float64))
+
+    @staticmethod
+    def integral(time: np.array, values: np.array):
+        # Cumulative trapezoidal integral from the first sample
+        values = np.asarray(values, dtype=np.float64)
+        areas = (values[1:] + values[:-1]) * 0.5 * np.diff(np.asarray(time, dtype=np.float64))
+
+        return np.concatenate(([0.0], np.cumsum(areas)))
+
+    @staticmethod
+    def apply(operation: str, time: np.array, values: np.array, window: int = None):
+
+        if operation in RollingFilter.windowed and (window is None or window < 1):
+            raise ValueError(operation + ' needs a window of at least one sample')
+
+        if operation == RollingFilter.MEAN:
+            return RollingFilter.mean(values, window)
+
+        elif operation == RollingFilter.RMS:
+            return RollingFilter.rms(values, window)
+
+        elif operation == RollingFilter.MIN:
+            return RollingFilter.minimum(values, window)
+
+        elif operation == RollingFilter.MAX:
+            return RollingFilter.maximum(values, window)
+
+        elif operation == RollingFilter.DERIVATIVE:
+            return RollingFilter.derivative(time, values)
+
+        elif operation == RollingFilter.INTEGRAL:
+            return RollingFilter.integral(time, values)
+
+        raise ValueError('Unknown filter: ' + str(operation))
+
+    @staticmethod
+    def overlap(operation: str, window: int = None):
+        # Samples before and after a range of results that those results depend on
+        if operation in RollingFilter.windowed:
+            return window - 1, 0
+
+        return (1, 1) if operation == RollingFilter.DERIVATIVE else (1, 0)
+
+    @staticmethod
+    def apply_chunks(operation: str, read_time, read_values, length: int, window: int = None, chunk_size=2 ** 20):
+
+        # Same results as apply, yielded chunk_size samples at a time for samples that are not held in memory.
+        # read_time(start, end) and read_values(start, end) return samples [start, end); each chunk is filtered
+        # together with the samples around it that its results depend on (see overlap), and integrals carry on from
+        # the last result of the chunk before.
+        before, after = RollingFilter.overlap(operation, window)
+        carry = 0.0
+
+        for start in range(0, length, chunk_size):
+            end = min(start + chunk_size, length)
+            first, last = max(start - before, 0), min(end + after, length)
+
+            result = RollingFilter.apply(operation, read_time(first, last), read_values(first, last), window)
+            result = result[start - first:end - first]
+
+            if operation == RollingFilter.INTEGRAL:
+                result += carry
+                carry = result[-1]
+
+            yield result
+
+    @staticmethod
+    def signal_name(name: str, operation: str, window: int = None):
+        return name + '_' + operation + (str(window) if operation in RollingFilter.windowed else '')
+
+
+class FilteredSignal(FloatTimeSeries):
+
+    # Result of a RollingFilter over another signal, on the same time base. Nothing is computed until the samples are
+    # first needed; the result is then kept until the signal is dropped.
+
+    __slots__ = ('_source', '_operation', '_window', '_computed')
+
+    # Samples filtered at once when the source is not held in memory
+    chunk_size = 2 ** 20
+
+    def __init__(self, source, operation: str, window: int = None, signal_path=''):
+
+        if operation not in RollingFilter.operations:
+            raise ValueError('Unknown filter: ' + str(operation))
+
+        if operation in RollingFilter.windowed and (window is None or window < 1):
+            raise ValueError(operation + ' needs a window of at least one sample')
+
+        self._source = source
+        self._operation = operation
+        self._window = window if operation in RollingFilter.windowed else None
+        self._computed = False
+        self._time_base = source.time_base
+
+        units = source.units
+        if units and operation == RollingFilter.DERIVATIVE:
+            units = units + '/' + source.time_unit
+
+        elif units and operation == RollingFilter.INTEGRAL:
+            units = units + '*' + source.time_unit
+
+        super(FilteredSignal, self).__init__(
+            time_array=source.time_base, time_units=source.time_unit, value_array=np.empty(0), value_units=units,
+            signal_path=signal_path)
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def operation(self):
+        return self._operation
+
+    @property
+    def window_length(self):
+        return self._window
+
+    @property
+    def is_computed(self):
+        return self._computed
+
+    @property
+    def length(self):
+        return self._time_base.length
+
+    def materialize(self):
+        if not self._computed:
+            if self._source.is_out_of_core:
+                values = self.filter_chunks()
+
+            else:
+                values = RollingFilter.apply(self._operation, self._time_base.array, self._source.samples, self._window)
+                values.flags.writeable = False
+
+            self._value_array = values
+            self._computed = True
+
+        return self._value_array
+
+    def filter_chunks(self):
+
+        # Sources that are memory-mapped or chunked are read and filtered a chunk at a time, into a compressed chunked
+        # array, so neither their samples nor the result are ever all in memory
+        source = self._source
+        values = ChunkedArray(chunk_size=self.chunk_size, storage=ChunkedArray.COMPRESSED)
+
+        for chunk in RollingFilter.apply_chunks(
+                self._operation, self._time_base.window, lambda start, end: source.decode_samples(
+                    source.stored_values(start, end)), self.length, self._window, self.chunk_size):
+            values.append(chunk)
+
+        return values
+
+    def source_changed(self):
+        # Computed again when next needed
+        self._computed = False
+        self._value_array = np.empty(0)
+        self.samples_changed()
+
+    @property
+    def samples(self):
+        return self.materialize()
+
+    def stored_values(self, start_index: int, end_index: int):
+        return self.materialize()[start_index:end_index]
+
+    def compute_statistics(self):
+        self.materialize()
+        return super(FilteredSignal, self).compute_statistics()
+
+    def interpolate(self):
+        self.materialize()
+        return super(FilteredSignal, self).interpolate()
+
+    def build_pyramid(self, block_size=16):
+        # Building pyramids in the background must not compute every filter up front
+        if not self._computed:
+            return None
+
+        return super(FilteredSignal, self).build_pyramid(block_size)
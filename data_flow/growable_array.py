@@ -0,0 +1,59 @@
+import numpy as np
+
+__all__ = ['GrowableArray']
+
+
+class GrowableArray:
+
+    # One-dimensional array that rows can be appended to in amortized constant time per sample. Samples fill the start
+    # of a buffer that grows geometrically, and array is a read-only view of the filled part. Views handed out earlier
+    # stay valid: appending never writes into samples they cover, unless those were dropped with truncate.
+
+    growth_factor = 1.5
+
+    def __init__(self, array, capacity: int = 0):
+
+        array = np.asarray(array)
+
+        self._length = len(array)
+        self._buffer = np.empty(max(capacity, self._length), dtype=array.dtype)
+        self._buffer[:self._length] = array
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def capacity(self):
+        return len(self._buffer)
+
+    @property
+    def dtype(self):
+        return self._buffer.dtype
+
+    @property
+    def array(self):
+        array = self._buffer[:self._length]
+        array.flags.writeable = False
+
+        return array
+
+    def extend(self, values):
+
+        # Widens the type when the new values don't fit the old one (integers followed by floats, say)
+        values = np.asarray(values)
+        dtype = np.result_type(self._buffer.dtype, values.dtype)
+        end = self._length + len(values)
+
+        if end > len(self._buffer) or dtype != self._buffer.dtype:
+            buffer = np.empty(max(end, int(len(self._buffer) * self.growth_factor) + 1), dtype=dtype)
+            buffer[:self._length] = self._buffer[:self._length]
+            self._buffer = buffer
+
+        self._buffer[self._length:end] = values
+        self._length = end
+
+        return self.array
+
+    def truncate(self, length: int):
+        # Drops samples from length on; their space is reused by the next extend
+        self._length = min(max(length, 0), self._length)
@@ -0,0 +1,69 @@
+import os
+import re
+import uuid
+import shutil
+
+import numpy as np
+
+__all__ = ['ScratchDirectory']
+
+
+class ScratchDirectory:
+
+    # Directory of .npy files that parsed columns are spilled to, so that they are served from the OS page cache
+    # through np.memmap instead of being held in process memory.
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def file_path(self, name):
+
+        # Column names can hold anything, so keep the file name to a safe subset. Every spill gets a new file, as a
+        # file that is still mapped by signals of an earlier load must never be rewritten.
+        return os.path.join(self._directory, re.sub(r'[^\w\-.]', '_', name) + '-' + uuid.uuid4().hex[:12] + '.npy')
+
+    def spill(self, array, name):
+
+        array = np.asarray(array)
+
+        # Only numeric columns are worth mapping. Anything else is encoded into small category codes on load anyway.
+        if array.dtype.kind not in 'buif':
+            return array
+
+        file_path, mapped = self.create(name, array.shape, array.dtype)
+        mapped[:] = array
+
+        return self.map_read_only(file_path, mapped)
+
+    def create(self, name, shape, dtype):
+        # New writable mapped array, to be filled in place and then passed to map_read_only
+        os.makedirs(self._directory, exist_ok=True)
+        file_path = self.file_path(name)
+
+        return file_path, np.lib.format.open_memmap(file_path, mode='w+', dtype=dtype, shape=shape)
+
+    @staticmethod
+    def map_read_only(file_path, mapped):
+
+        mapped.flush()
+        del mapped
+
+        mapped = np.load(file_path, mmap_mode='r')
+
+        # Where the OS allows it, unlinking now means the file disappears once the last mapping is closed. Otherwise
+        # it stays until the directory is cleared.
+        try:
+            os.remove(file_path)
+
+        except OSError:
+            pass
+
+        return mapped
+
+    def clear(self):
+        if os.path.isdir(self._directory):
+            shutil.rmtree(self._directory, ignore_errors=True)
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from data_flow.chunked_array import ChunkedArray
+
+__all__ = ['ParseCache']
+
+
+class ParseCache:
+
+    # Parsed columns of data files kept on disk between sessions, one .npy file
+    # per column, so a file that was parsed before is loaded by memory-mapping
+    # its columns instead of being parsed again. Entries are keyed by the
+    # file's fingerprint digest, the loader and the load options that change
+    # the parsed values, and can hold some columns of a file only (those read
+    # so far, when columns are loaded as they are used). Loaders look entries
+    # up through an alias of the file's path and stat, so a file is parsed
+    # while it is hashed and only stored once the digest is known. The least
+    # recently used entries are removed once the cache grows past its size cap.
+
+    manifest_name = 'columns.json'
+
+    # Links from file stats to entries (see alias), one small file each
+    alias_directory = 'aliases'
+
+    # Load options that change where or how samples are stored, not values
+    storage_options = ('scratch_directory', 'chunk_rows', 'lazy_columns')
+
+    def __init__(self, directory, size_cap: int = 2 ** 32):
+        self._directory = directory
+        self._size_cap = size_cap
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def size_cap(self):
+        return self._size_cap
+
+    @staticmethod
+    def value_options(options: dict):
+        return {name: value for name, value in (options or {}).items()
+                if name not in ParseCache.storage_options}
+
+    @staticmethod
+    def describe(description: dict):
+        text = json.dumps(description, sort_keys=True)
+        return hashlib.blake2b(text.encode('utf8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def key(digest: bytes, loader_key: str, options: dict):
+        return ParseCache.describe({
+            'digest': digest.hex(), 'loader': loader_key,
+            'options': ParseCache.value_options(options)})
+
+    def entry_path(self, key):
+        return os.path.join(self._directory, key)
+
+    def read_manifest(self, key):
+        manifest_path = os.path.join(self.entry_path(key), self.manifest_name)
+        with open(manifest_path) as fd:
+            return json.load(fd)
+
+    def load(self, key):
+
+        # {column name: read-only memory-mapped array}, or None if the entry is
+        # missing or unreadable
+        entry_path = self.entry_path(key)
+        try:
+            columns = {
+                column['name']: np.load(
+                    os.path.join(entry_path, column['file']), mmap_mode='r')
+                for column in self.read_manifest(key)['columns']}
+
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        # The manifest's modification time orders entries for eviction
+        try:
+            os.utime(os.path.join(entry_path, self.manifest_name))
+
+        except OSError:
+            pass
+
+        return columns
+
+    @staticmethod
+    def storable(array):
+        # Text columns are stored as fixed-width strings, the same conversion
+        # categorical signals apply to mixed ones
+        if isinstance(array, ChunkedArray):
+            return array
+
+        array = np.asarray(array)
+        return array.astype(str) if array.dtype.kind == 'O' else array
+
+    def store(self, key, columns: dict):
+
+        # Adds columns to the entry of key. Each file is written under a
+        # temporary name and renamed, and the manifest that lists them is
+        # replaced last, so a partly written entry is never read.
+        columns = {name: self.storable(array)
+                   for name, array in columns.items()}
+        size = sum(array.nbytes for array in columns.values())
+        if size > self._size_cap:
+            return False
+
+        entry_path = self.entry_path(key)
+
+        try:
+            os.makedirs(entry_path, exist_ok=True)
+
+            try:
+                manifest = self.read_manifest(key)
+
+            except (OSError, ValueError):
+                manifest = {'columns': []}
+
+            stored = {column['name'] for column in manifest['columns']}
+            for name, array in columns.items():
+                if name not in stored:
+                    file_name = self.write_column(entry_path, array)
+                    manifest['columns'].append(
+                        {'name': name, 'file': file_name})
+
+            self.write_atomically(
+                os.path.join(entry_path, self.manifest_name),
+                json.dumps(manifest))
+
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print('Parse cache: ' + str(e))
+            return False
+
+        self.evict()
+
+        return True
+
+    @staticmethod
+    def write_column(entry_path, array):
+
+        # Writes array to a new .npy file in entry_path, returns its name
+        file_name = uuid.uuid4().hex + '.npy'
+        temporary_path = os.path.join(entry_path, file_name + '.tmp')
+
+        try:
+            mapped = np.lib.format.open_memmap(
+                temporary_path, mode='w+', dtype=array.dtype,
+                shape=(len(array),))
+
+            # Chunked columns are written a chunk at a time
+            if isinstance(array, ChunkedArray):
+                start = 0
+                for chunk in array.iterate_chunks():
+                    mapped[start:start + len(chunk)] = chunk
+                    start += len(chunk)
+
+            else:
+                mapped[:] = array
+
+            mapped.flush()
+            del mapped
+
+            os.replace(temporary_path, os.path.join(entry_path, file_name))
+
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+        return file_name
+
+    @staticmethod
+    def write_atomically(path, text):
+        temporary_path = path + '.' + uuid.uuid4().hex + '.tmp'
+        try:
+            with open(temporary_path, 'w') as fd:
+                fd.write(text)
+
+            os.replace(temporary_path, path)
+
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    @staticmethod
+    def alias(path, stat, loader_key: str, options: dict):
+
+        # Name for the entry of a file as it is on disk now, from its path and
+        # stat (see FileFingerprint.stat_key) rather than its digest, so it can
+        # be looked up before the file is hashed
+        return ParseCache.describe({
+            'path': os.path.abspath(path), 'stat': list(stat),
+            'loader': loader_key,
+            'options': ParseCache.value_options(options)})
+
+    def alias_path(self, alias):
+        return os.path.join(self._directory, self.alias_directory, alias)
+
+    def link(self, alias, key):
+        try:
+            os.makedirs(os.path.join(self._directory, self.alias_directory),
+                        exist_ok=True)
+            self.write_atomically(self.alias_path(alias), key)
+
+        except OSError as e:
+            print('Parse cache: ' + str(e))
+
+    def resolve(self, alias):
+        # Key of the entry alias links to, or None
+        try:
+            with open(self.alias_path(alias)) as fd:
+                return fd.read().strip() or None
+
+        except OSError:
+            return None
+
+    def entries(self):
+
+        # [(last use, size in bytes, path)] of every entry
+        entries = []
+        if not os.path.isdir(self._directory):
+            return entries
+
+        for entry in os.scandir(self._directory):
+            manifest_path = os.path.join(entry.path, self.manifest_name)
+            if not entry.is_dir() or not os.path.exists(manifest_path):
+                continue
+
+            size = sum(file.stat().st_size
+                       for file in os.scandir(entry.path) if file.is_file())
+            last_use = os.stat(manifest_path).st_mtime_ns
+            entries.append((last_use, size, entry.path))
+
+        return entries
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+
+        # Removes least recently used entries until the cache fits its cap.
+        # Columns still mapped by loaded signals stay readable: the OS keeps
+        # unlinked files until they are unmapped (where it can't remove them,
+        # they go with a later clear).
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self._size_cap:
+                break
+
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+        self.remove_dangling_aliases()
+
+    def remove_dangling_aliases(self):
+        alias_directory = os.path.join(self._directory, self.alias_directory)
+        if not os.path.isdir(alias_directory):
+            return
+
+        for entry in os.scandir(alias_directory):
+            key = self.resolve(entry.name)
+            if key is None or not os.path.isdir(self.entry_path(key)):
+                try:
+                    os.remove(entry.path)
+
+                except OSError:
+                    pass
+
+    def clear(self):
+        if os.path.isdir(self._directory):
+            shutil.rmtree(self._directory, ignore_errors=True)
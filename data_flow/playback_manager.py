@@ -1,3 +1,4 @@
+from data_flow.cursor import SignalCursor
 from utilities.worker import TimerWorker
 from PyQt5 import QtCore, QtGui, QtWidgets
 import time
@@ -29,6 +30,9 @@ class PlaybackManager(QtWidgets.QWidget):
         self.slider_time_end_s = None
         self.slider_time_skip_s = 1.0
 
+        # Evaluates the signals of all animations at the playback time, see AbstractAnimation.get_cursor_values
+        self.cursor = SignalCursor()
+
         # Background timer always running for animations and stuff
         self.thread_pool = QtCore.QThreadPool()
 
@@ -70,6 +74,8 @@ class PlaybackManager(QtWidgets.QWidget):
 
             deleted_display_keys = []
 
+            self.update_cursor_signals()
+
             for key, display in self.controller.animations.items():
                 if display is not source:
                     try:
@@ -81,6 +87,17 @@ class PlaybackManager(QtWidgets.QWidget):
             for key in deleted_display_keys:
                 self.controller.animations.pop(key)
 
+    def update_cursor_signals(self):
+        signals = []
+        for display in self.controller.animations.values():
+            try:
+                signals.extend(display.animated_signals.values())
+
+            except (RuntimeError, AttributeError):
+                pass
+
+        self.cursor.set_signals(signals)
+
     def time_passed(self, time_step):
         # When thread process propagated signal_time_passed _signal to GUI this process is called.
         if self.play_status:
@@ -0,0 +1,187 @@
+import numpy as np
+
+from data_flow.growable_array import GrowableArray
+
+__all__ = ['SignalPyramid']
+
+
+class SignalPyramid:
+
+    # Multi-resolution summary of a sample array. Level k splits the samples into blocks of block_size ** (k + 1)
+    # samples and stores the min, max and mean of every block, so any zoom level can be answered by reading the one
+    # level whose blocks are just smaller than a pixel.
+
+    def __init__(self, length, block_size, levels):
+
+        self._length = length
+        self._block_size = block_size
+        self._levels = levels  # [(mins, maxs, means)] from finest to coarsest
+        self._buffers = None  # [[GrowableArray] * 3] behind _levels once samples have been appended
+
+    @property
+    def length(self):
+        return self._length
+
+    @property
+    def block_size(self):
+        return self._block_size
+
+    @property
+    def level_count(self):
+        return len(self._levels)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for level in self._levels for array in level)
+
+    def samples_per_block(self, level: int):
+        return self._block_size ** (level + 1)
+
+    def level(self, level: int):
+        return self._levels[level]
+
+    def level_for(self, sample_count: int, bucket_count: int):
+
+        # Coarsest level that still has at least one block per bucket, or None if the raw samples are coarse enough
+        chosen = None
+        for level in range(self.level_count):
+            if self.samples_per_block(level) * bucket_count > sample_count:
+                break
+
+            chosen = level
+
+        return chosen
+
+    def read(self, level: int, start_index: int, end_index: int):
+
+        # Blocks of the given level covering samples [start_index, end_index)
+        samples_per_block = self.samples_per_block(level)
+        start_block = start_index // samples_per_block
+        end_block = -(-end_index // samples_per_block)
+
+        mins, maxs, means = self._levels[level]
+        block_starts = np.arange(start_block, min(end_block, len(mins))) * samples_per_block
+
+        return block_starts, mins[start_block:end_block], maxs[start_block:end_block], means[start_block:end_block]
+
+    # Raw samples reduced per slice while building the finest level
+    chunk_blocks = 2 ** 16
+
+    @staticmethod
+    def reduce(mins: np.array, block_size: int, maxs: np.array = None, sums: np.array = None, counts: np.array = None):
+
+        # One level up: pads the last partial block by repeating its final element (which changes neither its min nor
+        # its max) and weights means by the number of samples actually in each block. Without maxs, sums and counts
+        # the input is raw samples.
+        block_count = -(-len(mins) // block_size)
+        padding = block_count * block_size - len(mins)
+
+        if maxs is None:
+            sums = np.pad(mins, (0, padding)).reshape(block_count, block_size).sum(axis=1, dtype=np.float64)
+            counts = np.full(block_count, block_size, dtype=np.int64)
+            counts[-1] -= padding
+            maxs = mins
+
+        else:
+            sums = np.pad(sums, (0, padding)).reshape(block_count, block_size).sum(axis=1)
+            counts = np.pad(counts, (0, padding)).reshape(block_count, block_size).sum(axis=1)
+
+        mins = np.pad(mins, (0, padding), mode='edge').reshape(block_count, block_size).min(axis=1)
+        maxs = np.pad(maxs, (0, padding), mode='edge').reshape(block_count, block_size).max(axis=1)
+
+        return mins, maxs, sums, counts
+
+    @staticmethod
+    def build(value_array: np.array, block_size=16, min_block_count=64):
+
+        # Each level is reduced from the one below it with a single reshape
+        length = len(value_array)
+        if length < block_size * min_block_count:
+            return SignalPyramid(length, block_size, [])
+
+        # The finest level is reduced from the raw samples a slice at a time, so that memory-mapped samples never
+        # have to be copied into memory as a whole
+        mins, maxs, sums, counts = [], [], [], []
+        for start in range(0, length, SignalPyramid.chunk_blocks * block_size):
+            chunk = np.asarray(value_array[start:start + SignalPyramid.chunk_blocks * block_size])
+            chunk_mins, chunk_maxs, chunk_sums, chunk_counts = SignalPyramid.reduce(chunk, block_size)
+
+            mins.append(chunk_mins)
+            maxs.append(chunk_maxs)
+            sums.append(chunk_sums)
+            counts.append(chunk_counts)
+
+        mins, maxs, sums, counts = (np.concatenate(arrays) for arrays in (mins, maxs, sums, counts))
+        levels = [(mins, maxs, (sums / counts).astype(np.float32))]
+
+        while len(mins) >= block_size * min_block_count:
+            mins, maxs, sums, counts = SignalPyramid.reduce(mins, block_size, maxs, sums, counts)
+            levels.append((mins, maxs, (sums / counts).astype(np.float32)))
+
+        return SignalPyramid(length, block_size, levels)
+
+    def extend(self, value_array: np.array, min_block_count=64):
+
+        # Brings the pyramid up to date after samples were appended to value_array. Only the last block of each level
+        # (which may have been partial) and the blocks after it are reduced again, so the cost depends on the number
+        # of new samples. Means of coarser levels are merged from the float32 means below them.
+        length = len(value_array)
+        block_size = self._block_size
+
+        if self._buffers is None:
+            self._buffers = [[GrowableArray(array) for array in level] for level in self._levels]
+
+        first_block = self._length // block_size
+        mins, maxs, sums, counts = SignalPyramid.reduce(
+            np.asarray(value_array[first_block * block_size:length]), block_size)
+
+        level = 0
+        while True:
+            if level == len(self._buffers):
+                self._buffers.append([GrowableArray(np.empty(0, dtype=array.dtype)) for array in (mins, maxs)] +
+                                     [GrowableArray(np.empty(0, dtype=np.float32))])
+
+            for buffer, array in zip(self._buffers[level], (mins, maxs, (sums / counts).astype(np.float32))):
+                buffer.truncate(first_block)
+                buffer.extend(array)
+
+            level_mins, level_maxs, level_means = (buffer.array for buffer in self._buffers[level])
+            if level + 1 == len(self._buffers) and len(level_mins) < block_size * min_block_count:
+                break
+
+            # Blocks of the next level from the first one holding a changed block of this level
+            first_block = first_block // block_size if level + 1 < len(self._buffers) else 0
+            samples_per_block = self.samples_per_block(level)
+            children = np.arange(first_block * block_size, len(level_mins))
+            child_counts = np.minimum(samples_per_block, length - children * samples_per_block)
+
+            mins, maxs, sums, counts = SignalPyramid.reduce(
+                level_mins[children[0]:], block_size, level_maxs[children[0]:],
+                level_means[children[0]:] * child_counts.astype(np.float64), child_counts)
+
+            level += 1
+
+        self._levels = [tuple(buffer.array for buffer in buffers) for buffers in self._buffers]
+        self._length = length
+
+        return self
+
+    def to_arrays(self, prefix=''):
+        arrays = {prefix + 'shape': np.array([self._length, self._block_size])}
+        for level, (mins, maxs, means) in enumerate(self._levels):
+            arrays[prefix + str(level) + '_min'] = mins
+            arrays[prefix + str(level) + '_max'] = maxs
+            arrays[prefix + str(level) + '_mean'] = means
+
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays, prefix=''):
+        length, block_size = arrays[prefix + 'shape']
+
+        levels = []
+        while prefix + str(len(levels)) + '_min' in arrays:
+            level = prefix + str(len(levels))
+            levels.append((arrays[level + '_min'], arrays[level + '_max'], arrays[level + '_mean']))
+
+        return SignalPyramid(int(length), int(block_size), levels)
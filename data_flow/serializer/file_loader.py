@@ -5,6 +5,7 @@ from PyQt5 import QtWidgets, QtCore
 
 from data_flow.serializer.import_popup import ImportPopup
 
+from data_flow.dtype_policy import DtypePolicy
 from data_flow.serializer.file_type import AbstractFileType
 from plugins.file_types.csv import CSV
 
@@ -78,6 +79,29 @@ class FileLoader:
 
         self.update_file_browsing_rows()
 
+    @property
+    def load_options(self) -> dict:
+        options = {}
+        if self.controller.settings.scratch_directory:
+            options['scratch_directory'] = self.controller.settings.scratch_directory
+
+        if self.controller.settings.chunk_rows:
+            options['chunk_rows'] = self.controller.settings.chunk_rows
+
+        if self.controller.settings.lazy_columns:
+            options['lazy_columns'] = True
+
+        options['dtype_policy'] = DtypePolicy(
+            downcast_integers=self.controller.settings.downcast_integers,
+            float32=self.controller.settings.float32_samples,
+        ).generate_json_dict()
+
+        # Not a load option the data set keeps: it holds on to the cache itself
+        if self.controller.parse_cache is not None:
+            options['parse_cache'] = self.controller.parse_cache
+
+        return options
+
     @property
     def valid_files(self) -> [str]:
         return self._valid_files
@@ -180,10 +204,11 @@ class FileLoader:
             self.controller.settings.set_default_path_data_for(self.path_data, self.file_format.key)
             if self.file_format.extension_format:
                 self.controller.settings.set_default_path_format_for(self.path_format, self.file_format.key)
-                self.controller.data_store.add_data_set(self.file_format.load(self.path_data, self.path_format))
+                self.controller.data_store.add_data_set(
+                    self.file_format.load(self.path_data, self.path_format, **self.load_options))
 
             else:
-                self.controller.data_store.add_data_set(self.file_format.load(self.path_data))
+                self.controller.data_store.add_data_set(self.file_format.load(self.path_data, **self.load_options))
 
         self.popup.close()
 
@@ -48,6 +48,11 @@ class AbstractFileType:
     def load(self, *args, **kwargs):
         raise NotImplementedError
 
+    def read_rows(self, path_data, offset):
+        # ({column name: values}, end offset) of the complete rows from byte offset on, for loaders that can read the
+        # rows appended to a file (see DataSet.append_rows)
+        raise NotImplementedError
+
     def num_files_required_to_view(self):
         return 1 if self.extension_str_format is None else 2
 
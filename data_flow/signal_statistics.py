@@ -0,0 +1,368 @@
+import numpy as np
+
+__all__ = ['SignalStatistics']
+
+
+class SignalStatistics:
+
+    # Boolean, unsigned integer, signed integer, float
+    _NUMERIC_KINDS = set('buif')
+
+    # Chunked reduction: samples read per chunk, bins per histogram pass, and most samples gathered in memory at once
+    chunk_size = 2 ** 20
+    histogram_bins = 4096
+    gather_limit = 2 ** 22
+
+    def __init__(self, count=0, min_value=None, max_value=None, avg=None, med=None, mode=None, std=None,
+                 order_statistics=None):
+
+        self._count = count
+        self._min = min_value
+        self._max = max_value
+        self._avg = avg
+        self._med = med
+        self._mode = mode
+        self._std = std
+
+        # Callable returning SignalStatistics that median and mode are taken from when first asked for
+        self._order_statistics = order_statistics
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def min(self):
+        return self._min
+
+    @property
+    def max(self):
+        return self._max
+
+    @property
+    def avg(self):
+        return self._avg
+
+    @property
+    def med(self):
+        self.resolve_order_statistics()
+        return self._med
+
+    @property
+    def mode(self):
+        self.resolve_order_statistics()
+        return self._mode
+
+    def resolve_order_statistics(self):
+        if self._order_statistics is not None:
+            statistics = self._order_statistics()
+            self._med, self._mode = statistics.med, statistics.mode
+            self._order_statistics = None
+
+    def extended(self, chunk: np.array, order_statistics):
+
+        # Statistics of the samples with chunk appended, from this summary and the chunk alone. Count, extremes and
+        # moments are merged exactly (Chan, Golub and LeVeque, as in from_chunks); median and mode need every sample,
+        # so order_statistics() is called for them when they are first asked for.
+        chunk = np.asarray(chunk)
+        if not len(chunk):
+            return self
+
+        if not self._count:
+            return SignalStatistics.from_samples(chunk)
+
+        if chunk.dtype.kind not in self._NUMERIC_KINDS or self._avg is None or np.isnan(self._avg):
+            return None
+
+        if chunk.dtype.kind == 'b':
+            chunk = chunk.view(np.uint8)
+
+        chunk_min, chunk_max = np.min(chunk), np.max(chunk)
+        if chunk.dtype.kind == 'f' and np.isnan(chunk_min):
+            return SignalStatistics(self._count + len(chunk), np.nan, np.nan, np.nan, np.nan, np.nan, np.nan)
+
+        chunk_count = len(chunk)
+        chunk_avg = np.mean(chunk, dtype=np.float64)
+        chunk_sum_squares = np.sum(np.square(chunk - chunk_avg, dtype=np.float64))
+
+        total = self._count + chunk_count
+        delta = chunk_avg - self._avg
+        sum_squares = np.square(self._std) * self._count + chunk_sum_squares + \
+            delta * delta * self._count * chunk_count / total
+
+        return SignalStatistics(
+            count=total,
+            min_value=min(self._min, chunk_min),
+            max_value=max(self._max, chunk_max),
+            avg=np.float64(self._avg + delta * chunk_count / total),
+            std=np.sqrt(sum_squares / total),
+            order_statistics=order_statistics)
+
+    @property
+    def std(self):
+        return self._std
+
+    @staticmethod
+    def from_samples(value_array: np.array):
+
+        # Every summary statistic is read off a single sorted copy of the samples rather than doing one full-array
+        # reduction per statistic. Min, max and median are order statistics, the mode is the longest run of equal
+        # values, and the moments are accumulated in float64 regardless of the storage type.
+
+        value_array = np.asarray(value_array)
+        count = len(value_array)
+        if not count:
+            return SignalStatistics()
+
+        sorted_values = np.sort(value_array, kind='stable')
+
+        if value_array.dtype.kind not in SignalStatistics._NUMERIC_KINDS:
+            return SignalStatistics(
+                count=count,
+                min_value=np.nan,
+                max_value=np.nan,
+                avg=np.nan,
+                med=np.nan,
+                mode=SignalStatistics.sorted_mode(sorted_values),
+                std=np.nan)
+
+        # NaNs are sorted to the end, and (like np.min, np.mean, ...) they poison every statistic
+        if sorted_values.dtype.kind == 'f' and np.isnan(sorted_values[-1]):
+            return SignalStatistics(count, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan)
+
+        if sorted_values.dtype.kind == 'b':
+            sorted_values = sorted_values.view(np.uint8)
+
+        avg = np.mean(sorted_values, dtype=np.float64)
+
+        return SignalStatistics(
+            count=count,
+            min_value=sorted_values[0],
+            max_value=sorted_values[-1],
+            avg=avg,
+            med=SignalStatistics.sorted_median(sorted_values),
+            mode=SignalStatistics.sorted_mode(sorted_values),
+            std=np.sqrt(np.mean(np.square(sorted_values - avg, dtype=np.float64))))
+
+    @staticmethod
+    def iterate_chunks(value_array: np.array, chunk_size: int = None):
+        chunk_size = chunk_size or SignalStatistics.chunk_size
+        for start in range(0, len(value_array), chunk_size):
+            yield value_array[start:start + chunk_size]
+
+    @staticmethod
+    def from_chunks(get_chunks):
+
+        # Bounded-memory variant of from_samples for samples that are not held in memory (memory-mapped or chunked
+        # storage). get_chunks() must return a fresh iterator over the chunks each time it's called, because the data
+        # is read more than once. Moments are merged chunk by chunk, the median is found exactly by narrowing a
+        # histogram until the samples around it fit in memory, and the mode is exact for integers but only estimated
+        # from the fullest histogram bin for floats.
+
+        count = 0
+        min_value = max_value = None
+        avg = 0.0
+        sum_squares = 0.0
+        kind = None
+
+        for chunk in get_chunks():
+            chunk = np.asarray(chunk)
+            if not len(chunk):
+                continue
+
+            kind = chunk.dtype.kind
+            if kind not in SignalStatistics._NUMERIC_KINDS:
+                return SignalStatistics(count + len(chunk), np.nan, np.nan, np.nan, np.nan, None, np.nan)
+
+            if kind == 'b':
+                chunk = chunk.view(np.uint8)
+
+            chunk_min = np.min(chunk)
+            chunk_max = np.max(chunk)
+            if kind == 'f' and np.isnan(chunk_min):
+                return SignalStatistics(count + len(chunk), np.nan, np.nan, np.nan, np.nan, np.nan, np.nan)
+
+            # Pairwise update of mean and sum of squared deviations (Chan, Golub and LeVeque)
+            chunk_count = len(chunk)
+            chunk_avg = np.mean(chunk, dtype=np.float64)
+            chunk_sum_squares = np.sum(np.square(chunk - chunk_avg, dtype=np.float64))
+
+            total = count + chunk_count
+            delta = chunk_avg - avg
+            avg += delta * chunk_count / total
+            sum_squares += chunk_sum_squares + delta * delta * count * chunk_count / total
+            count = total
+
+            min_value = chunk_min if min_value is None else min(min_value, chunk_min)
+            max_value = chunk_max if max_value is None else max(max_value, chunk_max)
+
+        if not count:
+            return SignalStatistics()
+
+        def numeric_chunks():
+            for numeric_chunk in get_chunks():
+                numeric_chunk = np.asarray(numeric_chunk)
+                yield numeric_chunk.view(np.uint8) if numeric_chunk.dtype.kind == 'b' else numeric_chunk
+
+        lower = SignalStatistics.chunked_order_statistic(numeric_chunks, (count - 1) // 2, min_value, max_value)
+        upper = lower if count % 2 else \
+            SignalStatistics.chunked_order_statistic(numeric_chunks, count // 2, min_value, max_value)
+
+        return SignalStatistics(
+            count=count,
+            min_value=min_value,
+            max_value=max_value,
+            avg=np.float64(avg),
+            med=(np.float64(lower) + np.float64(upper)) / 2.0,
+            mode=SignalStatistics.chunked_mode(numeric_chunks, kind, min_value, max_value),
+            std=np.sqrt(sum_squares / count))
+
+    @staticmethod
+    def histogram_bin(values: np.array, low: float, high: float, bins: int):
+        if not high > low:
+            return np.zeros(len(values), dtype=np.intp)
+
+        scale = bins / (high - low)
+        return np.clip(((values - low) * scale).astype(np.intp), 0, bins - 1)
+
+    @staticmethod
+    def narrow_histogram(get_chunks, low, high, choose_bin):
+
+        # Repeatedly histograms the samples that are still candidates and keeps only the bin picked by choose_bin
+        # until the candidates fit in memory, then returns them with the number of samples below them. Candidates are
+        # identified by replaying the bins chosen in every previous pass, so rounding at bin edges can't lose any.
+        bins = SignalStatistics.histogram_bins
+        filters = []  # [(low, high, bin)]
+        below = 0
+
+        def candidates(chunk):
+            for filter_low, filter_high, filter_bin in filters:
+                chunk = chunk[SignalStatistics.histogram_bin(chunk, filter_low, filter_high, bins) == filter_bin]
+
+            return chunk
+
+        while True:
+            counts = np.zeros(bins, dtype=np.int64)
+            candidate_min = candidate_max = None
+
+            for chunk in get_chunks():
+                chunk = candidates(chunk)
+                if len(chunk):
+                    candidate_min = np.min(chunk) if candidate_min is None else min(candidate_min, np.min(chunk))
+                    candidate_max = np.max(chunk) if candidate_max is None else max(candidate_max, np.max(chunk))
+                    counts += np.bincount(SignalStatistics.histogram_bin(chunk, low, high, bins), minlength=bins)
+
+            # All remaining candidates are equal, so there's nothing left to resolve
+            if candidate_min is None or candidate_min == candidate_max:
+                return np.array([candidate_min if candidate_min is not None else low]), below
+
+            if np.sum(counts) <= SignalStatistics.gather_limit:
+                break
+
+            chosen = choose_bin(counts, below)
+            below += int(np.sum(counts[:chosen]))
+            filters.append((low, high, chosen))
+
+            width = (high - low) / bins
+            low, high = low + chosen * width, low + (chosen + 1) * width
+
+        return np.sort(np.concatenate([candidates(chunk) for chunk in get_chunks()])), below
+
+    @staticmethod
+    def chunked_order_statistic(get_chunks, rank: int, min_value, max_value):
+
+        # The rank-th smallest sample (0-based)
+        def bin_holding_rank(counts, below):
+            return int(np.searchsorted(np.cumsum(counts), rank - below, side='right'))
+
+        candidates, below = SignalStatistics.narrow_histogram(
+            get_chunks, np.float64(min_value), np.float64(max_value), bin_holding_rank)
+
+        return candidates[min(max(rank - below, 0), len(candidates) - 1)]
+
+    @staticmethod
+    def chunked_mode(get_chunks, kind, min_value, max_value):
+
+        # Integers are counted exactly as long as their range is small enough for a bincount
+        if kind in 'biu' and int(max_value) - int(min_value) < SignalStatistics.gather_limit:
+            counts = np.zeros(int(max_value) - int(min_value) + 1, dtype=np.int64)
+            for chunk in get_chunks():
+                # Offsets in int64: in the stored type (int8, say) they can overflow
+                counts += np.bincount(chunk.astype(np.int64) - int(min_value), minlength=len(counts))
+
+            return (np.int64(min_value) + np.argmax(counts)).astype(np.dtype(type(min_value)))
+
+        # Floats: most common value within the densest region of the histogram
+        candidates, _ = SignalStatistics.narrow_histogram(
+            get_chunks, np.float64(min_value), np.float64(max_value), lambda counts, below: int(np.argmax(counts)))
+
+        return SignalStatistics.sorted_mode(candidates)
+
+    @staticmethod
+    def from_weighted_values(values: np.array, weights: np.array):
+
+        # Statistics of a distribution given as sorted distinct values and how much of the signal each one covers.
+        # Integer weights are sample counts (categorical codes), float weights are durations.
+
+        values = np.asarray(values)
+        weights = np.asarray(weights)
+
+        present = weights > 0
+        values = values[present]
+        weights = weights[present]
+
+        if not len(values):
+            return SignalStatistics()
+
+        count = int(np.sum(weights)) if weights.dtype.kind in 'biu' else float(np.sum(weights))
+        mode = values[np.argmax(weights)]
+
+        if values.dtype.kind not in SignalStatistics._NUMERIC_KINDS:
+            return SignalStatistics(count, np.nan, np.nan, np.nan, np.nan, mode, np.nan)
+
+        if values.dtype.kind == 'b':
+            values = values.view(np.uint8)
+
+        cumulative = np.cumsum(weights)
+        total = cumulative[-1]
+
+        if weights.dtype.kind in 'biu':
+            # Same convention as np.median: middle sample, or the mean of the two middle samples
+            lower = values[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+            upper = values[np.searchsorted(cumulative, total // 2, side='right')]
+            med = (np.float64(lower) + np.float64(upper)) / 2.0
+
+        else:
+            med = np.float64(values[min(np.searchsorted(cumulative, total / 2.0), len(values) - 1)])
+
+        values_64 = values.astype(np.float64)
+        avg = np.sum(values_64 * weights) / np.float64(total)
+
+        return SignalStatistics(
+            count=count,
+            min_value=values[0],
+            max_value=values[-1],
+            avg=avg,
+            med=med,
+            mode=mode,
+            std=np.sqrt(np.sum(weights * np.square(values_64 - avg)) / np.float64(total)))
+
+    @staticmethod
+    def sorted_median(sorted_values: np.array):
+        count = len(sorted_values)
+        middle = count // 2
+
+        if count % 2:
+            return np.float64(sorted_values[middle])
+
+        else:
+            return (np.float64(sorted_values[middle - 1]) + np.float64(sorted_values[middle])) / 2.0
+
+    @staticmethod
+    def sorted_mode(sorted_values: np.array):
+
+        # Start index of each run of equal values. Ties resolve to the smallest value, matching scipy.stats.mode
+        run_starts = np.concatenate(([0], np.flatnonzero(sorted_values[1:] != sorted_values[:-1]) + 1))
+        run_lengths = np.diff(np.concatenate((run_starts, [len(sorted_values)])))
+
+        return sorted_values[run_starts[np.argmax(run_lengths)]]
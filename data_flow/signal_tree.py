@@ -1,4 +1,4 @@
-from PyQt5 import QtWidgets, QtCore
+from PyQt5 import QtWidgets, QtCore, QtGui
 
 from data_flow.signals import Signal
 from data_flow.data_set import DataSet
@@ -206,6 +206,11 @@ class SignalTree(QtWidgets.QWidget):
                 properties = value.get_property_strings(property_keys)
                 parent = QtWidgets.QTreeWidgetItem(tree, [key, *properties])
 
+                # Columns that are read when first used are greyed out until then
+                if not value.is_loaded:
+                    parent.setForeground(0, QtGui.QBrush(QtCore.Qt.gray))
+                    parent.setToolTip(0, 'Not loaded yet: read from the file when first used')
+
             else:
                 parent = QtWidgets.QTreeWidgetItem(tree, [key])
                 parent.setFlags(parent.flags() & ~QtCore.Qt.ItemIsSelectable)
@@ -1,12 +1,41 @@
+import sys
+
 import numpy as np
-import scipy.stats as st
 from scipy import interpolate
-__all__ = ['SignalGenerator', 'Signal', 'FloatTimeSeries', 'NonNumericTimeSeries',
-           'AbstractInterpolatedSignal']
+
+from data_flow.array_checksum import ArrayChecksum
+from data_flow.chunked_array import ChunkedArray
+from data_flow.decimation import Decimation
+from data_flow.growable_array import GrowableArray
+from data_flow.pyramid import SignalPyramid
+from data_flow.signal_statistics import SignalStatistics
+from data_flow.time_base import TimeBase
+from utilities.lru_cache import LRUCache
+
+__all__ = ['SignalGenerator', 'Signal', 'FloatTimeSeries', 'IntegerTimeSeries',
+           'NonNumericTimeSeries', 'AbstractInterpolatedSignal', 'PathPrefix',
+           'UnloadedSignal']
+
+
+class PathPrefix:
+
+    # First path segment (the data set name) shared by every signal of a data
+    # set, so renaming the data set is a single assignment rather than a
+    # rewrite of each signal's path
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = sys.intern(name)
 
 
 class Signal:
 
+    # Workspaces can hold a very large number of signals, so instances carry no
+    # __dict__. Subclasses must declare __slots__ for any attribute they add.
+    __slots__ = ('_value_array', '_value_units', '_prefix', '_group_tokens',
+                 '_name', '_statistics', '_buffer', '_checksum')
+
     si_prefixes = {
         -24: 'y',
         -21: 'z',
@@ -26,16 +55,42 @@ class Signal:
         24: 'Y',
     }
 
+    # Keys of the properties dict, available without computing any statistics
+    _property_keys = ('Min', 'Avg', 'Med', 'Mode', 'Max', 'Std', 'Units')
+
+    # One shared tuple per distinct parent path ({tokens: tokens}), so signals
+    # of the same group share it
+    _group_tokens_cache = {}
+
     def __init__(self, value_array, value_units=None, signal_path=''):
 
-        self._value_array = np.array(value_array)
+        # Arrays (including np.memmap and other buffer-backed arrays) and
+        # chunked arrays are used as they are, without a copy
+        self._value_array = value_array \
+            if isinstance(value_array, ChunkedArray) \
+            else np.asanyarray(value_array)
         self._value_units = value_units
-        self._path = signal_path
-        self._name = signal_path.split('/')[-1]
+
+        # Data set and group names repeat across thousands of signals, so the
+        # path is kept as a shared tuple of interned parent segments plus the
+        # signal's own name
+        path_tokens = signal_path.split('/')
+        self._prefix = None
+        self._group_tokens = Signal.shared_group_tokens(path_tokens[:-1])
+        self._name = sys.intern(path_tokens[-1])
+        self._statistics = None
+        # GrowableArray that _value_array views once samples were appended
+        self._buffer = None
+        self._checksum = None
+
+    @staticmethod
+    def shared_group_tokens(tokens):
+        tokens = tuple(sys.intern(token) for token in tokens)
+        return Signal._group_tokens_cache.setdefault(tokens, tokens)
 
     @property
     def property_keys(self):
-        return self.properties.keys()
+        return Signal._property_keys
 
     @property
     def properties(self):
@@ -50,11 +105,15 @@ class Signal:
         }
 
     def get_property_strings(self, keys, float_format=None):
-        return [self.get_property_string(key, float_format) for key in keys] if keys else []
 
-    def get_property_string(self, key, float_format=None):
+        # Build the property dict once per row instead of once per column
+        properties = self.properties if keys else None
+        return [self.get_property_string(key, float_format, properties)
+                for key in keys] if keys else []
+
+    def get_property_string(self, key, float_format=None, properties=None):
         float_format = '{:0.1f}' or float_format
-        value = self.properties.get(key)
+        value = (properties or self.properties).get(key)
         if SignalGenerator.is_float(value):
             e_count = 0
             if np.abs(value) > 1000.0:
@@ -76,29 +135,118 @@ class Signal:
         else:
             return str(value)
 
+    @property
+    def statistics(self) -> SignalStatistics:
+
+        # Computed on first use and kept until the samples change
+        if self._statistics is None:
+            self._statistics = self.compute_statistics()
+
+        return self._statistics
+
+    def compute_statistics(self) -> SignalStatistics:
+
+        # Chunked and mapped samples are reduced chunk by chunk rather than
+        # copied into memory to be sorted
+        if self.is_chunked:
+            return SignalStatistics.from_chunks(
+                self._value_array.iterate_chunks)
+
+        if self.is_memory_mapped:
+            return SignalStatistics.from_chunks(
+                lambda: SignalStatistics.iterate_chunks(self._value_array))
+
+        return SignalStatistics.from_samples(self._value_array)
+
+    @property
+    def checksum(self):
+
+        # Digest of the stored samples, computed on first use and kept until
+        # they change. Compared on refresh, see DataSet.take_over_unchanged
+        if self._checksum is None:
+            self._checksum = self.compute_checksum()
+
+        return self._checksum
+
+    def compute_checksum(self):
+        return ArrayChecksum.digest(self._value_array)
+
+    @property
+    def is_memory_mapped(self):
+        return isinstance(self._value_array, np.memmap)
+
+    @property
+    def is_chunked(self):
+        return isinstance(self._value_array, ChunkedArray)
+
+    @property
+    def is_loaded(self):
+        # False for columns registered by name only, see UnloadedSignal
+        return True
+
+    @property
+    def is_out_of_core(self):
+        # Samples that are not all held in process memory, so must only ever be
+        # read a slice at a time
+        return self.is_memory_mapped or self.is_chunked
+
+    def samples_changed(self):
+        # Must be called whenever _value_array is modified so that cached
+        # results are rebuilt
+        self._statistics = None
+        self._checksum = None
+
+    def extend_values(self, values):
+
+        # Appends to the stored values. The first append copies them into a
+        # GrowableArray (chunked arrays are appended to as they are), later
+        # ones take time in the number of new values only.
+        if self.is_chunked:
+            self._value_array.append(values)
+            return
+
+        if self._buffer is None:
+            self._buffer = GrowableArray(self._value_array)
+
+        self._value_array = self._buffer.extend(values)
+
+    def append_samples(self, values):
+
+        # Samples recorded after the existing ones (see DataSet.append_rows).
+        # Statistics that were already computed are updated from the new
+        # samples instead of being computed again.
+        statistics = self._statistics
+
+        self.extend_values(values)
+        self.samples_changed()
+
+        if statistics is not None:
+            self._statistics = statistics.extended(
+                values, self.compute_statistics)
+
     @property
     def min(self):
-        return np.min(self._value_array) if len(self._value_array) else None
+        return self.statistics.min
 
     @property
     def max(self):
-        return np.max(self._value_array) if len(self._value_array) else None
+        return self.statistics.max
 
     @property
     def avg(self):
-        return np.mean(self._value_array) if len(self._value_array) else None
+        return self.statistics.avg
 
     @property
     def med(self):
-        return np.median(self._value_array) if len(self._value_array) else None
+        return self.statistics.med
 
     @property
     def mode(self):
-        return st.mode(self._value_array)[0][0] if len(self._value_array) else None
+        return self.statistics.mode
 
     @property
     def std(self):
-        return np.std(self._value_array) if len(self._value_array) else None
+        return self.statistics.std
 
     @property
     def samples(self):
@@ -110,7 +258,26 @@ class Signal:
 
     @property
     def path(self):
-        return self._path
+        return '/'.join(self.path_tokens)
+
+    @property
+    def path_tokens(self):
+        if self._prefix is not None:
+            return (self._prefix.name,) + self._group_tokens + (self._name,)
+
+        return self._group_tokens + (self._name,)
+
+    def set_prefix(self, prefix: PathPrefix):
+        # From then on the first segment of the path is read from prefix, see
+        # PathPrefix. A signal taken over by another data set follows that
+        # one's prefix.
+        if self._prefix is not None:
+            self._prefix = prefix
+
+        elif self._group_tokens and self._group_tokens[0] == prefix.name:
+            self._group_tokens = Signal.shared_group_tokens(
+                self._group_tokens[1:])
+            self._prefix = prefix
 
     @property
     def name(self):
@@ -122,48 +289,218 @@ class Signal:
 
     def change_data_set_name(self, value):
 
-        path_tokens = self._path.split('/')
-        path_tokens[0] = value
+        # Renames this signal alone; one that shares a prefix leaves it
+        if self._prefix is not None:
+            self._group_tokens = Signal.shared_group_tokens(
+                (value,) + self._group_tokens)
+            self._prefix = None
+
+        elif self._group_tokens:
+            self._group_tokens = Signal.shared_group_tokens(
+                (value,) + self._group_tokens[1:])
 
-        self._path = '/'.join(path_tokens)
+        else:
+            self._name = sys.intern(value)
 
 
 class AbstractInterpolatedSignal(Signal):
 
+    __slots__ = ('_time_base', '_time_units', '_interp_factor',
+                 '_interpolation', '_evaluation_cache', '_pyramid',
+                 '_revision')
+
+    # Evaluated time grids kept per signal, and the bytes they may take. A
+    # dense grid of a long signal (length * interp_factor points) would
+    # otherwise keep hundreds of MB per entry; larger results are not kept.
+    evaluation_cache_size = 4
+    evaluation_cache_nbytes = 2 ** 25
+
+    # Samples decimated at once when they are not all held in memory
+    decimation_chunk_size = 2 ** 20
+
     def __init__(self, time_array, *args, time_units='s', interp_factor=100.0, **kwargs):
         super(AbstractInterpolatedSignal, self).__init__(*args, **kwargs)
 
         assert len(time_array) == self.length
 
-        self._time_array = np.array(time_array)
+        # Signals of a data set that share a time column share one TimeBase
+        # instead of each holding a copy
+        self._time_base = time_array if isinstance(time_array, TimeBase) \
+            else TimeBase(time_array)
         self._time_units = time_units
 
         self._interp_factor = interp_factor
-        self._interpolation = self.interpolate()
+
+        # Both are built on first use by evaluate_interpolation
+        self._interpolation = None
+        self._evaluation_cache = None
+
+        # Optional min/max/mean pyramid, built in the background by
+        # DataSet.build_pyramids
+        self._pyramid = None
+
+        self._revision = 0
+
+    @property
+    def time_base(self) -> TimeBase:
+        return self._time_base
 
     @property
     def time_array(self):
-        return self._time_array
+        return self._time_base.array
+
+    def share_time_base(self, time_base: TimeBase):
+        # Points the signal at an equal time base (same time stamps), so that
+        # the signals of a data set share one
+        assert time_base.length == self._time_base.length
+        self._time_base = time_base
 
     @property
     def time_unit(self):
-        return self.time_unit
+        return self._time_units
 
     @property
     def t_start(self):
-        return min(self._time_array)
+        return self._time_base.t_start
 
     @property
     def t_end(self):
-        return max(self._time_array)
+        return self._time_base.t_end
 
     @staticmethod
-    def get_index_after_time(time_array: np.array, eval_time: float):
-        return np.searchsorted(time_array, eval_time)
+    def get_index_after_time(time_array: np.array, eval_time: float,
+                             side='left'):
+        return np.searchsorted(time_array, eval_time, side=side)
+
+    def window_indices(self, t_start: float = None, t_end: float = None):
+
+        # Index range [start, end) of the samples recorded between t_start and
+        # t_end inclusive, found with two binary searches
+        start_index = 0 if t_start is None else \
+            int(self._time_base.index_after_time(t_start))
+        end_index = self.length if t_end is None else \
+            int(self._time_base.index_after_time(t_end, 'right'))
+
+        return start_index, max(start_index, end_index)
+
+    def window(self, t_start: float = None, t_end: float = None):
+
+        # Time and stored values between t_start and t_end as views into the
+        # signal's arrays, not copies. For categorical signals the values are
+        # the category codes (see decode_samples).
+        start_index, end_index = self.window_indices(t_start, t_end)
+
+        return self._time_base.window(start_index, end_index), \
+            self.stored_values(start_index, end_index)
+
+    def stored_values(self, start_index: int, end_index: int):
+        # Stored values of samples [start_index, end_index), as a view unless a
+        # subclass stores samples differently
+        return self._value_array[start_index:end_index]
+
+    def iterate_windows(self, duration: float, t_start: float = None,
+                        t_end: float = None):
+
+        # Walks the signal in consecutive windows of the given duration,
+        # yielding (time, values) views. Each sample is yielded exactly once:
+        # windows are half-open except for the last one.
+        if duration <= 0:
+            raise ValueError('Window duration must be positive')
+
+        if not self.length:
+            return
+
+        t_start = self.t_start if t_start is None else t_start
+        start_index, end_index = self.window_indices(t_start, t_end)
+
+        while start_index < end_index:
+
+            # Jumping straight to the window holding the next sample skips over
+            # gaps in the recording
+            elapsed = self._time_base.times_at(start_index) - t_start
+            window_count = np.floor(elapsed / duration) + 1
+            window_end = t_start + window_count * duration
+            stop_index = int(self._time_base.index_after_time(window_end))
+            stop_index = min(max(stop_index, start_index + 1), end_index)
+
+            yield self._time_base.window(start_index, stop_index), \
+                self.stored_values(start_index, stop_index)
+
+            start_index = stop_index
+
+    @property
+    def interpolation(self):
+        if self._interpolation is None:
+            self._interpolation = self.interpolate()
+
+        return self._interpolation
 
     def interpolate(self):
         raise NotImplementedError
 
+    @property
+    def revision(self):
+        # Incremented whenever the samples change, so that results computed
+        # from them (derived signals, spectra) notice
+        return self._revision
+
+    def samples_changed(self):
+        super(AbstractInterpolatedSignal, self).samples_changed()
+
+        self._interpolation = None
+        self._evaluation_cache = None
+        self._pyramid = None
+        self._revision += 1
+
+    def append_samples(self, values):
+
+        # The time base must have been extended first. A pyramid is extended
+        # rather than built again.
+        pyramid = self._pyramid
+        super(AbstractInterpolatedSignal, self).append_samples(values)
+
+        if pyramid is not None:
+            self._pyramid = pyramid.extend(self._value_array)
+
+    @property
+    def pyramid(self):
+        return self._pyramid
+
+    @pyramid.setter
+    def pyramid(self, value: SignalPyramid):
+        if value is not None and value.length != self.length:
+            raise ValueError('Pyramid of ' + str(value.length) +
+                             ' samples does not fit ' + self.path)
+
+        self._pyramid = value
+
+    @property
+    def pyramid_nbytes(self):
+        return self._pyramid.nbytes if self._pyramid is not None else 0
+
+    def build_pyramid(self, block_size=16):
+
+        # Signals too short to have a single level don't keep an (empty)
+        # pyramid around. Runs in a worker thread: when samples are appended
+        # meanwhile (the revision moved on), the pyramid is stale and
+        # discarded.
+        revision = self._revision
+        pyramid = SignalPyramid.build(self._value_array, block_size)
+        if revision != self._revision:
+            return None
+
+        self._pyramid = pyramid if pyramid.level_count else None
+
+        return self._pyramid
+
+    @staticmethod
+    def time_grid_key(time: np.array):
+        # Identifies a time grid by content, so equal grids from different
+        # redraws share a cache entry. The digest covers type and length too,
+        # and is hashed block by block without copying the grid into one bytes
+        # object.
+        return ArrayChecksum.digest(time)
+
     def evaluate_interpolation(self, time: np.array = None, interp_factor: float = None):
 
         if interp_factor is not None:
@@ -171,95 +508,592 @@ class AbstractInterpolatedSignal(Signal):
 
         # Ensure that interpolation is only valid for recorded time span
         if time is None:
-            time = np.linspace(self.t_start, self.t_end, int(self.length * self._interp_factor))
+            cache_key = ('interp_factor', self._interp_factor)
 
         else:
-
-            # TODO This is untested
-
+            time = np.asarray(time)
             first_valid_index = self.get_index_after_time(time, self.t_start)
             last_valid_index = self.get_index_after_time(time, self.t_end)
             time = time[first_valid_index:last_valid_index]
+            cache_key = self.time_grid_key(time)
+
+        if self._evaluation_cache is None:
+            self._evaluation_cache = LRUCache(
+                self.evaluation_cache_size, self.evaluation_cache_nbytes,
+                lambda entry: entry[0].nbytes + entry[1].nbytes)
 
-        values = self._interpolation(time)
+        cached = self._evaluation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if time is None:
+            time = np.linspace(self.t_start, self.t_end,
+                               int(self.length * self._interp_factor))
+
+        else:
+            # Copied, so the caller's array can't change the cached grid
+            time = np.array(time)
+
+        values = np.asarray(self.interpolation(time))
+
+        # Results are shared between callers, so are never modified in place
+        time.flags.writeable = False
+        values.flags.writeable = False
+        self._evaluation_cache.put(cache_key, (time, values))
+
+        return time, values
+
+    def decode_samples(self, stored_values: np.array):
+        # Converts values taken from _value_array into sample values
+        return stored_values
+
+    def decimate(self, t_start: float = None, t_end: float = None,
+                 pixel_count: int = 1000, method=Decimation.MIN_MAX):
+
+        # Samples between t_start and t_end, reduced to roughly two points per
+        # pixel. The neighbouring sample on each side of the window is included
+        # so that lines run to the edges of the view.
+
+        start_index, end_index = self.window_indices(t_start, t_end)
+        start_index = max(start_index - 1, 0)
+        end_index = min(end_index + 1, self.length)
+
+        # With a pyramid, the min/max envelope is read from the coarsest level
+        # that still resolves a pixel
+        pyramid = self._pyramid
+        level = pyramid.level_for(end_index - start_index, pixel_count) \
+            if pyramid is not None and method == Decimation.MIN_MAX else None
+
+        if level is not None:
+            block_starts, mins, maxs, _ = pyramid.read(
+                level, start_index, end_index)
+
+            envelope = np.empty(2 * len(mins), dtype=mins.dtype)
+            envelope[0::2] = mins
+            envelope[1::2] = maxs
+
+            time, values = Decimation.min_max(
+                np.repeat(self._time_base.times_at(block_starts), 2),
+                envelope, pixel_count)
+
+            return time, self.decode_samples(values)
+
+        if self.is_out_of_core and \
+                end_index - start_index > self.decimation_chunk_size:
+            time, values = self.decimate_chunks(
+                start_index, end_index, pixel_count, method)
+
+        else:
+            time, values = Decimation.decimate(
+                self._time_base.window(start_index, end_index),
+                self.stored_values(start_index, end_index),
+                pixel_count, method)
+
+        return time, self.decode_samples(values)
+
+    def decimate_chunks(self, start_index: int, end_index: int,
+                        pixel_count: int, method=Decimation.MIN_MAX):
+
+        # Min/max envelope built a slice at a time. Slices hold whole buckets,
+        # so the envelope is the one a single pass would give. LTTB then picks
+        # its points from the envelope rather than from the raw samples.
+        bucket_size = -(-(end_index - start_index) // max(pixel_count, 1))
+        step = max(1, self.decimation_chunk_size // bucket_size) * bucket_size
+
+        times, values = [], []
+        for start in range(start_index, end_index, step):
+            stop = min(start + step, end_index)
+            chunk_time, chunk_values = Decimation.min_max(
+                self._time_base.window(start, stop),
+                self.stored_values(start, stop),
+                -(-(stop - start) // bucket_size))
+
+            times.append(np.asarray(chunk_time))
+            values.append(np.asarray(chunk_values))
+
+        time, values = np.concatenate(times), np.concatenate(values)
+        if method == Decimation.LTTB:
+            return Decimation.lttb(time, values, 2 * pixel_count)
 
         return time, values
 
 
 class FloatTimeSeries(AbstractInterpolatedSignal):
 
+    __slots__ = ()
+
+    # Samples on each side of a requested span used when building a local
+    # interpolant. PCHIP slopes depend on the neighbouring samples only, so
+    # with this margin a local interpolant matches the global one inside the
+    # span.
+    window_margin = 3
+
     def interpolate(self):
 
+        # A global interpolant would copy memory-mapped or chunked samples into
+        # memory, so those are interpolated per request
+        if self.is_out_of_core:
+            return self.interpolate_window
+
+        if not self.length:
+            return None
+
+        return self.interpolate_samples(self._time_base.array,
+                                        self._value_array)
+
+    @staticmethod
+    def interpolate_samples(time_array: np.array, value_array: np.array):
+
         # Using a one-sided smoothing interpolation to convey time-causality
-        return interpolate.PchipInterpolator(self._time_array, self._value_array) if self.length else None
+        return interpolate.PchipInterpolator(time_array, value_array)
+
+    def interpolate_window(self, time: np.array):
+
+        if not len(time):
+            return np.array([], dtype=np.float64)
+
+        start_index, end_index = self.window_indices(np.min(time),
+                                                     np.max(time))
+        start_index = max(start_index - self.window_margin, 0)
+        end_index = min(end_index + self.window_margin, self.length)
+
+        return self.interpolate_samples(
+            self._time_base.window(start_index, end_index),
+            self.stored_values(start_index, end_index))(time)
 
 
 class IntegerTimeSeries(AbstractInterpolatedSignal):
 
+    __slots__ = ('_unique_values', '_run_starts', '_run_times')
+
+    # Store signals that rarely change value as runs of equal samples, when
+    # that takes less memory than one code per sample
+    run_length_encoding = True
+
     def __init__(self, *args, **kwargs):
+
+        self._unique_values = np.array([])
+        self._run_starts = None
+        self._run_times = None
+
         super(IntegerTimeSeries, self).__init__(*args, **kwargs)
 
-        self._unique_values = []
+        self.encode()
 
-    def interpolate(self):
+    @staticmethod
+    def code_dtype(category_count: int):
+        for dtype in (np.uint8, np.uint16, np.uint32):
+            if category_count <= np.iinfo(dtype).max + 1:
+                return dtype
+
+        return np.int64
+
+    def encode(self):
+
+        # Categorical representation: _unique_values holds the sorted category
+        # table and _value_array holds, for each sample, the index of its
+        # category, stored in the narrowest unsigned type that fits.
+        values = self._value_array
+        self._run_starts = None
+        self._run_times = None
+
+        if isinstance(values, ChunkedArray):
+            self.encode_chunks(values)
+
+        else:
+            try:
+                categories, codes = np.unique(values, return_inverse=True)
+
+            except TypeError:
+                # Object columns mixing strings with missing values (NaN) can't
+                # be sorted as they are
+                categories, codes = np.unique(values.astype(str),
+                                              return_inverse=True)
+
+            if categories.dtype.kind == 'O':
+                categories = categories.astype(str)
+
+            codes = codes.reshape(-1).astype(self.code_dtype(len(categories)))
+
+            self._unique_values = categories
+            self._value_array = codes
+
+            # Run-length representation: _run_starts and _run_times hold the
+            # index and time of the first sample of each run of equal codes and
+            # _value_array holds one code per run. Zero-order hold look-ups
+            # then search the change points only. Needs time stamps in order.
+            if self.run_length_encoding and len(codes) and \
+                    self._time_base.is_monotonic:
+                run_starts = self.run_starts_of(codes)
+                if self.runs_pay_off(len(run_starts), codes):
+                    self.use_runs(run_starts, codes[run_starts])
+
+        self.samples_changed()
+
+    def encode_chunks(self, values: ChunkedArray):
+
+        # Same representations as encode, built a chunk at a time: categories
+        # from the distinct values of each chunk, then codes into a chunked
+        # array like the samples, and runs continued across chunk boundaries.
+        # Runs are given up as soon as they would take more room than the
+        # codes.
+        categories = np.unique(np.concatenate(
+            [np.unique(chunk) for chunk in values.iterate_chunks()]))
+        code_dtype = self.code_dtype(len(categories))
+        codes = values.empty_like(code_dtype)
+
+        collect_runs = self.run_length_encoding and len(values) > 0 and \
+            self._time_base.is_monotonic
+        run_starts, run_codes = [], []
+        run_count = 0
+        last_code = None
+
+        for chunk in values.iterate_chunks():
+            chunk_codes = np.searchsorted(categories, chunk).astype(code_dtype)
+
+            if collect_runs:
+                starts = self.run_starts_of(chunk_codes, last_code)
+                run_starts.append(starts + len(codes))
+                run_codes.append(chunk_codes[starts])
+                run_count += len(starts)
+                collect_runs = self.runs_pay_off(run_count, values, code_dtype)
+
+            codes.append(chunk_codes)
+            last_code = chunk_codes[-1]
+
+        self._unique_values = categories
+        self._value_array = codes
+
+        if collect_runs:
+            self.use_runs(np.concatenate(run_starts),
+                          np.concatenate(run_codes))
+
+    @staticmethod
+    def run_starts_of(codes, previous_code=None):
+        # Indices where a new run starts; the first code continues the previous
+        # run when it equals previous_code
+        changes = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        run_starts = np.concatenate(([0], changes))
+        if previous_code is not None and codes[0] == previous_code:
+            run_starts = run_starts[1:]
+
+        return run_starts
+
+    @staticmethod
+    def runs_pay_off(run_count: int, codes, code_dtype=None):
+        # Whether a start index, start time and code per run take less room
+        # than one code per sample
+        itemsize = np.dtype(code_dtype or codes.dtype).itemsize
+        return run_count * (2 * 8 + itemsize) < len(codes) * itemsize
+
+    def use_runs(self, run_starts, run_codes):
+        self._run_starts = run_starts
+        self._run_times = np.asarray(self._time_base.times_at(run_starts),
+                                     dtype=np.float64)
+        self._value_array = run_codes
+
+    def append_samples(self, values):
+
+        # New categories are merged into the sorted table, which renumbers the
+        # existing codes (once per new category, not per sample). Runs continue
+        # the last run when its value repeats. Statistics are recomputed from
+        # the category counts when next asked for.
+        values = np.asarray(values)
+        if not len(values):
+            return
+
+        if self._unique_values.dtype.kind in 'UO' or values.dtype.kind in 'UO':
+            values = values.astype(str)
+
+        categories = np.union1d(self._unique_values, np.unique(values))
+        pyramid = self._pyramid
+
+        code_dtype = self.code_dtype(len(categories))
+
+        if len(categories) != len(self._unique_values):
+            renumbered = np.searchsorted(
+                categories, self._unique_values).astype(code_dtype)
+            self._value_array = self.renumber(self._value_array, renumbered)
+            self._buffer = None
+            pyramid = None
+
+        self._unique_values = categories
+        codes = np.searchsorted(categories, values).astype(code_dtype)
+
+        if self._run_starts is not None:
+            start = self._time_base.length - len(codes)
+            run_starts = self.run_starts_of(codes, self._value_array[-1])
+
+            # Runs are few, so they are simply concatenated
+            run_codes = codes[run_starts]
+            run_starts = run_starts + start
+            run_times = np.asarray(self._time_base.times_at(run_starts),
+                                   dtype=np.float64)
+
+            self._run_starts = np.concatenate((self._run_starts, run_starts))
+            self._run_times = np.concatenate((self._run_times, run_times))
+            self._value_array = np.concatenate((self._value_array, run_codes))
+
+        else:
+            self.extend_values(codes)
+
+        self.samples_changed()
+
+        if pyramid is not None:
+            self._pyramid = pyramid.extend(self._value_array)
+
+    @staticmethod
+    def renumber(codes, renumbered):
+        # Codes mapped through renumbered, chunk by chunk for chunked codes
+        if not isinstance(codes, ChunkedArray):
+            return renumbered[codes]
+
+        result = codes.empty_like(renumbered.dtype)
+        for chunk in codes.iterate_chunks():
+            result.append(renumbered[chunk])
+
+        return result
+
+    @property
+    def is_run_length_encoded(self):
+        return self._run_starts is not None
+
+    @property
+    def length(self):
+        if self._run_starts is not None:
+            return self._time_base.length
+
+        return len(self._value_array)
+
+    @property
+    def runs(self):
+
+        # (first sample index, first sample time, code) of every run of equal
+        # samples
+        if self._run_starts is not None:
+            return self._run_starts, self._run_times, self._value_array
+
+        codes = self._value_array
+        if not len(codes):
+            run_starts = np.array([], dtype=np.intp)
+
+        elif isinstance(codes, ChunkedArray):
+            run_starts, offset, last_code = [], 0, None
+            for chunk in codes.iterate_chunks():
+                starts = self.run_starts_of(chunk, last_code)
+                run_starts.append(starts + offset)
+                offset += len(chunk)
+                last_code = chunk[-1]
+
+            run_starts = np.concatenate(run_starts)
+
+        else:
+            run_starts = self.run_starts_of(codes)
+
+        return run_starts, self._time_base.times_at(run_starts), \
+            codes[run_starts]
+
+    @property
+    def run_lengths(self):
+        run_starts = self.runs[0]
+        return np.diff(run_starts, append=self.length)
+
+    def run_window(self, start_index: int, end_index: int):
+
+        # Runs overlapping samples [start_index, end_index), as their first
+        # sample index within the range and code
+        first = int(np.searchsorted(self._run_starts, start_index, 'right'))
+        first = max(first - 1, 0)
+        last = int(np.searchsorted(self._run_starts, end_index, 'left'))
+
+        return np.maximum(self._run_starts[first:last], start_index), \
+            self._value_array[first:last]
 
-        # https://stackoverflow.com/questions/43203215/map-unique-strings-to-integers-in-python
+    @property
+    def categories(self):
+        return self._unique_values
+
+    @property
+    def codes(self):
+        if self._run_starts is not None:
+            return np.repeat(self._value_array, self.run_lengths)
+
+        return self._value_array
+
+    @property
+    def samples(self):
+        return self._unique_values[self.codes]
+
+    def stored_values(self, start_index: int, end_index: int):
+        if self._run_starts is None:
+            return super(IntegerTimeSeries, self).stored_values(
+                start_index, end_index)
+
+        if start_index >= end_index:
+            return self._value_array[:0]
+
+        run_starts, codes = self.run_window(start_index, end_index)
+        return np.repeat(codes, np.diff(run_starts, append=end_index))
+
+    def decode_samples(self, stored_values: np.array):
+        return self._unique_values[stored_values]
+
+    def compute_checksum(self):
+        # Encoding is deterministic, so equal samples give equal categories,
+        # codes and runs
+        return ArrayChecksum.digest(self._unique_values, self._value_array,
+                                    self._run_starts)
+
+    def compute_statistics(self):
+
+        # The tree statistics only need to know how often each category occurs
+        category_count = len(self._unique_values)
+        if self._run_starts is not None:
+            counts = np.bincount(self._value_array, weights=self.run_lengths,
+                                 minlength=category_count)
+            counts = counts.astype(np.int64)
+
+        elif isinstance(self._value_array, ChunkedArray):
+            counts = np.zeros(category_count, dtype=np.int64)
+            for chunk in self._value_array.iterate_chunks():
+                counts += np.bincount(chunk, minlength=category_count)
+
+        else:
+            counts = np.bincount(self._value_array, minlength=category_count)
+
+        return SignalStatistics.from_weighted_values(self._unique_values,
+                                                     counts)
+
+    @property
+    def duration_statistics(self) -> SignalStatistics:
+
+        # Weighted by how long each value is held (until the next change, the
+        # last one until t_end) instead of by sample count. The two differ when
+        # the sample rate varies.
+        run_starts, run_times, codes = self.runs
+        durations = np.diff(np.asarray(run_times, dtype=np.float64),
+                            append=np.float64(self.t_end))
+        weights = np.bincount(codes, weights=durations,
+                              minlength=len(self._unique_values))
+
+        return SignalStatistics.from_weighted_values(self._unique_values,
+                                                     weights)
+
+    def build_pyramid(self, block_size=16):
+
+        # Decimating runs is already cheap, see decimate
+        if self._run_starts is not None:
+            self._pyramid = None
+            return None
+
+        return super(IntegerTimeSeries, self).build_pyramid(block_size)
+
+    def decimate(self, t_start: float = None, t_end: float = None,
+                 pixel_count: int = 1000, method=Decimation.MIN_MAX):
+
+        if self._run_starts is None:
+            return super(IntegerTimeSeries, self).decimate(
+                t_start, t_end, pixel_count, method)
+
+        # A dense plot of a run shows a flat line from its first to its last
+        # sample, so those two points per run are all that is decimated
+        start_index, end_index = self.window_indices(t_start, t_end)
+        start_index = max(start_index - 1, 0)
+        end_index = min(end_index + 1, self.length)
+
+        if start_index >= end_index:
+            return self._time_base.window(0, 0), \
+                self.decode_samples(self._value_array[:0])
+
+        run_starts, codes = self.run_window(start_index, end_index)
 
-        # Generate lookup table by assigning an index to each unique value
-        self._unique_values = [y for x, y in enumerate(sorted(set(self._value_array)))]
-        index_dict = {y: x for x, y in enumerate(self._unique_values)}
+        indices = np.empty(2 * len(run_starts), dtype=np.intp)
+        indices[0::2] = run_starts
+        indices[1::2] = np.append(run_starts[1:], end_index) - 1
 
-        # Convert the y_values to indices
-        self._value_array = np.array([index_dict[x] for x in self._value_array])
+        time, values = Decimation.decimate(
+            self._time_base.times_at(indices), np.repeat(codes, 2),
+            pixel_count, method)
 
-        # return np.vectorize(self.get_value_at_time)
+        return time, self.decode_samples(values)
+
+    def interpolate(self):
         return self.get_values_at_times
 
-    def get_values_at_times(self, time_array: np.array):
-        return [self.get_value_at_time(time) for time in time_array]
+    def get_sample_indices_at_times(self, time_array: np.array):
 
-    def get_value_at_time(self, eval_time: float):
+        # Zero-order hold: the sample in effect at time t is the last one
+        # recorded at or before t. Times before the first sample hold the first
+        # sample. One searchsorted call covers the whole query array.
+        indices = self._time_base.index_after_time(time_array, 'right') - 1
 
-        # https://stackoverflow.com/questions/16243955/numpy-first-occurrence-of-value-greater-than-existing-value
+        return np.clip(indices, 0, max(self.length - 1, 0))
 
-        # Get index of first
-        index = self.get_index_after_time(self._time_array, eval_time)
+    def get_codes_at_times(self, time_array: np.array):
 
-        if index > 0:
-            index -= 1
+        # With runs, a single search over the change times finds the run in
+        # effect
+        if self._run_starts is not None:
+            runs = np.searchsorted(self._run_times, time_array, 'right') - 1
+            runs = np.clip(runs, 0, len(self._value_array) - 1)
+            return self._value_array[runs]
 
-        return self._value_array[index]
+        return self._value_array[self.get_sample_indices_at_times(time_array)]
+
+    def get_values_at_times(self, time_array: np.array):
+        codes = self.get_codes_at_times(np.asarray(time_array))
+        return self._unique_values[codes]
+
+    def get_value_at_time(self, eval_time: float):
+        return self._unique_values[self.get_codes_at_times(eval_time)]
 
 
 class NonNumericTimeSeries(IntegerTimeSeries):
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super(NonNumericTimeSeries, self).__init__(*args, **kwargs)
 
-    @property
-    def min(self):
-        return np.nan
 
-    @property
-    def max(self):
-        return np.nan
+class UnloadedSignal(Signal):
+
+    # Column of a data set known from the file header only. load() reads its
+    # samples and returns the signal that replaces this one in the data set;
+    # reading samples or statistics through this placeholder loads it as well.
+
+    __slots__ = ('_load',)
+
+    def __init__(self, load, value_units=None, signal_path=''):
+        super(UnloadedSignal, self).__init__(value_array=np.empty(0),
+                                             value_units=value_units,
+                                             signal_path=signal_path)
+
+        self._load = load
 
     @property
-    def avg(self):
-        return np.nan
+    def is_loaded(self):
+        return False
+
+    def load(self):
+        return self._load()
+
+    def get_property_strings(self, keys, float_format=None):
+        # Listed without reading the column
+        return [(self._value_units or '') if key == 'Units' else ''
+                for key in keys] if keys else []
 
     @property
-    def med(self):
-        return np.nan
+    def statistics(self) -> SignalStatistics:
+        return self.load().statistics
 
     @property
-    def mode(self):
-        index = st.mode(self._value_array)[0][0] if len(self._value_array) else None
-        return self._unique_values[index] if index is not None and 0 <= index < len(self._unique_values) else None
+    def samples(self):
+        return self.load().samples
 
     @property
-    def std(self):
-        return np.nan
+    def length(self):
+        return self.load().length
 
 
 class SignalGenerator:
@@ -270,7 +1104,12 @@ class SignalGenerator:
     _FLOAT_KINDS = set('fc')
 
     @staticmethod
-    def generate_signal(time_array, time_units, value_array, value_units, signal_path):
+    def generate_signal(time_array, time_units, value_array, value_units,
+                        signal_path, dtype_policy=None):
+
+        # Narrows the storage type of the samples, see DtypePolicy
+        if dtype_policy is not None:
+            value_array = dtype_policy.apply(value_array)
 
         if time_array is None:
 
@@ -305,6 +1144,14 @@ class SignalGenerator:
                     value_units=value_units,
                     signal_path=signal_path)
 
+    @staticmethod
+    def dtype_of(array):
+        # Chunked arrays know their type without being loaded
+        if isinstance(array, ChunkedArray):
+            return array.dtype
+
+        return np.asarray(array).dtype
+
     @staticmethod
     def is_numeric(array):
         """Determine whether the argument has a numeric datatype, when
@@ -324,7 +1171,8 @@ class SignalGenerator:
             True if the array has a numeric datatype, False if not.
 
         """
-        return np.asarray(array).dtype.kind in SignalGenerator._NUMERIC_KINDS
+        kind = SignalGenerator.dtype_of(array).kind
+        return kind in SignalGenerator._NUMERIC_KINDS
 
     @staticmethod
     def is_float(array):
@@ -345,4 +1193,5 @@ class SignalGenerator:
             True if the array has a numeric datatype, False if not.
 
         """
-        return np.asarray(array).dtype.kind in SignalGenerator._FLOAT_KINDS
+        kind = SignalGenerator.dtype_of(array).kind
+        return kind in SignalGenerator._FLOAT_KINDS
@@ -0,0 +1,203 @@
+import threading
+
+import numpy as np
+from scipy import signal as scipy_signal
+from PyQt5 import QtCore
+
+from data_flow.alignment import SignalAlignment
+from utilities.lru_cache import LRUCache
+from utilities.worker import Worker
+
+__all__ = ['SpectralAnalysis']
+
+
+class SpectralAnalysis:
+
+    # FFT magnitude, Welch PSD and short-time spectrogram of a signal between two times. Results are cached per
+    # (signal, window, parameters) and can be computed in a thread pool. Samples on a non-uniform time base are first
+    # interpolated onto an even grid at their median sample period.
+
+    FFT = 'fft'
+    PSD = 'psd'
+    SPECTROGRAM = 'spectrogram'
+
+    # Results kept in the cache
+    cache_size = 32
+
+    # Samples transformed at once while computing a spectrogram
+    chunk_size = 2 ** 20
+
+    def __init__(self, thread_pool: QtCore.QThreadPool = None, cache_size: int = None):
+        self._thread_pool = thread_pool
+        self._cache = LRUCache(cache_size or self.cache_size)
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    @staticmethod
+    def cache_key(kind, signal, t_start, t_end, parameters):
+        # Signals are replaced on reload, so their identity (and their revision, for samples appended in place) marks
+        # the samples
+        return kind, signal.path, id(signal), getattr(signal, 'revision', 0), t_start, t_end, \
+            tuple(sorted(parameters.items()))
+
+    def cached(self, kind, signal, t_start, t_end, parameters, compute):
+
+        key = self.cache_key(kind, signal, t_start, t_end, parameters)
+        with self._lock:
+            entry = self._cache.get(key)
+
+        # The signal is kept with the result so a recycled id can't return another signal's spectrum
+        if entry is not None and entry[0] is signal:
+            return entry[1]
+
+        result = compute()
+        for array in result:
+            array.flags.writeable = False
+
+        with self._lock:
+            self._cache.put(key, (signal, result))
+
+        return result
+
+    @staticmethod
+    def uniform_grid(signal, t_start: float = None, t_end: float = None):
+
+        # (read, sample count, sample rate, time of the first sample) of the
+        # signal between t_start and t_end on an evenly spaced grid, where
+        # read(first, last) gives the values of grid samples [first, last)
+        start_index, end_index = signal.window_indices(t_start, t_end)
+        time_base = signal.time_base
+
+        if end_index - start_index < 2:
+            raise ValueError('At least two samples are needed for a spectrum of ' + signal.path)
+
+        if time_base.is_uniform:
+            def read(first, last):
+                values = signal.stored_values(start_index + first,
+                                              start_index + last)
+                return np.asarray(signal.decode_samples(values),
+                                  dtype=np.float64)
+
+            return read, end_index - start_index, \
+                1.0 / time_base.sample_period, time_base.times_at(start_index)
+
+        time = np.asarray(time_base.window(start_index, end_index), dtype=np.float64)
+        sample_period = np.median(np.diff(time))
+        if not sample_period > 0:
+            raise ValueError('Time stamps of ' + signal.path + ' are not increasing')
+
+        count = int(np.floor((time[-1] - time[0]) / sample_period)) + 1
+        alignment = SignalAlignment([])
+
+        def read(first, last):
+            grid = time[0] + sample_period * np.arange(first, last)
+            return alignment.evaluate(signal, grid)
+
+        return read, count, 1.0 / sample_period, time[0]
+
+    @staticmethod
+    def uniform_samples(signal, t_start: float = None, t_end: float = None):
+
+        # (values, sample rate) between t_start and t_end on an evenly spaced
+        # grid
+        read, count, sample_rate, _ = SpectralAnalysis.uniform_grid(
+            signal, t_start, t_end)
+
+        return read(0, count), sample_rate
+
+    def fft(self, signal, t_start: float = None, t_end: float = None, window='hann', detrend=True):
+
+        # (frequencies, amplitude) of the one-sided spectrum, scaled so that a sine of amplitude A peaks at A
+        def compute():
+            values, sample_rate = self.uniform_samples(signal, t_start, t_end)
+            if detrend:
+                values = values - np.mean(values)
+
+            taper = scipy_signal.get_window(window, len(values))
+            spectrum = np.abs(np.fft.rfft(values * taper)) * 2.0 / np.sum(taper)
+            spectrum[0] /= 2.0
+            if len(values) % 2 == 0:
+                spectrum[-1] /= 2.0
+
+            return np.fft.rfftfreq(len(values), 1.0 / sample_rate), spectrum
+
+        return self.cached(self.FFT, signal, t_start, t_end, {'window': window, 'detrend': detrend}, compute)
+
+    def psd(self, signal, t_start: float = None, t_end: float = None, segment_length=1024, overlap=None,
+            window='hann'):
+
+        # (frequencies, power spectral density) by Welch's method
+        def compute():
+            values, sample_rate = self.uniform_samples(signal, t_start, t_end)
+            length = min(segment_length, len(values))
+
+            return scipy_signal.welch(values, fs=sample_rate, window=window, nperseg=length,
+                                      noverlap=None if overlap is None else min(overlap, length - 1))
+
+        parameters = {'segment_length': segment_length, 'overlap': overlap, 'window': window}
+        return self.cached(self.PSD, signal, t_start, t_end, parameters, compute)
+
+    def spectrogram(self, signal, t_start: float = None, t_end: float = None, segment_length=256, overlap=None,
+                    window='hann', max_segments=4096):
+
+        # (frequencies, segment times, power spectral density [frequency, segment]). Long signals are transformed a
+        # chunk of samples at a time, each read from the signal as it is
+        # needed; when they would give more than max_segments segments, the
+        # hop between segments is widened instead so the result stays the size
+        # of a display.
+        def compute():
+            read, count, sample_rate, start_time = self.uniform_grid(
+                signal, t_start, t_end)
+            length = min(segment_length, count)
+            hop = length - (length // 8 if overlap is None else min(overlap, length - 1))
+
+            segment_count = (count - length) // hop + 1
+            if segment_count > max_segments:
+                hop = -(-(count - length) // (max_segments - 1)) \
+                    if max_segments > 1 else count
+                segment_count = (count - length) // hop + 1
+
+            taper = scipy_signal.get_window(window, length)
+            scale = 1.0 / (sample_rate * np.sum(taper ** 2))
+
+            power = np.empty((length // 2 + 1, segment_count), dtype=np.float64)
+            segments_per_chunk = max(1, self.chunk_size // hop)
+
+            for first in range(0, segment_count, segments_per_chunk):
+                last = min(first + segments_per_chunk, segment_count)
+                chunk = read(first * hop, (last - 1) * hop + length)
+
+                segments = np.lib.stride_tricks.sliding_window_view(chunk, length)[::hop]
+                segments = segments - np.mean(segments, axis=1, keepdims=True)
+
+                chunk_power = np.abs(np.fft.rfft(segments * taper, axis=1)) ** 2 * scale
+                chunk_power[:, 1:(length + 1) // 2] *= 2.0
+                power[:, first:last] = chunk_power.T
+
+            times = start_time + (np.arange(segment_count) * hop + length / 2.0) / sample_rate
+
+            return np.fft.rfftfreq(length, 1.0 / sample_rate), times, power
+
+        parameters = {'segment_length': segment_length, 'overlap': overlap, 'window': window,
+                      'max_segments': max_segments}
+        return self.cached(self.SPECTROGRAM, signal, t_start, t_end, parameters, compute)
+
+    def compute_async(self, kind, signal, callback, *args, **kwargs):
+
+        # Runs fft, psd or spectrogram in the thread pool and hands the result to callback in the GUI thread
+        worker = Worker(getattr(self, kind), signal, *args, **kwargs)
+        worker.signals.result.connect(callback)
+
+        if self._thread_pool is None:
+            self._thread_pool = QtCore.QThreadPool()
+
+        self._thread_pool.start(worker)
+
+        return worker
@@ -0,0 +1,348 @@
+import weakref
+
+import numpy as np
+
+from data_flow.array_checksum import ArrayChecksum
+from data_flow.growable_array import GrowableArray
+
+__all__ = ['TimeBase']
+
+
+class TimeBase:
+
+    # Read-only time axis shared by all signals of a data set that were recorded against the same time column. Facts
+    # derived from the time stamps (bounds, monotonicity, sample rate) are worked out once here instead of per signal.
+    # Time stamps read from a file are kept as they are (type included), so windows are views of them; on uniformly
+    # sampled axes the grid only turns time-to-index look-ups into plain arithmetic. Axes that were never read from a
+    # file (see uniform) are stored as (t_start, sample_period, length) only and generate their time stamps.
+
+    # Samples scanned per slice while analysing the time stamps, so memory-mapped time columns aren't copied
+    chunk_size = 2 ** 20
+
+    # Every coarse_stride-th time stamp is kept in a small coarse index that searches run through first
+    coarse_stride = 1024
+
+    def __init__(self, time_array, uniform_tolerance=1e-6, compact=False):
+
+        array = np.asanyarray(time_array)
+        if array.flags.writeable:
+            array = array.view()
+            array.flags.writeable = False
+
+        self._array = array
+        self._buffer = None  # GrowableArray that _array views once time stamps have been appended
+        self._length = len(array)
+        self._uniform_tolerance = uniform_tolerance
+        self._dtype = array.dtype
+        self._sample_rate = None  # Whole rate that a compact grid divides by
+
+        # Lets a data set recognise the time column this base was built from without holding on to it
+        try:
+            self._source = weakref.ref(time_array)
+
+        except TypeError:
+            self._source = None
+
+        self._is_monotonic = self.check_monotonic(array)
+
+        if self._length and self._is_monotonic:
+            self._t_start = array[0]
+            self._t_end = array[-1]
+
+        else:
+            self._t_start = np.min(array) if self._length else None
+            self._t_end = np.max(array) if self._length else None
+
+        self._sample_period = self.detect_sample_period(array, uniform_tolerance) if self._is_monotonic else None
+
+        # An opted-in axis that the grid reproduces exactly, in its own dtype,
+        # is generated from then on instead of held
+        if compact and self.is_uniform and \
+                np.issubdtype(self._dtype, np.number):
+            grid = self.exact_grid(array, self._sample_period)
+            if grid is not None:
+                self._sample_period, self._sample_rate = grid
+                self._array = None
+
+        # Uniform axes don't need one, see index_after_time
+        self._coarse_index = array[::self.coarse_stride].copy() \
+            if self._is_monotonic and not self.is_uniform and self._length > 4 * self.coarse_stride else None
+
+        self._window = None  # Last window generated by a compact base, as (start, end, time stamps)
+
+    @staticmethod
+    def uniform(t_start: float, sample_period: float, length: int):
+
+        # Compact time base of an evenly spaced grid, without ever generating its time stamps
+        time_base = TimeBase.__new__(TimeBase)
+
+        time_base._array = None
+        time_base._buffer = None
+        time_base._length = length
+        time_base._uniform_tolerance = 0.0
+        time_base._dtype = np.dtype(np.float64)
+        time_base._sample_rate = None
+        time_base._source = None
+        time_base._is_monotonic = True
+        time_base._sample_period = np.float64(sample_period)
+        time_base._coarse_index = None
+        time_base._t_start = np.float64(t_start)
+        time_base._t_end = time_base.times_at(length - 1) if length else None
+        time_base._window = None
+
+        if not length:
+            time_base._t_start = None
+
+        return time_base
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def array(self):
+        return self._array if self._array is not None else self.window(0, self._length)
+
+    @property
+    def is_compact(self):
+        # True when the time stamps are not stored but generated from (t_start, sample_period, length)
+        return self._array is None
+
+    @property
+    def length(self):
+        return self._length
+
+    @property
+    def t_start(self):
+        return self._t_start
+
+    @property
+    def t_end(self):
+        return self._t_end
+
+    @property
+    def is_monotonic(self):
+        return self._is_monotonic
+
+    @property
+    def is_uniform(self):
+        return self._sample_period is not None
+
+    @property
+    def sample_period(self):
+        return self._sample_period
+
+    @property
+    def nbytes(self):
+        if self._array is None:
+            return 0
+
+        return self._array.nbytes + (self._coarse_index.nbytes if self._coarse_index is not None else 0)
+
+    @property
+    def checksum(self):
+        # Digest of the time stamps (of the parameters that generate them, for compact axes)
+        if self._array is None:
+            parameters = [self._t_start, self._sample_period, self._length]
+            if self._sample_rate is not None:
+                parameters.append(self._sample_rate)
+
+            return ArrayChecksum.digest(
+                np.array(parameters, dtype=np.float64))
+
+        return ArrayChecksum.digest(self._array)
+
+    def is_built_from(self, time_array):
+        return self._source is not None and self._source() is time_array
+
+    @staticmethod
+    def check_monotonic(array: np.array):
+        for start in range(0, len(array), TimeBase.chunk_size):
+            # Overlap by one sample so that steps across slice boundaries are checked too
+            chunk = np.asarray(array[max(start - 1, 0):start + TimeBase.chunk_size])
+            if np.any(chunk[1:] < chunk[:-1]):
+                return False
+
+        return True
+
+    @staticmethod
+    def detect_sample_period(array: np.array, tolerance: float):
+
+        # Uniform if every time stamp is within tolerance (relative to the sample period) of the evenly spaced grid
+        # from the first to the last time stamp
+        length = len(array)
+        if length < 2 or array[-1] <= array[0]:
+            return None
+
+        t_start = np.float64(array[0])
+        sample_period = (np.float64(array[-1]) - t_start) / (length - 1)
+
+        for start in range(0, length, TimeBase.chunk_size):
+            chunk = np.asarray(array[start:start + TimeBase.chunk_size], dtype=np.float64)
+            grid = t_start + sample_period * np.arange(start, start + len(chunk))
+            if np.max(np.abs(chunk - grid)) > tolerance * sample_period:
+                return None
+
+        return sample_period
+
+    @staticmethod
+    def exact_grid(array: np.array, sample_period: float):
+
+        # (sample period, sample rate) of a grid that, cast to the dtype of
+        # the array, gives back every time stamp: steps of the period as
+        # detected or rounded to 15 significant digits, or divisions by a
+        # whole sample rate (as decimal time stamps are usually written).
+        # None if there is no such grid.
+        t_start = np.float64(array[0])
+        candidates = [(sample_period, None),
+                      (np.float64('%.15g' % sample_period), None)]
+
+        sample_rate = np.round(1.0 / sample_period)
+        if sample_rate >= 1.0:
+            candidates.append((1.0 / sample_rate, sample_rate))
+
+        for grid in candidates:
+            if TimeBase.reproduces(array, 0, t_start, *grid):
+                return grid
+
+        return None
+
+    @staticmethod
+    def reproduces(times: np.array, first: int, t_start, sample_period,
+                   sample_rate):
+        for start in range(0, len(times), TimeBase.chunk_size):
+            chunk = np.asarray(times[start:start + TimeBase.chunk_size])
+            indices = np.arange(first + start, first + start + len(chunk))
+            grid = TimeBase.grid_times(t_start, sample_period, sample_rate,
+                                       indices)
+            if not np.array_equal(grid.astype(chunk.dtype), chunk):
+                return False
+
+        return True
+
+    @staticmethod
+    def grid_times(t_start, sample_period, sample_rate, indices):
+        indices = np.asarray(indices, dtype=np.float64)
+        if sample_rate is not None:
+            return t_start + indices / sample_rate
+
+        return t_start + sample_period * indices
+
+    def extend(self, time_array):
+
+        # Appends time stamps recorded after the existing ones (see DataSet.append_rows); the signals on this base must
+        # then be extended by as many samples. Costs time in the number of new time stamps only, except that a compact
+        # base is expanded into an array once if the new time stamps leave its grid.
+        times = np.asarray(time_array)
+        if not len(times):
+            return
+
+        start = self._length
+        end = start + len(times)
+
+        off_grid = not start
+        if self._sample_period is not None and start:
+            grid = self._t_start + self._sample_period * np.arange(start, end)
+            off_grid = np.max(np.abs(np.asarray(times, dtype=np.float64) - grid)) > \
+                self._uniform_tolerance * self._sample_period
+
+        # A compact base only stays compact while it reproduces the new
+        # time stamps exactly
+        if self._array is None and not off_grid and \
+                times.dtype == self._dtype and \
+                self.reproduces(times, start, self._t_start,
+                                self._sample_period, self._sample_rate):
+            self._window = None
+            self._length = end
+            self._t_end = self.times_at(end - 1)
+            return
+
+        if self._buffer is None:
+            self._buffer = GrowableArray(self.window(0, start))
+
+        if off_grid:
+            self._sample_period = None
+
+        last = self._array[-1] if start and self._array is not None else (self._t_end if start else None)
+        self._array = self._buffer.extend(times)
+        self._length = end
+
+        self._is_monotonic = self._is_monotonic and self.check_monotonic(times) and (last is None or times[0] >= last)
+        self._t_start = np.min(times) if self._t_start is None else min(self._t_start, np.min(times))
+        self._t_end = np.max(times) if self._t_end is None else max(self._t_end, np.max(times))
+
+        # Only the coarse entries for the new time stamps are added
+        if not self._is_monotonic or self.is_uniform or self._length <= 4 * self.coarse_stride:
+            self._coarse_index = None
+
+        elif self._coarse_index is None:
+            self._coarse_index = self._array[::self.coarse_stride].copy()
+
+        else:
+            first = len(self._coarse_index) * self.coarse_stride
+            self._coarse_index = np.concatenate((self._coarse_index, self._array[first::self.coarse_stride]))
+
+    def index_after_time(self, eval_time, side='left'):
+
+        # Same result as np.searchsorted(array, eval_time, side). Single look-ups go through the coarse index first and
+        # then search one stride of the full array, which keeps them within a few cache lines (or mapped pages).
+        if not self._length:
+            return np.zeros(np.shape(eval_time), dtype=np.intp) \
+                if np.ndim(eval_time) else 0
+
+        if self._sample_period is not None:
+            return self.uniform_index_after_time(eval_time, side)
+
+        if self._coarse_index is None or np.ndim(eval_time):
+            return np.searchsorted(self._array, eval_time, side=side)
+
+        block = int(np.searchsorted(self._coarse_index, eval_time, side=side))
+        start = max(block - 1, 0) * self.coarse_stride
+        end = min(block * self.coarse_stride + 1, self._length)
+
+        return start + int(np.searchsorted(self._array[start:end], eval_time, side=side))
+
+    def uniform_index_after_time(self, eval_time, side='left'):
+
+        # O(1): estimate the index from the sample period, then correct the estimate by one step where rounding (or
+        # time stamps off the grid by less than the tolerance) put it next to the time stamp it should have matched
+        eval_time = np.asarray(eval_time, dtype=np.float64)
+
+        # NaN sorts after everything, as in np.searchsorted
+        position = np.nan_to_num((eval_time - self._t_start) / self._sample_period, nan=np.inf)
+
+        if side == 'left':
+            indices = np.clip(np.ceil(position), 0, self._length).astype(np.intp)
+            indices -= (indices > 0) & (self.times_at(np.maximum(indices - 1, 0)) >= eval_time)
+            indices += (indices < self._length) & (self.times_at(np.minimum(indices, self._length - 1)) < eval_time)
+
+        else:
+            indices = np.clip(np.floor(position) + 1, 0, self._length).astype(np.intp)
+            indices -= (indices > 0) & (self.times_at(np.maximum(indices - 1, 0)) > eval_time)
+            indices += (indices < self._length) & (self.times_at(np.minimum(indices, self._length - 1)) <= eval_time)
+
+        return indices if indices.ndim else int(indices)
+
+    def window(self, start_index: int, end_index: int):
+        if self._array is not None:
+            return self._array[start_index:end_index]
+
+        # Redraws ask for the same window again and again, so the last one generated is kept
+        end_index = max(start_index, min(end_index, self._length))
+        if self._window is None or self._window[:2] != (start_index, end_index):
+            window = self.times_at(np.arange(start_index, end_index))
+            window.flags.writeable = False
+            self._window = start_index, end_index, window
+
+        return self._window[2]
+
+    def times_at(self, indices):
+        if self._array is None:
+            # Out of range on an empty base, as for a stored empty array
+            if not self._length:
+                return np.empty(0, dtype=self._dtype)[indices]
+
+            times = self.grid_times(self._t_start, self._sample_period,
+                                    self._sample_rate, indices)
+            return times.astype(self._dtype, copy=False)
+
+        return self._array[indices]
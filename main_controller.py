@@ -5,6 +5,8 @@ from settings.settings import Settings
 from data_flow.serializer.serializer import Serializer
 from data_flow.playback_manager import PlaybackManager
 from data_flow.data_store import DataStore
+from data_flow.memory_mapping import ScratchDirectory
+from data_flow.parse_cache import ParseCache
 from data_flow.signal_tree import SignalTree
 from plugins.content_editor_popup import ContentEditorPopup
 from widgets.playback_widget import PlaybackWidget
@@ -22,6 +24,16 @@ class Controller(EditAndDebug):
         self._settings = Settings(self, 'DynamicsToolBox', 'UserSettings', location='settings')
         self._serializer = Serializer(self)
 
+        # Spilled columns of the previous session that the OS couldn't remove while they were mapped
+        if self.settings.scratch_directory:
+            ScratchDirectory(self.settings.scratch_directory).clear()
+
+        # Needed before the last session's data sets are loaded
+        self._parse_cache = None
+        if self.settings.parse_cache_directory:
+            self._parse_cache = ParseCache(
+                self.settings.parse_cache_directory, self.settings.parse_cache_size_mb * 2 ** 20)
+
         last_session = self.auto_load_workspace()
         self._playback_widget = PlaybackWidget()
         self._signal_tree_main = SignalTree(
@@ -74,6 +86,15 @@ class Controller(EditAndDebug):
     def settings(self):
         return self._settings
 
+    @property
+    def parse_cache(self):
+        return self._parse_cache
+
+    def clear_parse_cache(self):
+        # Loaded data sets keep their mapped columns; only later loads parse their files again
+        if self._parse_cache is not None:
+            self._parse_cache.clear()
+
     @property
     def serializer(self):
         return self._serializer
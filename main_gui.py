@@ -31,6 +31,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.action_select_stream_source = QtWidgets.QAction("Live &Stream...")
         self.action_import_from_database = QtWidgets.QAction("From &Database...")
         self.action_import_from_file = QtWidgets.QAction("From &File...")
+        self.action_clear_parse_cache = QtWidgets.QAction("Clear Parse &Cache")
         self.action_load_workspace = QtWidgets.QAction("Load W&orkspace...")
         self.toggle_edit_mode = QtWidgets.QAction()
         self.action_save_workspace_as = QtWidgets.QAction("&Save Workspace As...")
@@ -157,6 +158,12 @@ class MainWindow(QtWidgets.QMainWindow):
         self.action_import_from_file.triggered.connect(self.import_from_file)
         self.data_menu.addAction(self.action_import_from_file)
 
+        # File drop down option - Clear Parse Cache.
+        self.data_menu.addSeparator()
+        self.action_clear_parse_cache.setEnabled(self.controller.parse_cache is not None)
+        self.action_clear_parse_cache.triggered.connect(self.controller.clear_parse_cache)
+        self.data_menu.addAction(self.action_clear_parse_cache)
+
         self.setStatusBar(self._status_bar)
         self._status_bar.setVisible(self.controller.debug_mode)
 
@@ -1,7 +1,15 @@
+import functools
+import io
+
+import numpy as np
 import pandas
 
 from data_flow.serializer.file_type import AbstractFileType
 from data_flow.data_store import DataSet
+from data_flow.memory_mapping import ScratchDirectory
+from data_flow.dtype_policy import DtypePolicy
+from data_flow.chunked_array import ChunkedArray
+from data_flow.file_fingerprint import FileFingerprint
 
 
 class CSV(AbstractFileType):
@@ -19,11 +27,156 @@ class CSV(AbstractFileType):
         return 'csv'
 
     @staticmethod
-    def load(path_data, time_key=None) -> DataSet:
+    def read_chunked(path_data, chunk_rows, scratch_directory=None, usecols=None, nrows=None):
+
+        # Parses chunk_rows rows at a time into chunked arrays (compressed in memory, or in the scratch directory
+        # when there is one), so the parsed file never has to fit in memory. Non-numeric columns are kept as arrays.
+        storage = ChunkedArray.DISK if scratch_directory else ChunkedArray.COMPRESSED
+
+        columns = {}
+        for data_frame in pandas.read_csv(path_data, chunksize=chunk_rows, usecols=usecols, nrows=nrows):
+            for name in data_frame.keys():
+                values = data_frame[name].to_numpy()
+                column = columns.get(name)
+
+                if column is None and values.dtype.kind in 'buif':
+                    column = columns[name] = ChunkedArray(
+                        values.dtype, chunk_rows, storage, scratch_directory)
+
+                if isinstance(column, ChunkedArray):
+                    try:
+                        column.append(values)
+                        continue
+
+                    except TypeError:
+                        column = columns[name] = [np.asarray(column)]
+
+                columns.setdefault(name, []).append(values)
+
+        return {name: column if isinstance(column, ChunkedArray) else np.concatenate(column)
+                for name, column in columns.items()}
+
+    @staticmethod
+    def read_rows(path_data, offset):
+
+        # Rows from byte offset to the last complete line, parsed against the header. A line still being written is
+        # left for the next read.
+        with open(path_data, 'rb') as fd:
+            fd.seek(offset)
+            data = fd.read()
+
+        end = data.rfind(b'\n') + 1
+        signal_names = list(pandas.read_csv(path_data, nrows=0).keys())
+        if not end:
+            return {name: np.empty(0) for name in signal_names}, offset
+
+        data_frame = pandas.read_csv(io.BytesIO(data[:end]), header=None, names=signal_names)
+
+        return {name: data_frame[name].to_numpy() for name in signal_names}, offset + end
+
+    @staticmethod
+    def parsed_bytes(path_data, stat):
+
+        # Length of the file that was parsed, if it didn't change while it was parsed (stat is from before) and ends
+        # with a complete line; rows appended later are read from there on
+        if FileFingerprint.stat_key(path_data) != stat:
+            return None
+
+        size = stat[0]
+        return size if size and FileFingerprint.read_bytes(path_data, size - 1, 1) == b'\n' else None
+
+    @staticmethod
+    def read_columns(data_set: DataSet, names, nrows=None):
+
+        # Parses only the named columns, or takes them from the parse cache when they were parsed before. pandas still
+        # splits every line, but converts the requested columns only.
+        load_options = data_set.load_options
+        dtype_policy = DtypePolicy.from_value(load_options.get('dtype_policy'))
+        parse_cache = data_set.parse_cache
+        cache_options = dict(load_options, time_key=data_set.time_key)
+
+        # Looked up by the file's stat, which needs no hash; the file is hashed in the background meanwhile
+        columns = {}
+        if parse_cache is not None:
+            alias = parse_cache.alias(data_set.path_data, data_set.fingerprint.stat, 'CSV', cache_options)
+            key = parse_cache.resolve(alias)
+            cached = (parse_cache.load(key) if key else None) or {}
+            columns = {name: cached[name] for name in names
+                       if name in cached and (nrows is None or len(cached[name]) == nrows)}
+
+        missing = [name for name in names if name not in columns]
+        if not missing:
+            return columns
+
+        if load_options.get('chunk_rows'):
+            parsed = CSV.read_chunked(
+                data_set.path_data, load_options['chunk_rows'], load_options.get('scratch_directory'), missing, nrows)
+
+        else:
+            data_frame = pandas.read_csv(data_set.path_data, usecols=missing, nrows=nrows)
+            parsed = {name: data_frame[name].to_numpy() for name in missing}
+
+        # Narrowed before spilling, so the scratch files shrink too. Time stamps keep their precision.
+        if dtype_policy is not None:
+            parsed = {name: values if name == data_set.time_key else dtype_policy.apply(values)
+                      for name, values in parsed.items()}
+
+        # Stored once parsed, under the digest hashed alongside, while the file holds exactly the bytes it covers
+        if parse_cache is not None and data_set.fingerprint.appended_bytes() == 0:
+            key = parse_cache.key(data_set.fingerprint.digest, 'CSV', cache_options)
+            if parse_cache.store(key, parsed):
+                parse_cache.link(alias, key)
+
+        columns.update(parsed)
+
+        return columns
+
+    @staticmethod
+    def read_unloaded(data_set: DataSet, names):
 
-        data_frame = pandas.read_csv(path_data)
-        signal_names = data_frame.keys()
+        # Samples of unloaded columns, read in one pass, as many rows as the data set's time base holds (appended rows
+        # included). The file must still hold the rows the time base was read from: if it was changed other than by
+        # appending, the data set has to be refreshed first.
+        if data_set.fingerprint.appended_bytes() is None:
+            raise ValueError(
+                data_set.path_data + ' changed since it was loaded; refresh it to read ' + ', '.join(names))
 
+        nrows = data_set.time_bases[0].length if data_set.time_bases else None
+        columns = CSV.read_columns(data_set, names, nrows)
+
+        scratch_directory = data_set.load_options.get('scratch_directory')
+        if scratch_directory:
+            scratch = ScratchDirectory(scratch_directory)
+            columns = {name: value_array if isinstance(value_array, (ChunkedArray, np.memmap))
+                       else scratch.spill(value_array, data_set.name + '-' + name)
+                       for name, value_array in columns.items()}
+
+        return columns
+
+    @staticmethod
+    def load_options(scratch_directory=None, dtype_policy=None, chunk_rows=None, lazy_columns=False):
+
+        options = {'scratch_directory': scratch_directory} if scratch_directory else {}
+        if chunk_rows:
+            options['chunk_rows'] = chunk_rows
+
+        if lazy_columns:
+            options['lazy_columns'] = True
+
+        # Kept as its json dict in the load options so that refresh and workspaces load with the same policy
+        dtype_policy = DtypePolicy.from_value(dtype_policy)
+        if dtype_policy is not None:
+            options['dtype_policy'] = dtype_policy.generate_json_dict()
+
+        return options
+
+    @staticmethod
+    def load(path_data, time_key=None, scratch_directory=None, dtype_policy=None, chunk_rows=None, lazy_columns=False,
+             parse_cache=None) -> DataSet:
+
+        signal_names = list(pandas.read_csv(path_data, nrows=0).keys())
+
+        # Created before parsing, so the file fingerprint is hashed while pandas reads the file
         data_set = DataSet(
             import_method_type=CSV,
             path_data=path_data,
@@ -31,19 +184,66 @@ class CSV(AbstractFileType):
         )
 
         data_set._time_key = time_key = AbstractFileType.get_time_key(time_key, signal_names)
+        data_set.load_options = CSV.load_options(scratch_directory, dtype_policy, chunk_rows, lazy_columns)
+
+        # Columns parsed before are mapped from the parse cache
+        data_set.parse_cache = parse_cache
+
+        # With lazy columns only the time column is read now; the others are registered by name and read when first
+        # used, see DataSet.add_column
+        if lazy_columns:
+            columns = CSV.read_columns(data_set, [time_key] if time_key else [])
+
+        else:
+            columns = CSV.read_columns(data_set, signal_names)
+
+        CSV.add_columns(data_set, signal_names, columns)
 
-        time_array = data_frame.get(time_key) if time_key else None
+        data_set.parsed_bytes = CSV.parsed_bytes(path_data, data_set.fingerprint.stat)
+
+        return data_set
+
+    @staticmethod
+    def add_columns(data_set: DataSet, signal_names, columns):
+
+        # Parsed columns can be moved out of process memory into memory-mapped scratch files
+        scratch_directory = data_set.load_options.get('scratch_directory')
+        scratch = ScratchDirectory(scratch_directory) if scratch_directory else None
+        time_key = data_set.time_key
+
+        time_array = columns.get(time_key) if time_key else None
+        if isinstance(time_array, ChunkedArray):
+            # Time stamps are searched all the time, so they are kept whole (or mapped). Uniform ones are looked up by
+            # arithmetic.
+            time_array = np.asarray(time_array)
+
+        if scratch and time_array is not None and not isinstance(time_array, np.memmap):
+            time_array = scratch.spill(time_array, data_set.name + '-' + time_key)
+
+        # Every column shares this one time axis
+        time_base = data_set.get_time_base(time_array)
+
+        # One loader for all unloaded columns, so those loaded together are read together
+        read_unloaded = functools.partial(CSV.read_unloaded, data_set)
 
         for name in signal_names:
 
             # Skip the time column if it's defined
-            if time_array is not None and name == time_key:
+            if time_base is not None and name == time_key:
+                continue
+
+            if name not in columns:
+                data_set.add_column(name, read_unloaded, time_array=time_base)
                 continue
 
+            value_array = columns[name]
+
+            # Columns from the parse cache are mapped already
+            if scratch and not isinstance(value_array, (ChunkedArray, np.memmap)):
+                value_array = scratch.spill(value_array, data_set.name + '-' + name)
+
             data_set.add_signal(
                 name=name,
-                value_array=data_frame.get(name),
-                time_array=time_array
+                value_array=value_array,
+                time_array=time_base
             )
-
-        return data_set
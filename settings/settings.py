@@ -56,6 +56,85 @@ class Settings(QtCore.QSettings):
     def overwrite_on_refresh(self, toggle):
         self.setValue('overwrite_on_refresh', toggle)
 
+    @property
+    def build_pyramids(self):
+        return self._try_bool('build_pyramids', True)
+
+    @build_pyramids.setter
+    def build_pyramids(self, toggle):
+        self.setValue('build_pyramids', toggle)
+
+    @property
+    def incremental_refresh(self):
+        # On refresh (with overwrite), parse only the rows appended to a file and extend its signals in place
+        return self._try_bool('incremental_refresh', True)
+
+    @incremental_refresh.setter
+    def incremental_refresh(self, toggle):
+        self.setValue('incremental_refresh', toggle)
+
+    @property
+    def downcast_integers(self):
+        return self._try_bool('downcast_integers', True)
+
+    @downcast_integers.setter
+    def downcast_integers(self, toggle):
+        self.setValue('downcast_integers', toggle)
+
+    @property
+    def float32_samples(self):
+        # Store float columns as float32 on load. Halves their memory at the cost of precision.
+        return self._try_bool('float32_samples', False)
+
+    @float32_samples.setter
+    def float32_samples(self, toggle):
+        self.setValue('float32_samples', toggle)
+
+    @property
+    def chunk_rows(self):
+        # Rows parsed (and samples stored) per chunk when loading large files chunk by chunk. 0 loads files whole.
+        return self._try_int('chunk_rows', 0)
+
+    @chunk_rows.setter
+    def chunk_rows(self, value):
+        self.setValue('chunk_rows', value)
+
+    @property
+    def scratch_directory(self):
+        # Where loaders spill parsed columns to memory-mapped files. Empty keeps columns in memory.
+        return self._try_value('scratch_directory', '')
+
+    @scratch_directory.setter
+    def scratch_directory(self, value):
+        self.setValue('scratch_directory', value)
+
+    @property
+    def lazy_columns(self):
+        # Register the columns of loaded files by name and read each one when it is first used
+        return self._try_bool('lazy_columns', True)
+
+    @lazy_columns.setter
+    def lazy_columns(self, toggle):
+        self.setValue('lazy_columns', toggle)
+
+    @property
+    def parse_cache_directory(self):
+        # Where parsed columns are kept between sessions, so unchanged files load without being parsed. Empty disables.
+        return self._try_value('parse_cache_directory', 'parse_cache')
+
+    @parse_cache_directory.setter
+    def parse_cache_directory(self, value):
+        self.setValue('parse_cache_directory', value)
+
+    @property
+    def parse_cache_size_mb(self):
+        # Least recently used files are dropped from the parse cache beyond this size
+        return self._try_int('parse_cache_size_mb', 4096)
+
+    @parse_cache_size_mb.setter
+    def parse_cache_size_mb(self, value):
+        self.setValue('parse_cache_size_mb', value)
+
     @property
     def loaded_workspace(self):
         return self._try_value('loaded_workspace', '')
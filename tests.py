@@ -1,4 +1,28 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
+
+import numpy as np
+import pandas
+from scipy import signal as scipy_signal
+
+from data_flow.signals import Signal, FloatTimeSeries, IntegerTimeSeries, NonNumericTimeSeries, SignalGenerator
+from data_flow.signal_statistics import SignalStatistics
+from data_flow.decimation import Decimation
+from data_flow.pyramid import SignalPyramid
+from data_flow.memory_mapping import ScratchDirectory
+from data_flow.time_base import TimeBase
+from data_flow.data_set import DataSet
+from data_flow.dtype_policy import DtypePolicy
+from data_flow.cursor import SignalCursor
+from data_flow.alignment import SignalAlignment
+from data_flow.derived_signals import SignalExpression, DerivedSignal
+from data_flow.spectral import SpectralAnalysis
+from data_flow.filters import RollingFilter, FilteredSignal
+from data_flow.chunked_array import ChunkedArray
+from data_flow.file_fingerprint import FileFingerprint
+from data_flow.parse_cache import ParseCache
 
 
 class TestCase(unittest.TestCase):
@@ -7,5 +31,1104 @@ class TestCase(unittest.TestCase):
         pass
 
 
+class TestSignalStatistics(unittest.TestCase):
+
+    def test_matches_numpy(self):
+        values = np.array([3.0, 1.0, 4.0, 1.0, 5.0, 9.0, 2.0, 6.0])
+        stats = SignalStatistics.from_samples(values)
+
+        self.assertEqual(stats.min, np.min(values))
+        self.assertEqual(stats.max, np.max(values))
+        self.assertAlmostEqual(stats.avg, np.mean(values))
+        self.assertAlmostEqual(stats.med, np.median(values))
+        self.assertEqual(stats.mode, 1.0)
+        self.assertAlmostEqual(stats.std, np.std(values))
+
+    def test_chunked_matches_in_memory(self):
+        values = np.random.RandomState(1).randn(20001).round(2)
+        in_memory = SignalStatistics.from_samples(values)
+        chunked = SignalStatistics.from_chunks(lambda: SignalStatistics.iterate_chunks(values, 999))
+
+        for key in ('count', 'min', 'max', 'med'):
+            self.assertEqual(getattr(in_memory, key), getattr(chunked, key))
+
+        self.assertAlmostEqual(in_memory.avg, chunked.avg)
+        self.assertAlmostEqual(in_memory.std, chunked.std)
+
+    def test_empty(self):
+        self.assertIsNone(SignalStatistics.from_samples([]).min)
+
+    def test_cached_until_samples_change(self):
+        signal = Signal([1, 2, 3], signal_path='set/sig')
+        stats = signal.statistics
+        self.assertIs(stats, signal.statistics)
+
+        signal._value_array = np.array([4, 5, 6])
+        signal.samples_changed()
+        self.assertEqual(signal.min, 4)
+
+
+class TestFloatTimeSeries(unittest.TestCase):
+
+    def test_lazy_interpolation_and_cache(self):
+        signal = FloatTimeSeries(time_array=np.arange(10.0), value_array=np.arange(10.0) ** 2, signal_path='set/sig')
+        self.assertIsNone(signal._interpolation)
+
+        grid = np.linspace(0.0, 9.0, 50)
+        time, values = signal.evaluate_interpolation(grid)
+        self.assertIsNotNone(signal._interpolation)
+        self.assertIs(values, signal.evaluate_interpolation(grid.copy())[1])
+        self.assertFalse(values.flags.writeable)
+
+    def test_cache_byte_limit(self):
+        signal = FloatTimeSeries(time_array=np.arange(1000.0),
+                                 value_array=np.arange(1000.0) ** 2,
+                                 signal_path='set/sig')
+        nbytes = 2 * 8 * 300
+
+        with mock.patch.object(FloatTimeSeries, 'evaluation_cache_nbytes',
+                               2 * nbytes):
+            grids = [np.linspace(0.0, 990.0, 300) + offset
+                     for offset in (0.0, 0.1, 0.2)]
+            for grid in grids:
+                signal.evaluate_interpolation(grid)
+
+            # The oldest grid was dropped to stay within the limit
+            self.assertEqual(signal._evaluation_cache.nbytes, 2 * nbytes)
+
+            # Too large to keep at all
+            time, _ = signal.evaluate_interpolation(interp_factor=10.0)
+            self.assertEqual(len(time), 10000)
+            self.assertEqual(signal._evaluation_cache.nbytes, 2 * nbytes)
+
+
+class TestDecimation(unittest.TestCase):
+
+    def test_min_max_keeps_extremes(self):
+        time = np.arange(100000.0)
+        values = np.sin(time / 1000.0)
+        values[54321] = 10.0
+
+        reduced_time, reduced_values = Decimation.min_max(time, values, 500)
+        self.assertLessEqual(len(reduced_values), 1000)
+        self.assertEqual(np.max(reduced_values), 10.0)
+        self.assertTrue(np.all(np.diff(reduced_time) >= 0))
+
+    def test_lttb_size(self):
+        time = np.arange(10000.0)
+        reduced_time, _ = Decimation.lttb(time, np.cos(time), 300)
+        self.assertEqual(len(reduced_time), 300)
+        self.assertEqual(reduced_time[0], 0.0)
+        self.assertEqual(reduced_time[-1], 9999.0)
+
+    def test_signal_window(self):
+        signal = FloatTimeSeries(time_array=np.arange(10000.0), value_array=np.arange(10000.0), signal_path='set/s')
+        time, _ = signal.decimate(1000.0, 2000.0, pixel_count=100)
+        self.assertLessEqual(len(time), 200)
+        self.assertEqual(time[0], 999.0)
+        self.assertEqual(time[-1], 2001.0)
+
+
+class TestSignalPyramid(unittest.TestCase):
+
+    def test_levels(self):
+        values = np.random.RandomState(0).randn(100001)
+        pyramid = SignalPyramid.build(values, block_size=16, min_block_count=4)
+
+        for level in range(pyramid.level_count):
+            mins, maxs, means = pyramid.level(level)
+            block = pyramid.samples_per_block(level)
+            self.assertEqual(len(mins), -(-len(values) // block))
+            self.assertEqual(mins[-1], np.min(values[(len(mins) - 1) * block:]))
+            self.assertEqual(maxs[0], np.max(values[:block]))
+            self.assertAlmostEqual(means[1], np.mean(values[block:2 * block]), places=5)
+
+    def test_round_trip(self):
+        pyramid = SignalPyramid.build(np.arange(5000.0), block_size=8, min_block_count=4)
+        restored = SignalPyramid.from_arrays(pyramid.to_arrays('sig|'), 'sig|')
+        self.assertEqual(restored.level_count, pyramid.level_count)
+        self.assertEqual(restored.nbytes, pyramid.nbytes)
+
+
+class TestSignalWindows(unittest.TestCase):
+
+    def setUp(self):
+        self.signal = FloatTimeSeries(
+            time_array=np.arange(0.0, 100.0, 0.5), value_array=np.arange(200.0), signal_path='set/sig')
+
+    def test_window_is_view(self):
+        time, values = self.signal.window(10.0, 20.0)
+        self.assertEqual(time[0], 10.0)
+        self.assertEqual(time[-1], 20.0)
+        self.assertTrue(np.shares_memory(values, self.signal.samples))
+
+    def test_iterate_windows(self):
+        chunks = list(self.signal.iterate_windows(7.0))
+        self.assertEqual(sum(len(time) for time, _ in chunks), self.signal.length)
+        self.assertTrue(all(time[-1] - time[0] < 7.0 for time, _ in chunks))
+        np.testing.assert_array_equal(np.concatenate([values for _, values in chunks]), self.signal.samples)
+
+
+class TestMemoryMappedSignals(unittest.TestCase):
+
+    def test_spilled_signal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            scratch = ScratchDirectory(directory)
+            time = np.linspace(0.0, 100.0, 5000)
+            values = np.sin(time)
+
+            signal = FloatTimeSeries(
+                time_array=scratch.spill(time, 'time'), value_array=scratch.spill(values, 'sig'), signal_path='set/sig')
+            reference = FloatTimeSeries(time_array=time, value_array=values, signal_path='set/sig')
+
+            self.assertTrue(signal.is_memory_mapped)
+            self.assertAlmostEqual(signal.med, reference.med)
+
+            grid = np.linspace(10.0, 20.0, 333)
+            np.testing.assert_allclose(
+                signal.evaluate_interpolation(grid)[1], reference.evaluate_interpolation(grid)[1])
+
+            del signal
+
+    def test_narrowed_integer_mode(self):
+        with tempfile.TemporaryDirectory() as directory:
+            values = DtypePolicy(downcast_integers=True).apply(np.array([-100, 100, 5, 5, 3]))
+            self.assertEqual(values.dtype, np.int8)
+
+            signal = Signal(value_array=ScratchDirectory(directory).spill(values, 'sig'), signal_path='set/sig')
+            self.assertTrue(signal.is_memory_mapped)
+            self.assertEqual(signal.mode, 5)
+            self.assertEqual((signal.min, signal.max), (-100, 100))
+
+            del signal
+
+
+class TestTimeBase(unittest.TestCase):
+
+    def test_index_matches_searchsorted(self):
+        random = np.random.RandomState(2)
+        time = np.sort(np.round(random.rand(20000) * 100.0, 2))
+        time_base = TimeBase(time)
+        self.assertTrue(time_base.is_monotonic)
+        self.assertFalse(time_base.is_uniform)
+
+        for eval_time in np.concatenate([random.rand(200) * 110.0 - 5.0, time[::997]]):
+            for side in ('left', 'right'):
+                self.assertEqual(time_base.index_after_time(eval_time, side), np.searchsorted(time, eval_time, side))
+
+    def test_uniform_and_read_only(self):
+        time_base = TimeBase(np.arange(1000) * 0.01 + 5.0)
+        self.assertAlmostEqual(time_base.sample_period, 0.01)
+        self.assertEqual(time_base.t_start, 5.0)
+        self.assertFalse(time_base.array.flags.writeable)
+
+    def test_compact_uniform_lookup(self):
+        time_base = TimeBase.uniform(-3.0, 0.001, 50000)
+        self.assertTrue(time_base.is_compact)
+        self.assertEqual(time_base.nbytes, 0)
+        np.testing.assert_allclose(time_base.array, np.arange(50000) * 0.001 - 3.0, atol=1e-9)
+        self.assertIs(time_base.window(10, 20), time_base.window(10, 20))
+
+        generated = time_base.array
+        queries = np.concatenate([np.random.RandomState(3).rand(500) * 60.0 - 5.0, generated[::101], [np.nan]])
+        for side in ('left', 'right'):
+            np.testing.assert_array_equal(
+                time_base.index_after_time(queries, side), np.searchsorted(generated, queries, side))
+            self.assertEqual(
+                time_base.index_after_time(generated[777], side), np.searchsorted(generated, generated[777], side))
+
+    def test_uniform_keeps_time_stamps(self):
+        # Within the tolerance of the grid but not on it; look-ups still match the stored time stamps
+        time = (np.arange(50000) * 0.001 - 3.0).astype(np.float32)
+        time_base = TimeBase(time, uniform_tolerance=1e-2)
+        self.assertTrue(time_base.is_uniform)
+        self.assertFalse(time_base.is_compact)
+        self.assertEqual(time_base.array.dtype, np.float32)
+        self.assertTrue(np.shares_memory(time_base.window(100, 200), time))
+
+        queries = np.concatenate([np.random.RandomState(3).rand(500) * 60.0 - 5.0, time[::101]])
+        for side in ('left', 'right'):
+            np.testing.assert_array_equal(
+                time_base.index_after_time(queries, side), np.searchsorted(time, queries, side))
+
+    def test_jitter_keeps_array(self):
+        time = np.arange(1000) * 0.01 + np.random.RandomState(4).rand(1000) * 0.001
+        self.assertFalse(TimeBase(time).is_compact)
+
+    def test_compact_when_exact(self):
+        # As parsed from a text file: decimal stamps, and integer milliseconds
+        time = np.array([float('%.2f' % (i * 0.01)) for i in range(5000)])
+        time_base = TimeBase(time, compact=True)
+        self.assertTrue(time_base.is_compact)
+        np.testing.assert_array_equal(time_base.array, time)
+        self.assertEqual(time_base.times_at(4321), time[4321])
+
+        milliseconds = np.arange(0, 50000, 10, dtype=np.int64)
+        time_base = TimeBase(milliseconds, compact=True)
+        self.assertTrue(time_base.is_compact)
+        self.assertEqual(time_base.array.dtype, np.int64)
+        np.testing.assert_array_equal(time_base.array, milliseconds)
+
+        time_base.extend(np.arange(50000, 50100, 10, dtype=np.int64))
+        self.assertTrue(time_base.is_compact)
+        time_base.extend(np.array([50101], dtype=np.int64))
+        self.assertFalse(time_base.is_compact)
+        self.assertEqual(time_base.times_at(-1), 50101)
+
+    def test_compact_keeps_time_stamps_off_grid(self):
+        # Within the tolerance of the grid but not on it
+        time = np.arange(5000) * 0.001 + \
+            np.random.RandomState(5).rand(5000) * 1e-6
+        time_base = TimeBase(time, 1e-2, compact=True)
+        self.assertTrue(time_base.is_uniform)
+        self.assertFalse(time_base.is_compact)
+        self.assertTrue(np.shares_memory(time_base.array, time))
+
+        # Cast back to float32, the grid gives these exactly
+        time = (np.arange(50000) * 0.001 - 3.0).astype(np.float32)
+        time_base = TimeBase(time, 1e-2, compact=True)
+        self.assertTrue(time_base.is_compact)
+        np.testing.assert_array_equal(time_base.array, time)
+
+    def test_empty_uniform(self):
+        time_base = TimeBase.uniform(0.0, 0.1, 0)
+        self.assertIsNone(time_base.t_start)
+        self.assertEqual(len(time_base.array), 0)
+        self.assertEqual(time_base.index_after_time(1.0), 0)
+        np.testing.assert_array_equal(
+            time_base.index_after_time(np.array([1.0, 2.0])), [0, 0])
+        with self.assertRaises(IndexError):
+            time_base.times_at(0)
+
+        time_base.extend(np.array([1.0, 2.0]))
+        self.assertEqual(time_base.t_start, 1.0)
+        self.assertEqual(time_base.index_after_time(1.5), 1)
+
+    def test_data_set_compacts_loaded_axes(self):
+        data_set = DataSet(lambda: None, __file__, name='set')
+        time = np.arange(1000) * 0.5
+        data_set.add_signal('a', np.random.rand(1000), time_array=time)
+        self.assertTrue(data_set.signal_dict['a'].time_base.is_compact)
+        self.assertIs(data_set.get_time_base(time),
+                      data_set.signal_dict['a'].time_base)
+
+    def test_shared_by_data_set(self):
+        data_set = DataSet(lambda: None, __file__, name='set')
+        time = np.arange(100.0)
+        data_set.add_signal('a', np.random.rand(100), time_array=time)
+        data_set.add_signal('b', np.arange(100), time_array=time)
+
+        self.assertEqual(len(data_set.time_bases), 1)
+        self.assertIs(data_set.signal_dict['a'].time_base, data_set.signal_dict['b'].time_base)
+
+
+class TestIntegerTimeSeries(unittest.TestCase):
+
+    def test_zero_order_hold(self):
+        signal = IntegerTimeSeries(
+            time_array=np.arange(5.0), value_array=[5, 5, 7, 9, 9], signal_path='set/state')
+
+        values = signal.get_values_at_times(np.array([-1.0, 0.0, 1.5, 2.0, 3.9, 10.0]))
+        self.assertIsInstance(values, np.ndarray)
+        np.testing.assert_array_equal(values, [5, 5, 5, 7, 9, 9])
+        self.assertEqual(signal.get_value_at_time(2.5), 7)
+
+    def test_categorical_codes(self):
+        values = np.array([3, 1, 3, 2, 3, 1])
+        signal = IntegerTimeSeries(time_array=np.arange(6.0), value_array=values, signal_path='set/state')
+
+        self.assertEqual(signal.codes.dtype, np.uint8)
+        np.testing.assert_array_equal(signal.categories, [1, 2, 3])
+        np.testing.assert_array_equal(signal.samples, values)
+        self.assertEqual(signal.mode, 3)
+        self.assertAlmostEqual(signal.med, np.median(values))
+        self.assertAlmostEqual(signal.std, np.std(values))
+
+    def test_non_numeric_mode(self):
+        signal = NonNumericTimeSeries(
+            time_array=np.arange(4.0), value_array=np.array(['a', 'b', 'b', 'c'], dtype=object), signal_path='set/s')
+
+        self.assertEqual(signal.mode, 'b')
+        self.assertTrue(np.isnan(signal.min))
+
+    def test_run_length_encoding(self):
+        values = np.repeat([2, 0, 5, 2], [40000, 10000, 30000, 20000])
+        time = np.arange(len(values)) * 0.01
+        signal = IntegerTimeSeries(time_array=time, value_array=values, signal_path='set/gear')
+
+        self.assertTrue(signal.is_run_length_encoded)
+        self.assertEqual(len(signal.runs[0]), 4)
+        self.assertEqual(signal.length, len(values))
+        np.testing.assert_array_equal(signal.samples, values)
+
+        query = np.array([-1.0, 0.0, 399.99, 400.0, 500.5, 10000.0])
+        np.testing.assert_array_equal(signal.get_values_at_times(query), [2, 2, 2, 0, 5, 2])
+        self.assertEqual(signal.get_value_at_time(650.0), 5)
+
+        self.assertEqual(signal.mode, 2)
+        self.assertAlmostEqual(signal.avg, np.mean(values))
+        self.assertAlmostEqual(signal.med, np.median(values))
+        self.assertAlmostEqual(signal.std, np.std(values))
+
+        window_time, window_codes = signal.window(399.0, 401.0)
+        np.testing.assert_array_equal(signal.decode_samples(window_codes), values[39900:40101])
+        self.assertEqual(len(window_time), len(window_codes))
+
+        time, decimated = signal.decimate(pixel_count=100)
+        self.assertLessEqual(len(decimated), 200)
+        self.assertEqual(set(decimated), {0, 2, 5})
+
+    def test_duration_statistics(self):
+        # Value 1 is held for 9 of the 10 seconds, although it covers only one of three samples
+        signal = IntegerTimeSeries(time_array=[0.0, 9.0, 9.5], value_array=[1, 3, 3], signal_path='set/state')
+
+        self.assertEqual(signal.mode, 3)
+        self.assertEqual(signal.duration_statistics.mode, 1)
+        self.assertAlmostEqual(signal.duration_statistics.avg, (9.0 * 1 + 0.5 * 3) / 9.5)
+
+
+class TestDtypePolicy(unittest.TestCase):
+
+    def test_integer_downcast(self):
+        policy = DtypePolicy()
+
+        self.assertEqual(policy.apply(np.array([0, 4095])).dtype, np.uint16)
+        self.assertEqual(policy.apply(np.array([-1, 100])).dtype, np.int8)
+        self.assertEqual(policy.apply(np.array([0, 2 ** 40])).dtype, np.int64)
+        self.assertEqual(policy.apply(np.array([True, False])).dtype, np.bool_)
+        self.assertEqual(policy.apply(np.array([0.5, 1.5])).dtype, np.float64)
+
+    def test_float32_statistics(self):
+        values = np.random.default_rng(3).normal(1e4, 1.0, 10000)
+        signal = SignalGenerator.generate_signal(
+            time_array=np.arange(10000.0), time_units='s', value_array=values, value_units=None,
+            signal_path='set/value', dtype_policy=DtypePolicy.from_value({'downcast_integers': True, 'float32': True}))
+
+        self.assertEqual(signal.samples.dtype, np.float32)
+        self.assertEqual(signal.avg.dtype, np.float64)
+        self.assertAlmostEqual(signal.avg, np.mean(values.astype(np.float32), dtype=np.float64), places=9)
+        self.assertAlmostEqual(signal.std, np.std(values), places=3)
+
+
+class TestDataSetIndex(unittest.TestCase):
+
+    def test_flat_index_and_rename(self):
+        data_set = DataSet(lambda: None, __file__, name='set')
+        time = np.arange(100.0)
+        data_set.add_signal('speed [kph]', np.random.rand(100), time_array=time, relative_path='car')
+        data_set.add_signal('gear', np.arange(100) // 10, time_array=time, relative_path='car')
+        data_set.add_filter('car/speed', 'mean', 5)
+
+        speed = data_set.signal_dict['car']['speed']
+        self.assertIs(data_set.get_signal('car/speed'), speed)
+        self.assertEqual(list(data_set.signal_index), ['car/speed', 'car/gear', 'car/speed_mean5'])
+        self.assertIsInstance(data_set.get_item('car'), dict)
+
+        data_set.name = 'renamed'
+        self.assertEqual(speed.path, 'renamed/car/speed [kph]')
+        self.assertEqual(data_set.get_signal('car/speed_mean5').path, 'renamed/car/speed_mean5')
+
+        # Renaming a single signal leaves the rest of the data set alone
+        speed.change_data_set_name('other')
+        self.assertEqual(speed.path, 'other/car/speed [kph]')
+        self.assertEqual(data_set.get_signal('car/gear').path, 'renamed/car/gear')
+
+
+class TestSignalCursor(unittest.TestCase):
+
+    def test_grouped_values(self):
+        time_base = TimeBase(np.cumsum(np.full(1000, 0.1)) + np.linspace(0.0, 0.01, 1000))
+        speed = FloatTimeSeries(time_array=time_base, value_array=np.arange(1000.0), signal_path='set/speed')
+        gear = IntegerTimeSeries(time_array=time_base, value_array=np.arange(1000) // 100, signal_path='set/gear')
+        other = FloatTimeSeries(time_array=np.arange(10.0), value_array=np.arange(10.0) * 2, signal_path='b/x')
+
+        cursor = SignalCursor([speed, gear, other])
+        self.assertEqual(cursor.group_count, 2)
+
+        # Forward playback advances the stored index, a jump back searches again; both must agree with a fresh search
+        for time_s in [0.0, 5.05, 5.3, 12.0, 55.5, 3.0, 1000.0]:
+            values = cursor.values_at(time_s)
+            expected_speed = np.interp(time_s, time_base.array, np.arange(1000.0))
+
+            self.assertAlmostEqual(values['set/speed'], expected_speed)
+            self.assertEqual(values['set/gear'], gear.get_value_at_time(time_s))
+            self.assertAlmostEqual(values['b/x'], np.interp(time_s, np.arange(10.0), np.arange(10.0) * 2))
+
+    def test_follows_interpolant(self):
+        # Between samples the cursor reads the plotted PCHIP curve, for
+        # every float signal of a group at once
+        time_base = TimeBase(np.arange(200.0) ** 1.1)
+        sine = FloatTimeSeries(
+            time_array=time_base, value_array=np.sin(np.arange(200.0)),
+            signal_path='set/sin')
+        ramp = FloatTimeSeries(
+            time_array=time_base,
+            value_array=np.arange(200.0, dtype=np.float32) ** 2,
+            signal_path='set/ramp')
+        label = NonNumericTimeSeries(
+            time_array=time_base, value_array=np.array(list('ab' * 100)),
+            signal_path='set/label')
+        gear = IntegerTimeSeries(time_array=time_base,
+                                 value_array=np.arange(200) // 10,
+                                 signal_path='set/gear')
+        cursor = SignalCursor([sine, ramp, label, gear])
+
+        for time_s in [0.0, 2.5, 77.25, time_base.t_end, 1e6]:
+            values = cursor.values_at(time_s)
+            clipped = min(time_s, time_base.t_end)
+            for signal in (sine, ramp):
+                np.testing.assert_allclose(
+                    values[signal.path], signal.interpolation(clipped),
+                    rtol=1e-9)
+
+            for signal in (label, gear):
+                self.assertEqual(values[signal.path],
+                                 signal.get_value_at_time(time_s))
+
+
+class TestSignalAlignment(unittest.TestCase):
+
+    def setUp(self):
+        self.fast = FloatTimeSeries(
+            time_array=np.arange(1001) * 0.01, value_array=np.sin(np.arange(1001) * 0.01), signal_path='a/fast')
+        self.slow = FloatTimeSeries(
+            time_array=np.arange(2.0, 21.0), value_array=np.arange(2.0, 21.0) ** 2, signal_path='b/slow')
+        self.state = IntegerTimeSeries(
+            time_array=np.arange(0.0, 10.0, 0.5), value_array=np.arange(20) // 4, signal_path='b/state')
+
+    def test_chunked_grid(self):
+        alignment = SignalAlignment([self.fast, self.slow, self.state], chunk_size=37)
+        aligned = alignment.align()
+
+        self.assertEqual(aligned.time_base.sample_period, 0.01)
+        self.assertEqual(aligned.values.shape, (2001, 3))
+
+        time = aligned.time
+        inside = time <= 10.0
+        np.testing.assert_allclose(
+            aligned.column('a/fast')[inside], np.interp(time[inside], self.fast.time_array, self.fast.samples))
+        self.assertTrue(np.all(np.isnan(aligned.column('a/fast')[~inside])))
+        self.assertTrue(np.all(np.isnan(aligned.column('b/slow')[time < 2.0])))
+        np.testing.assert_array_equal(aligned.column('b/state')[time <= 9.5], self.state.get_values_at_times(
+            time[time <= 9.5]))
+
+    def test_memory_cap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            alignment = SignalAlignment([self.fast, self.slow], memory_cap=4096, scratch_directory=directory)
+            aligned = alignment.align(t_start=2.0, t_end=10.0, sample_period=0.005)
+
+            expected = SignalAlignment([self.fast, self.slow]).align(t_start=2.0, t_end=10.0, sample_period=0.005)
+
+            self.assertTrue(aligned.is_memory_mapped)
+            self.assertFalse(expected.is_memory_mapped)
+            np.testing.assert_array_equal(aligned.values, expected.values)
+
+
+class TestDerivedSignals(unittest.TestCase):
+
+    def setUp(self):
+        time = np.arange(100) * 0.1
+        self.signals = {
+            'run_1/speed': FloatTimeSeries(time_array=time, value_array=np.sin(time), signal_path='run_1/speed'),
+            'run_1/gear': IntegerTimeSeries(time_array=time, value_array=np.arange(100) // 10,
+                                            signal_path='run_1/gear'),
+            'run_2/speed': FloatTimeSeries(time_array=time + 0.05, value_array=np.cos(time), signal_path='run_2/speed'),
+        }
+
+    def derive(self, expression, variables=None):
+        return DerivedSignal(
+            SignalExpression(expression, self.signals.__contains__, variables), self.signals.get, 'derived/x')
+
+    def test_expressions(self):
+        speed = self.signals['run_1/speed'].samples
+        gear = np.arange(100) // 10
+
+        np.testing.assert_allclose(self.derive('abs(run_1/speed) * run_1/gear + 1').samples, np.abs(speed) * gear + 1)
+        np.testing.assert_allclose(self.derive('{run_1/speed} / 2').samples, speed / 2)
+        np.testing.assert_allclose(self.derive('a * b', {'a': 'run_1/speed', 'b': 'run_1/gear'}).samples, speed * gear)
+
+        for expression in ['run_1/missing + 1', '__import__("os")', 'run_1/speed.real', '1 + 2']:
+            with self.assertRaises((ValueError, KeyError)):
+                self.derive(expression)
+
+    def test_windows_and_other_time_bases(self):
+        difference = self.derive('run_1/speed - run_2/speed')
+        self.assertIs(difference.time_base, self.signals['run_1/speed'].time_base)
+
+        time, values = difference.window(2.0, 3.0)
+        expected = np.sin(time) - np.interp(time, np.arange(100) * 0.1 + 0.05, np.cos(np.arange(100) * 0.1))
+        np.testing.assert_allclose(values, expected)
+        self.assertTrue(np.isnan(difference.samples[0]))
+
+        # Windows are cached and shared read-only
+        self.assertIs(difference.window(2.0, 3.0)[1], values)
+        self.assertFalse(values.flags.writeable)
+
+    def test_rebind_invalidates_dependents(self):
+        scaled = self.derive('run_1/speed * 2')
+        self.signals['derived/x'] = scaled
+        offset = DerivedSignal(
+            SignalExpression('{derived/x} + 1', self.signals.__contains__), self.signals.get, 'derived/y')
+        self.assertAlmostEqual(offset.max, 3.0, places=2)
+
+        time = np.arange(50) * 0.1
+        self.signals['run_1/speed'] = FloatTimeSeries(time_array=time, value_array=time, signal_path='run_1/speed')
+
+        self.assertTrue(scaled.rebind(self.signals.get))
+        self.assertTrue(offset.rebind(self.signals.get))
+        self.assertFalse(offset.rebind(self.signals.get))
+
+        self.assertEqual(offset.length, 50)
+        np.testing.assert_allclose(offset.samples, time * 2 + 1)
+
+
+class TestSpectralAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.time = np.arange(20000) / 1000.0
+        self.values = 3.0 * np.sin(2 * np.pi * 50.0 * self.time) + np.random.default_rng(0).normal(0, 0.1, 20000)
+        self.signal = FloatTimeSeries(time_array=self.time, value_array=self.values, signal_path='set/vibration')
+
+    def test_fft_and_cache(self):
+        analysis = SpectralAnalysis()
+        frequencies, amplitude = analysis.fft(self.signal, 0.0, 10.0)
+
+        self.assertAlmostEqual(frequencies[np.argmax(amplitude)], 50.0, places=1)
+        self.assertAlmostEqual(np.max(amplitude), 3.0, delta=0.1)
+        self.assertIs(analysis.fft(self.signal, 0.0, 10.0)[1], amplitude)
+        self.assertIsNot(analysis.fft(self.signal, 0.0, 5.0)[1], amplitude)
+
+    def test_chunked_spectrogram(self):
+        analysis = SpectralAnalysis()
+        analysis.chunk_size = 1000
+        stored_values = FloatTimeSeries.stored_values
+        with mock.patch.object(FloatTimeSeries, 'stored_values', autospec=True,
+                               side_effect=stored_values) as read:
+            frequencies, times, power = analysis.spectrogram(
+                self.signal, segment_length=256)
+
+        # Read a chunk (and one segment) at a time, not the whole window
+        self.assertGreater(read.call_count, 1)
+        self.assertLessEqual(
+            max(call[0][2] - call[0][1] for call in read.call_args_list),
+            analysis.chunk_size + 256)
+
+        expected = scipy_signal.spectrogram(self.values, fs=1000.0, window='hann', nperseg=256)
+
+        np.testing.assert_allclose(frequencies, expected[0])
+        np.testing.assert_allclose(times, expected[1])
+        np.testing.assert_allclose(power, expected[2], rtol=1e-6, atol=1e-12)
+
+        _, times, power = analysis.spectrogram(self.signal, segment_length=256, max_segments=10)
+        self.assertLessEqual(power.shape[1], 10)
+
+    def test_non_uniform_psd(self):
+        jittered = self.time + np.random.default_rng(1).uniform(0, 2e-4, len(self.time))
+        signal = FloatTimeSeries(
+            time_array=jittered, value_array=3.0 * np.sin(2 * np.pi * 50.0 * jittered), signal_path='set/jittered')
+
+        frequencies, density = SpectralAnalysis().psd(signal)
+        self.assertAlmostEqual(frequencies[np.argmax(density)], 50.0, delta=1.0)
+
+
+class TestRollingFilters(unittest.TestCase):
+
+    def test_against_naive_windows(self):
+        values = np.random.default_rng(5).normal(0, 1, 500)
+        ints = np.random.default_rng(6).integers(-50, 50, 500).astype(np.int16)
+
+        for window in [1, 2, 7, 64, 499, 800]:
+            naive = [values[max(0, i - window + 1):i + 1] for i in range(len(values))]
+            naive_ints = [ints[max(0, i - window + 1):i + 1] for i in range(len(ints))]
+
+            np.testing.assert_allclose(RollingFilter.mean(values, window), [np.mean(w) for w in naive])
+            np.testing.assert_allclose(RollingFilter.rms(values, window), [np.sqrt(np.mean(w ** 2)) for w in naive])
+            np.testing.assert_array_equal(RollingFilter.minimum(values, window), [np.min(w) for w in naive])
+            np.testing.assert_array_equal(RollingFilter.maximum(ints, window), [np.max(w) for w in naive_ints])
+
+    def test_derivative_and_integral(self):
+        time = np.sort(np.random.default_rng(7).uniform(0, 10, 2000))
+        values = time ** 2
+
+        np.testing.assert_allclose(RollingFilter.derivative(time, values)[1:-1], 2 * time[1:-1], atol=1e-6)
+        np.testing.assert_allclose(RollingFilter.integral(time, values), (time ** 3 - time[0] ** 3) / 3, atol=1e-3)
+
+    def test_chunked_source(self):
+        time = np.sort(np.random.default_rng(8).uniform(0, 10, 1000))
+        values = np.random.default_rng(9).normal(0, 1, 1000)
+        source = FloatTimeSeries(time_array=time, value_array=ChunkedArray.from_array(values, chunk_size=64),
+                                 signal_path='set/source')
+        reference = FloatTimeSeries(time_array=time, value_array=values, signal_path='set/reference')
+
+        with mock.patch.object(FilteredSignal, 'chunk_size', 100):
+            for operation, window in [('mean', 7), ('rms', 250), ('min', 3), ('max', 1000), ('derivative', None),
+                                      ('integral', None)]:
+                filtered = FilteredSignal(source, operation, window)
+                expected = FilteredSignal(reference, operation, window)
+
+                self.assertTrue(filtered.materialize().chunk_count > 1)
+                np.testing.assert_allclose(filtered.samples[:], expected.samples, atol=1e-9)
+
+    def test_lazy_signal_in_data_set(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fd:
+            fd.write('t,speed\n' + ''.join('{},{}\n'.format(t, t % 7) for t in range(100)))
+
+        from plugins.file_types.csv import CSV
+        data_set = CSV.load(fd.name, 't')
+        signal = data_set.add_filter('speed', RollingFilter.MAX, 5)
+
+        self.assertIsInstance(signal, FilteredSignal)
+        self.assertEqual(signal.path, data_set.name + '/speed_max5')
+        self.assertIs(data_set.get_signal('speed_max5'), signal)
+        self.assertFalse(signal.is_computed)
+
+        np.testing.assert_array_equal(signal.window(10.0, 12.0)[1], [6, 4, 5])
+        self.assertTrue(signal.is_computed)
+        self.assertEqual(data_set.generate_json_dict()['filters'], [{'path': 'speed', 'operation': 'max', 'window': 5}])
+
+
+class TestChunkedSignals(unittest.TestCase):
+
+    def test_chunked_array(self):
+        values = np.random.default_rng(8).normal(0, 1, 10007)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for storage in [ChunkedArray.MEMORY, ChunkedArray.COMPRESSED, ChunkedArray.DISK]:
+                chunked = ChunkedArray(chunk_size=1000, storage=storage, directory=directory)
+                for start in range(0, len(values), 777):
+                    chunked.append(values[start:start + 777])
+
+                self.assertEqual(len(chunked), len(values))
+                self.assertEqual(chunked.chunk_count, 11)
+                np.testing.assert_array_equal(chunked[995:2010], values[995:2010])
+                np.testing.assert_array_equal(chunked[::-3], values[::-3])
+                np.testing.assert_array_equal(chunked[[5, -1, 4000, 999]], values[[5, -1, 4000, 999]])
+                self.assertEqual(chunked[-2], values[-2])
+
+            self.assertEqual(chunked.astype(np.float32).dtype, np.float32)
+
+    def test_chunked_signal(self):
+        values = np.random.default_rng(9).normal(0, 1, 50000)
+        time = np.arange(50000) * 0.001
+
+        signal = FloatTimeSeries(time_array=time, value_array=ChunkedArray.from_array(
+            values, chunk_size=4096, storage=ChunkedArray.COMPRESSED), signal_path='set/chunked')
+        reference = FloatTimeSeries(time_array=time, value_array=values, signal_path='set/reference')
+
+        self.assertTrue(signal.is_chunked)
+        self.assertAlmostEqual(signal.avg, reference.avg)
+        self.assertAlmostEqual(signal.std, reference.std)
+        self.assertAlmostEqual(signal.med, reference.med)
+        np.testing.assert_array_equal(signal.window(10.0, 12.5)[1], reference.window(10.0, 12.5)[1])
+
+        with mock.patch.object(FloatTimeSeries, 'decimation_chunk_size', 5000):
+            np.testing.assert_array_equal(
+                signal.decimate(pixel_count=100)[1], Decimation.min_max(time, values, 100)[1])
+        query = np.array([0.0, 20.0005, 49.9])
+        np.testing.assert_allclose(signal.interpolation(query), reference.interpolation(query))
+
+    def test_chunked_integer_encoding(self):
+        time = np.arange(10000) * 0.01
+        for values in [np.arange(10000) // 1000, np.random.default_rng(4).integers(0, 5, 10000)]:
+            signal = IntegerTimeSeries(time_array=time, value_array=ChunkedArray.from_array(
+                values, chunk_size=1000, storage=ChunkedArray.COMPRESSED), signal_path='set/chunked')
+            reference = IntegerTimeSeries(time_array=time, value_array=values, signal_path='set/reference')
+
+            # Runs across chunk boundaries, or codes kept chunked when runs don't pay off
+            self.assertEqual(signal.is_run_length_encoded, reference.is_run_length_encoded)
+            self.assertEqual(signal.is_chunked, not reference.is_run_length_encoded)
+            np.testing.assert_array_equal(signal.runs[0], reference.runs[0])
+            np.testing.assert_array_equal(signal.samples, values)
+            self.assertEqual(signal.mode, reference.mode)
+            np.testing.assert_array_equal(signal.get_values_at_times([0.5, 55.55]), values[[50, 5555]])
+
+            signal.append_samples([7, 7])
+            np.testing.assert_array_equal(signal.categories, np.union1d(values, [7]))
+
+    def test_chunked_csv(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fd:
+            fd.write('t,value,state,label\n' + ''.join(
+                '{},{},{},{}\n'.format(t * 0.01, t * 0.5, t // 100, 'ab'[t % 2]) for t in range(1000)))
+
+        from plugins.file_types.csv import CSV
+        data_set = CSV.load(fd.name, 't', chunk_rows=64, dtype_policy={'downcast_integers': True, 'float32': False})
+        signals = {signal.name: signal for signal in data_set.signals}
+
+        self.assertTrue(signals['value'].is_chunked)
+        self.assertEqual(data_set.load_options['chunk_rows'], 64)
+        self.assertAlmostEqual(signals['value'].max, 499.5)
+        np.testing.assert_array_equal(signals['state'].samples, np.arange(1000) // 100)
+        self.assertEqual(signals['label'].mode, 'a')
+
+
+class TestFileFingerprint(unittest.TestCase):
+
+    def test_change_detection(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/data.csv'
+            with open(path, 'wb') as fd:
+                fd.write(b'a,b\n1,2\n')
+
+            fingerprint = FileFingerprint(path)
+            self.assertEqual(fingerprint.digest, FileFingerprint.hash_file(path, buffer_size=3))
+
+            # Same stat: the file isn't read at all
+            with mock.patch.object(FileFingerprint, 'hash_file', side_effect=AssertionError):
+                self.assertFalse(fingerprint.has_changed())
+
+            # Touched but identical: the stat alone reports a change, the
+            # digest of the reloaded file (hashed while it is parsed) clears it
+            with open(path, 'wb') as fd:
+                fd.write(b'a,b\n1,2\n')
+            os.utime(path, ns=(0, 0))
+            with mock.patch.object(FileFingerprint, 'hash_file',
+                                   side_effect=AssertionError):
+                self.assertTrue(fingerprint.has_changed())
+
+            self.assertTrue(fingerprint.matches(FileFingerprint(path)))
+            self.assertEqual(fingerprint.stat[1], 0)
+            self.assertFalse(fingerprint.has_changed())
+
+            with open(path, 'wb') as fd:
+                fd.write(b'a,b\n1,3\n')
+            self.assertTrue(fingerprint.has_changed())
+            self.assertFalse(fingerprint.matches(FileFingerprint(path)))
+
+
+class TestAppendRows(unittest.TestCase):
+
+    @staticmethod
+    def rows(start, end):
+        return ''.join('{},{},{},{}\n'.format(t * 0.01, np.sin(t * 0.1), t // 1000, 'z' if t >= 3000 else 'abc'[t % 3])
+                       for t in range(start, end))
+
+    def test_append_rows(self):
+        from plugins.file_types.csv import CSV
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/log.csv'
+            with open(path, 'w') as fd:
+                fd.write('t,value,state,label\n' + self.rows(0, 2000))
+
+            data_set = CSV.load(path, 't')
+            data_set.build_pyramids(block_size=4)
+            signals = {signal.name: signal for signal in data_set.signals}
+            self.assertAlmostEqual(signals['value'].std, np.std(np.sin(np.arange(2000) * 0.1)))
+
+            with open(path, 'a') as fd:
+                fd.write(self.rows(2000, 4100) + '41.0,0.5')
+
+            # The line still being written is left for later
+            self.assertEqual(data_set.append_rows(), 2100)
+            self.assertEqual(data_set.append_rows(), 0)
+
+            with open(path, 'r+') as fd:
+                fd.truncate(len(fd.read()) - len('41.0,0.5'))
+
+            reloaded = CSV.load(path, 't')
+            reloaded.build_pyramids(block_size=4)
+            for signal in reloaded.signals:
+                appended = signals[signal.name]
+                np.testing.assert_array_equal(appended.samples, signal.samples)
+                self.assertEqual(appended.mode, signal.mode)
+
+                if signal.name != 'label':
+                    self.assertAlmostEqual(appended.med, signal.med)
+                    self.assertAlmostEqual(appended.std, signal.std)
+
+                if signal.name == 'value':
+                    np.testing.assert_allclose(appended.pyramid.level(1)[2], signal.pyramid.level(1)[2], atol=1e-6)
+
+            self.assertEqual(data_set.fingerprint.digest, reloaded.fingerprint.digest)
+
+            # Rewritten rather than appended to
+            with open(path, 'w') as fd:
+                fd.write('t,value,state,label\n' + self.rows(0, 10))
+
+            self.assertIsNone(data_set.append_rows())
+
+    def test_append_while_building_pyramid(self):
+        time_base = TimeBase(np.arange(1000) * 0.01)
+        signal = FloatTimeSeries(time_array=time_base, value_array=np.sin(np.arange(1000) * 0.1), signal_path='s/v')
+        build = SignalPyramid.build
+
+        def append_meanwhile(value_array, block_size):
+            # Rows appended by a refresh while the worker thread is building
+            time_base.extend(np.arange(1000, 1100) * 0.01)
+            signal.append_samples(np.zeros(100))
+            return build(value_array, block_size)
+
+        with mock.patch.object(SignalPyramid, 'build', side_effect=append_meanwhile):
+            self.assertIsNone(signal.build_pyramid(block_size=4))
+
+        self.assertIsNone(signal.pyramid)
+        self.assertEqual(signal.build_pyramid(block_size=4).length, 1100)
+
+    def test_extend_time_base(self):
+        time_base = TimeBase(np.arange(100) * 0.5)
+        time_base.extend(np.arange(100, 120) * 0.5)
+        self.assertTrue(time_base.is_uniform)
+        self.assertEqual(time_base.index_after_time(55.0), 110)
+
+        time_base.extend([60.0, 59.0])
+        self.assertFalse(time_base.is_uniform)
+        self.assertFalse(time_base.is_monotonic)
+        self.assertEqual(time_base.t_end, 60.0)
+        np.testing.assert_array_equal(time_base.array[-3:], [59.5, 60.0, 59.0])
+
+
 if __name__ == '__main__':
     unittest.main()
+
+
+class TestParseCache(unittest.TestCase):
+
+    def test_store_and_evict(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ParseCache(directory + '/cache', size_cap=3000)
+
+            # Storage options don't change the parsed values, so they don't change the key
+            key = cache.key(b'\x01' * 16, 'CSV', {'time_key': 't', 'chunk_rows': 100})
+            self.assertEqual(key, cache.key(b'\x01' * 16, 'CSV', {'time_key': 't'}))
+            self.assertNotEqual(key, cache.key(b'\x01' * 16, 'CSV', {'time_key': 'x'}))
+
+            columns = {'a': np.arange(100.0), 'b': np.array(['x', 'y'] * 50, dtype=object),
+                       'c': ChunkedArray.from_array(np.arange(100), chunk_size=16)}
+            self.assertTrue(cache.store(key, columns))
+
+            loaded = cache.load(key)
+            self.assertEqual(list(loaded), ['a', 'b', 'c'])
+            self.assertIsInstance(loaded['a'], np.memmap)
+            np.testing.assert_array_equal(loaded['b'], columns['b'].astype(str))
+            np.testing.assert_array_equal(loaded['c'], np.arange(100))
+
+            # Storing a second entry pushes the cache past its cap; the least recently used one goes
+            other = cache.key(b'\x02' * 16, 'CSV', {})
+            self.assertTrue(cache.store(other, {'a': np.arange(200.0)}))
+            self.assertIsNone(cache.load(key))
+            self.assertIsNotNone(cache.load(other))
+            self.assertFalse(cache.store(key, {'a': np.arange(1000.0)}))
+
+            cache.clear()
+            self.assertIsNone(cache.load(other))
+
+    def test_load_from_cache(self):
+        from plugins.file_types.csv import CSV
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/log.csv'
+            with open(path, 'w') as fd:
+                fd.write('t,value,label\n')
+                fd.write(''.join('{},{},{}\n'.format(t * 0.1, t % 7, 'ab'[t % 2]) for t in range(500)))
+
+            cache = ParseCache(directory + '/cache')
+            parsed = CSV.load(path, 't', parse_cache=cache)
+            self.assertEqual(len(cache.entries()), 1)
+
+            # Looked up by the file's stat, so a later load finds it before the file is hashed
+            key = cache.key(parsed.fingerprint.digest, 'CSV', {'time_key': 't'})
+            self.assertEqual(cache.resolve(cache.alias(path, parsed.fingerprint.stat, 'CSV', {'time_key': 't'})), key)
+
+            # The second load maps the columns the first one stored, without parsing the file
+            with mock.patch('pandas.read_csv', wraps=pandas.read_csv) as read_csv:
+                cached = CSV.load(path, 't', parse_cache=cache)
+                self.assertEqual(read_csv.call_count, 1)  # Header only
+
+            self.assertIs(cached.parse_cache, cache)
+            self.assertNotIn('parse_cache', cached.load_options)
+            for signal in parsed.signals:
+                np.testing.assert_array_equal(signal.samples, cached.get_signal(signal.name).samples)
+
+            np.testing.assert_array_equal(parsed.time_bases[0].array, cached.time_bases[0].array)
+
+
+class TestLazyColumns(unittest.TestCase):
+
+    def test_load_when_used(self):
+        from plugins.file_types.csv import CSV
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/log.csv'
+            with open(path, 'w') as fd:
+                fd.write('t,value,speed [kph],label\n')
+                fd.write(''.join('{},{},{},{}\n'.format(t * 0.1, t % 7, t * 0.5, 'ab'[t % 2]) for t in range(300)))
+
+            eager = CSV.load(path, 't')
+            cache = ParseCache(directory + '/cache')
+            data_set = CSV.load(path, 't', lazy_columns=True, parse_cache=cache)
+
+            placeholder = data_set.signal_index['value']
+            self.assertFalse(placeholder.is_loaded)
+            self.assertEqual(placeholder.get_property_strings(['Min', 'Units']), ['', ''])
+            self.assertEqual(data_set.signal_index['speed'].units, 'kph')
+            self.assertEqual(data_set.time_bases[0].length, 300)
+
+            # Only the column that is used is parsed, and it replaces its placeholder
+            with mock.patch('pandas.read_csv', wraps=pandas.read_csv) as read_csv:
+                value = data_set.get_signal('value')
+                self.assertEqual(read_csv.call_args.kwargs['usecols'], ['value'])
+
+            self.assertTrue(value.is_loaded)
+            self.assertIs(data_set.signal_dict['value'], value)
+            self.assertIs(placeholder.load(), value)
+            np.testing.assert_array_equal(value.samples, eager.get_signal('value').samples)
+            np.testing.assert_array_equal(placeholder.samples, value.samples)
+
+            self.assertEqual(data_set.get_signal('label').categories.tolist(), ['a', 'b'])
+            self.assertEqual(data_set.signal_index['speed'].path, 'log/speed [kph]')
+
+            # The cache holds the columns read so far, and a later load parses the others only
+            self.assertEqual(sorted(cache.load(cache.key(data_set.fingerprint.digest, 'CSV', {'time_key': 't'}))),
+                             ['label', 't', 'value'])
+
+            with mock.patch('pandas.read_csv', wraps=pandas.read_csv) as read_csv:
+                cached = CSV.load(path, 't', parse_cache=cache)
+                self.assertEqual(read_csv.call_args.kwargs['usecols'], ['speed [kph]'])
+
+            np.testing.assert_array_equal(cached.get_signal('speed').samples, eager.get_signal('speed').samples)
+
+    def test_append_rows(self):
+        from plugins.file_types.csv import CSV
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/log.csv'
+            with open(path, 'w') as fd:
+                fd.write('t,value\n' + ''.join('{},{}\n'.format(t * 0.1, t) for t in range(100)))
+
+            data_set = CSV.load(path, 't', lazy_columns=True)
+            data_set.fingerprint.wait()
+            with open(path, 'a') as fd:
+                fd.write(''.join('{},{}\n'.format(t * 0.1, t) for t in range(100, 150)) + '15.0,1')
+
+            # Unloaded columns skip the appended rows and read them with the rest later, up to the time base length
+            self.assertEqual(data_set.append_rows(), 50)
+            np.testing.assert_array_equal(data_set.get_signal('value').samples, np.arange(150))
+
+    def test_load_together(self):
+        from plugins.file_types.csv import CSV
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/log.csv'
+            with open(path, 'w') as fd:
+                fd.write('t,a,b,c\n' + ''.join('{},{},{},{}\n'.format(t * 0.1, t, -t, t * 2) for t in range(100)))
+
+            data_set = CSV.load(path, 't', lazy_columns=True)
+            data_set.fingerprint.wait()
+
+            # Columns loaded together are read in one pass
+            with mock.patch('pandas.read_csv', wraps=pandas.read_csv) as read_csv:
+                data_set.load_columns(['a', 'b'])
+                self.assertEqual(read_csv.call_count, 1)
+                self.assertEqual(read_csv.call_args.kwargs['usecols'], ['a', 'b'])
+
+            np.testing.assert_array_equal(data_set.get_signal('b').samples, -np.arange(100))
+
+            # A file rewritten since it was loaded no longer matches the time base, so its columns are not read
+            with open(path, 'w') as fd:
+                fd.write('t,a,b,c\n' + ''.join('{},{},{},{}\n'.format(t * 0.2, t, t, t) for t in range(50)))
+
+            with self.assertRaises(ValueError):
+                data_set.get_signal('c')
+
+            self.assertFalse(data_set.signal_index['c'].is_loaded)
+
+    def test_pyramids_of_columns_loaded_later(self):
+        from plugins.file_types.csv import CSV
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/log.csv'
+            with open(path, 'w') as fd:
+                fd.write('t,value,other\n' + ''.join(
+                    '{},{},{}\n'.format(t * 0.1, np.sin(t * 0.1), t * 0.5)
+                    for t in range(1000)))
+
+            # 'value' is loaded before the pyramids are built and saved,
+            # 'other' after: it gets one as it is loaded
+            first = CSV.load(path, 't', lazy_columns=True)
+            first.get_signal('value')
+            first.build_pyramids(block_size=4)
+            self.assertIsNotNone(first.get_signal('other').pyramid)
+
+            second = CSV.load(path, 't', lazy_columns=True)
+            self.assertTrue(second.load_pyramids())
+
+            with mock.patch.object(FloatTimeSeries, 'build_pyramid',
+                                   side_effect=AssertionError):
+                second.build_pyramids(block_size=4)
+                value = second.get_signal('value')
+
+            np.testing.assert_array_equal(
+                value.pyramid.level(0)[0],
+                first.get_signal('value').pyramid.level(0)[0])
+
+            # Loaded before the saved file is read: not all signals covered
+            third = CSV.load(path, 't', lazy_columns=True)
+            third.get_signal('other')
+            self.assertFalse(third.load_pyramids())
+
+class TestRefreshDiff(unittest.TestCase):
+
+    @staticmethod
+    def write(path, factor, period=0.1):
+        with open(path, 'w') as fd:
+            fd.write('t,a,b,label\n')
+            fd.write(''.join('{},{},{},{}\n'.format(t * period, t % 7, t * factor, 'ab'[t % 2]) for t in range(200)))
+
+        # Rewritten within the same clock tick, the file must still look modified
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9 * factor))
+
+    def test_take_over_unchanged(self):
+        from plugins.file_types.csv import CSV
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/log.csv'
+            self.write(path, 2)
+
+            data_set = CSV.load(path, 't')
+            data_set.fingerprint.wait()
+            data_set.add_filter('a', 'mean', 3)
+            a, label, a_mean = (data_set.get_signal(name) for name in ('a', 'label', 'a_mean3'))
+            statistics = a.statistics
+
+            self.write(path, 3)
+            refreshed = data_set.refresh(take_over=True)
+
+            # Only b changed: everything else, filters included, is the same object with what it computed
+            self.assertIs(refreshed.get_signal('a'), a)
+            self.assertIs(refreshed.get_signal('label'), label)
+            self.assertIs(refreshed.get_signal('a_mean3'), a_mean)
+            self.assertIs(a.statistics, statistics)
+            self.assertIs(a.time_base, refreshed.time_bases[0])
+            self.assertEqual(a.path, 'log/a')
+            self.assertEqual(refreshed.changed_signals(data_set), [refreshed.get_signal('b')])
+            np.testing.assert_array_equal(refreshed.get_signal('b').samples, np.arange(200) * 3)
+
+            # New time stamps change every signal
+            self.write(path, 4, period=0.2)
+            again = refreshed.refresh(take_over=True)
+            self.assertEqual(len(again.changed_signals(refreshed)), 4)
+            self.assertIsNot(again.get_signal('a'), a)
+
+            # Touched only: reloaded, found identical, kept
+            os.utime(path, ns=(0, 0))
+            self.assertIs(again.refresh(take_over=True), again)
+            self.assertFalse(again.fingerprint.has_changed())
+
+    def test_lazy_columns(self):
+        from plugins.file_types.csv import CSV
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = directory + '/log.csv'
+            self.write(path, 2)
+
+            data_set = CSV.load(path, 't', lazy_columns=True)
+            data_set.fingerprint.wait()
+            a = data_set.get_signal('a')
+
+            # Columns nobody loaded are neither compared nor reported
+            self.write(path, 3)
+            refreshed = data_set.refresh(take_over=True)
+            self.assertIs(refreshed.get_signal('a'), a)
+            self.assertFalse(refreshed.signal_index['b'].is_loaded)
+            self.assertEqual(refreshed.changed_signals(data_set), [])
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+
+    # Small least-recently-used mapping. Lookups move the entry to the back,
+    # inserts past max_size drop the front. With max_nbytes, entries are also
+    # dropped from the front until the values (sized by size_of(value)) fit
+    # in it, and a value larger than max_nbytes on its own is not kept.
+
+    def __init__(self, max_size=8, max_nbytes=None, size_of=None):
+        self._max_size = max_size
+        self._max_nbytes = max_nbytes
+        self._size_of = size_of
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._total_nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def nbytes(self):
+        return self._total_nbytes
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            return default
+
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, value):
+        self.pop(key)
+
+        size = self._size_of(value) if self._max_nbytes is not None else 0
+        if self._max_nbytes is not None and size > self._max_nbytes:
+            return
+
+        self._entries[key] = value
+        self._sizes[key] = size
+        self._total_nbytes += size
+
+        while len(self._entries) > self._max_size or (
+                self._max_nbytes is not None and
+                self._total_nbytes > self._max_nbytes):
+            self.pop(next(iter(self._entries)))
+
+    def pop(self, key, default=None):
+        self._total_nbytes -= self._sizes.pop(key, 0)
+        return self._entries.pop(key, default)
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self._total_nbytes = 0
@@ -3,7 +3,8 @@ import copy
 from itertools import cycle
 import numpy as np
 
-from data_flow.signals import Signal
+from data_flow.decimation import Decimation
+from data_flow.signals import Signal, AbstractInterpolatedSignal
 from plugins.abstract_content_widget import AbstractContentWidget
 from settings.colors import colors_matlab_ints
 
@@ -68,6 +69,17 @@ class AbstractAnimation(AbstractContentWidget):
     def time_span(self):
         return self.time_end - self.time_start
 
+    def get_plot_data(self, signal: AbstractInterpolatedSignal, time_start=None, time_end=None,
+                      method=Decimation.MIN_MAX):
+        # Reduce the signal to what fits across the widget, so redraws cost the same however long the log is
+        return signal.decimate(time_start, time_end, pixel_count=max(self.width(), 1), method=method)
+
+    def get_cursor_values(self, time_s):
+        # Values of this widget's signals at time_s. All widgets share the playback manager's cursor, which evaluates
+        # every displayed signal in one pass per time step.
+        values = self._controller.playback_manager.cursor.values_at(time_s)
+        return {path: values.get(path) for path in self._animated_signals}
+
     def set_time_s(self, *args, **kwargs):
         # TODO Might want to replace this with something more native (Look into QAnimation API?)
         raise NotImplementedError
@@ -142,7 +154,10 @@ class AbstractAnimation(AbstractContentWidget):
     def add_signal(self, signal: Signal, update_data_store=True):
         # Update the the graphics
         self._animated_signals[signal.path] = signal
-        self._requested_signal_patterns.append(signal.path)
+
+        # Signals matched again after a reload are already requested
+        if signal.path not in self._requested_signal_patterns:
+            self._requested_signal_patterns.append(signal.path)
 
         if update_data_store:
             self._controller.data_store.set_listener_signal_patterns(self._requested_signal_patterns, self)